@@ -0,0 +1,81 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import shutil
+import tempfile
+import timeit
+from contextlib import contextmanager
+
+from pygit2 import init_repository, GIT_FILEMODE_BLOB, GIT_FILEMODE_TREE
+
+
+@contextmanager
+def scratch_repository(bare=True):
+    """
+    Yields a fresh `pygit2.Repository` living in a temporary directory which
+    is removed on exit.
+    """
+
+    path = tempfile.mkdtemp(prefix="gitfs-bench-")
+    try:
+        yield init_repository(path, bare=bare)
+    finally:
+        shutil.rmtree(path)
+
+
+def build_tree(repo, width, depth, blob=None):
+    """
+    Writes a synthetic tree with <width> files and one `dir` subdirectory on
+    every level, <depth> levels deep. All the files share the same blob.
+
+    :returns: the oid of the root tree
+    """
+
+    blob = blob or repo.create_blob(b"gitfs benchmark\n")
+
+    subtree = None
+    for level in range(depth):
+        builder = repo.TreeBuilder()
+        for index in range(width):
+            builder.insert("file-{}".format(index), blob, GIT_FILEMODE_BLOB)
+        if subtree is not None:
+            builder.insert("dir", subtree, GIT_FILEMODE_TREE)
+        subtree = builder.write()
+
+    return subtree
+
+
+def deep_path(width, depth):
+    """
+    Returns the path of the last file from the deepest level of a tree built
+    with `build_tree`.
+    """
+
+    return "/" + "dir/" * (depth - 1) + "file-{}".format(width - 1)
+
+
+def measure(func, number=1000, repeat=5):
+    """
+    Returns the best time per call, in microseconds.
+    """
+
+    timings = timeit.repeat(func, number=number, repeat=repeat)
+    return min(timings) / number * 1e6
+
+
+def report(header, rows):
+    print(" | ".join("{:>14}".format(column) for column in header))
+    for row in rows:
+        print(" | ".join("{:>14}".format(column) for column in row))
@@ -0,0 +1,102 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Cost of refreshing the history cache after a single new commit, as the
+history gets deeper. The incremental update only walks the new commit, so
+`+ update` (a commit followed by an update) should stay close to `commit`,
+while a full rebuild grows with the history. The memory kept by the index
+is reported per commit.
+
+    python -m benchmarks.commit_cache
+"""
+
+import time
+import tracemalloc
+
+from pygit2 import Signature
+
+from gitfs.cache import CommitCache
+
+from benchmarks import scratch_repository, measure, report
+
+
+DEPTHS = [100, 1000, 10000, 50000]
+
+
+class History(object):
+    """
+    A linear history on `master`, with one commit every ten minutes.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.tree = repo.TreeBuilder().write()
+        self.timestamp = int(time.time()) - 10 * 365 * 24 * 3600
+        self.head = None
+        self.depth = 0
+
+    def extend(self, count=1):
+        for _ in range(count):
+            signature = Signature("gitfs", "gitfs@example.com", self.timestamp, 0)
+            parents = [self.head] if self.head is not None else []
+            self.head = self.repo.create_commit(
+                "refs/heads/master", signature, signature, "bench", self.tree, parents
+            )
+            self.timestamp += 600
+            self.depth += 1
+
+
+def main():
+    rows = []
+    with scratch_repository() as repo:
+        history = History(repo)
+
+        for depth in DEPTHS:
+            history.extend(depth - history.depth)
+
+            cache = CommitCache(repo)
+            cache.update()
+
+            def update():
+                history.extend()
+                cache.update()
+
+            def rebuild():
+                CommitCache(repo).update()
+
+            tracemalloc.start()
+            kept = CommitCache(repo)
+            kept.update()
+            memory = tracemalloc.get_traced_memory()[0] / float(len(kept))
+            tracemalloc.stop()
+
+            rows.append(
+                (
+                    depth,
+                    "%.1f" % measure(history.extend, number=20, repeat=3),
+                    "%.1f" % measure(update, number=20, repeat=3),
+                    "%.1f" % measure(rebuild, number=1, repeat=3),
+                    "%.0f" % memory,
+                )
+            )
+
+    report(
+        ("depth", "commit (us)", "+ update (us)", "rebuild (us)", "bytes/commit"), rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Cost of finding the commits on which a local and a remote branch diverged,
+with the same number of commits on each side of their merge base. `cold`
+computes the divergence from scratch, `cached` asks again for the same pair
+of heads, as every sync does until one of the branches moves.
+
+    python -m benchmarks.diverge
+"""
+
+import time
+
+from pygit2 import Signature
+
+from gitfs.repository import Repository
+
+from benchmarks import scratch_repository, measure, report
+
+
+SIDES = [100, 1000, 5000, 20000]
+BASE_DEPTH = 1000
+
+
+def extend(repo, tree, head, count, timestamp, message="bench"):
+    for index in range(count):
+        signature = Signature("gitfs", "gitfs@example.com", timestamp + index, 0)
+        head = repo.create_commit(
+            None, signature, signature, message, tree, [head] if head else []
+        )
+    return head
+
+
+def main():
+    rows = []
+    with scratch_repository() as pygit2_repo:
+        tree = pygit2_repo.TreeBuilder().write()
+        timestamp = int(time.time()) - 10 * 365 * 24 * 3600
+        base = extend(pygit2_repo, tree, None, BASE_DEPTH, timestamp)
+
+        for side in SIDES:
+            timestamp += BASE_DEPTH
+            local = extend(pygit2_repo, tree, base, side, timestamp, "local")
+            remote = extend(pygit2_repo, tree, base, side, timestamp, "remote")
+            pygit2_repo.create_branch("local", pygit2_repo[local], True)
+            pygit2_repo.create_branch("remote", pygit2_repo[remote], True)
+
+            repo = Repository(pygit2_repo)
+            first = repo.branches.local.get("local")
+            second = repo.branches.local.get("remote")
+
+            def cold():
+                repo.diverges.clear()
+                repo.find_diverge_commits(first, second)
+
+            diverge_commits = repo.find_diverge_commits(first, second)
+            assert len(diverge_commits.first_commits) == side
+            assert len(diverge_commits.second_commits) == side
+
+            rows.append(
+                (
+                    side,
+                    "%.1f" % measure(cold, number=1, repeat=3),
+                    "%.1f" % measure(lambda: repo.find_diverge_commits(first, second)),
+                )
+            )
+
+    report(("commits/side", "cold (us)", "cached (us)"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Cost of `ls -l` on a directory of a commit: listing it, then one getattr per
+entry. `names` lists bare names, so each getattr resolves its path on a cold
+cache. `attrs` lists the entries together with their attributes, which
+leaves the getattr calls with cache hits.
+
+    python -m benchmarks.listing
+"""
+
+from pygit2 import Signature
+
+from gitfs.repository import Repository
+
+from benchmarks import scratch_repository, build_tree, measure, report
+
+
+WIDTHS = [100, 1000, 3000]
+
+
+def main():
+    rows = []
+    signature = Signature("gitfs", "gitfs@example.com")
+    with scratch_repository() as pygit2_repo:
+        for width in WIDTHS:
+            tree = build_tree(pygit2_repo, width, 1)
+            oid = pygit2_repo.create_commit(None, signature, signature, "m", tree, [])
+            commit = pygit2_repo[oid]
+
+            repo = Repository(pygit2_repo)
+
+            def names():
+                repo.entries.clear()
+                repo.stats.clear()
+                for name in [entry.name for entry in commit.tree]:
+                    repo.get_commit_stats(commit, "/" + name)
+
+            def attrs():
+                repo.entries.clear()
+                repo.stats.clear()
+                for name, _ in repo.list_commit_stats(commit, commit.tree, "/"):
+                    repo.get_commit_stats(commit, "/" + name)
+
+            rows.append(
+                (
+                    width,
+                    "%.1f" % (measure(names, number=1, repeat=3) / 1000),
+                    "%.1f" % (measure(attrs, number=1, repeat=3) / 1000),
+                )
+            )
+
+    report(("entries", "names (ms)", "attrs (ms)"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Per-operation cost of routing a path to its view, on the routes from
+`prepare_routes`, with the paths spread over many history commits. `loop`
+is the former `Router.get_view`, which searched the routes one by one and
+substituted the match away, `dispatch` is the current one. `hot` routes
+paths whose views are cached, `cold` routes every path once, starting
+with an empty cache.
+
+    python -m benchmarks.routing
+"""
+
+import re
+from datetime import datetime
+
+from gitfs.cache import lru_cache
+from gitfs.log import log
+from gitfs.router import Router
+from gitfs.routes import prepare_routes
+
+from benchmarks import measure, report
+
+
+COMMITS = [100, 10000]
+FILES = ["/", "/file", "/dir/dir/file"]
+CACHE_SIZE = 800
+
+
+class Args(object):
+    current_path = "current"
+    history_path = "history"
+
+
+class View(object):
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+class LegacyRouter(Router):
+    def get_view(self, path):
+        for route in self.routes:
+            result = re.search(route["regex"], path)
+            if result is None:
+                continue
+
+            groups = result.groups()
+            relative_path = re.sub(route["regex"], "", path)
+            relative_path = "/" if not relative_path else relative_path
+
+            cache_key = result.group(0)
+            log.debug("Router: Cache key for %s: %s", path, cache_key)
+
+            view = lru_cache.get_if_exists(cache_key)
+            if view is not None:
+                log.debug("Router: Serving %s from cache", path)
+                return view, relative_path
+
+            kwargs = result.groupdict()
+
+            # TODO: move all this to a nice config variable
+            kwargs["repo"] = self.repo
+            kwargs["ignore"] = self.repo.ignore
+            kwargs["repo_path"] = self.repo_path
+            kwargs["mount_path"] = self.mount_path
+            kwargs["regex"] = route["regex"]
+            kwargs["relative_path"] = relative_path
+            kwargs["current_path"] = self.current_path
+            kwargs["history_path"] = self.history_path
+            kwargs["uid"] = self.uid
+            kwargs["gid"] = self.gid
+            kwargs["branch"] = self.branch
+            kwargs["mount_time"] = self.mount_time
+            kwargs["queue"] = self.commit_queue
+            kwargs["max_size"] = self.max_size
+            kwargs["max_offset"] = self.max_offset
+
+            args = set(groups) - set(kwargs.values())
+            view = route["view"](*args, **kwargs)
+
+            lru_cache[cache_key] = view
+            log.debug("Router: Added %s to cache", path)
+
+            return view, relative_path
+
+        raise ValueError("Found no view for '{}'".format(path))
+
+
+def get_router(cls):
+    router = cls.__new__(cls)
+    for name in [
+        "repo",
+        "repo_path",
+        "mount_path",
+        "current_path",
+        "history_path",
+        "uid",
+        "gid",
+        "branch",
+        "mount_time",
+        "commit_queue",
+        "max_size",
+        "max_offset",
+    ]:
+        setattr(router, name, None)
+    router.repo = View()
+    router.repo.ignore = None
+    router.routes = []
+    router.register([(regex, View) for regex, _ in prepare_routes(Args)])
+    return router
+
+
+def get_paths(commits):
+    paths = ["/current" + name for name in FILES]
+    for index in range(commits):
+        commit_time = datetime.fromtimestamp(1411135000 + index * 3600)
+        commit = "/history/{}/{}-{:010x}".format(
+            commit_time.strftime("%Y-%m-%d"), commit_time.strftime("%H-%M-%S"), index
+        )
+        paths.extend(commit + name for name in FILES)
+    return paths
+
+
+def route_all(router, paths):
+    def run():
+        for path in paths:
+            router.get_view(path)
+
+    return run
+
+
+def main():
+    lru_cache.maxsize = CACHE_SIZE
+
+    rows = []
+    for commits in COMMITS:
+        paths = get_paths(commits)
+        hot = paths[-CACHE_SIZE // 2 :]
+
+        row = [commits]
+        for cls in (LegacyRouter, Router):
+            router = get_router(cls)
+
+            lru_cache.clear()
+            row.append("%.2f" % (measure(route_all(router, hot), 100, 5) / len(hot)))
+
+            def cold():
+                lru_cache.clear()
+                route_all(router, paths)()
+
+            row.append("%.2f" % (measure(cold, 1, 3) / len(paths)))
+        rows.append(row)
+
+    report(
+        (
+            "commits",
+            "loop hot (us)",
+            "loop cold (us)",
+            "dispatch hot",
+            "dispatch cold",
+        ),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
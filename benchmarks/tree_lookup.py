@@ -0,0 +1,72 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Cost of resolving a path inside a commit tree as the tree grows wider and
+deeper. The lookup only visits the trees named by the path, so once those
+trees are parsed (`cold`: the path itself was never resolved) the cost stays
+flat as the number of entries grows. `first` includes parsing the trees on
+the path, which only depends on their own width.
+
+    python -m benchmarks.tree_lookup
+"""
+
+from gitfs.repository import Repository
+
+from benchmarks import scratch_repository, build_tree, deep_path, measure, report
+
+
+SHAPES = [(10, 8), (100, 8), (1000, 8), (10000, 8), (1000, 32)]
+
+
+def main():
+    rows = []
+    with scratch_repository() as pygit2_repo:
+        for width, depth in SHAPES:
+            tree = pygit2_repo[build_tree(pygit2_repo, width, depth)]
+            path = deep_path(width, depth)
+
+            repo = Repository(pygit2_repo)
+
+            def first():
+                repo.trees.clear()
+                return cold()
+
+            def cold():
+                repo.entries.clear()
+                return repo.get_git_entry(tree, path)
+
+            def cached():
+                return repo.get_git_entry(tree, path)
+
+            assert first() is not None
+            rows.append(
+                (
+                    width,
+                    depth,
+                    width * depth,
+                    "%.1f" % measure(first, number=10),
+                    "%.1f" % measure(cold, number=200),
+                    "%.1f" % measure(cached),
+                )
+            )
+
+    report(
+        ("width", "depth", "entries", "first (us)", "cold (us)", "cached (us)"), rows
+    )
+
+
+if __name__ == "__main__":
+    main()
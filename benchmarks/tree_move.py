@@ -0,0 +1,143 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Cost of staging the rename and the removal of a directory with many files,
+up to the written tree. `per file` walks the directory and changes the index
+one path at a time, `tree` moves or drops the directory's tree entry and
+reads the new tree back into the index.
+
+    python -m benchmarks.tree_move
+"""
+
+import os
+import timeit
+
+from pygit2 import Signature
+
+from gitfs.repository import Repository
+
+from benchmarks import scratch_repository, report
+
+
+SIZES = [10000, 50000]
+FILES_PER_DIRECTORY = 1000
+
+
+def populate(workdir, count):
+    for index in range(count):
+        directory = os.path.join(
+            workdir, "big", "dir-{}".format(index // FILES_PER_DIRECTORY)
+        )
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(os.path.join(directory, "file-{}".format(index)), "w") as output:
+            output.write("gitfs benchmark {}\n".format(index))
+
+
+def timed(run, setup=None, teardown=None, repeat=3):
+    """
+    Returns the best time of <run>, in milliseconds.
+    """
+
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = timeit.default_timer()
+        run()
+        elapsed = timeit.default_timer() - start
+        if teardown is not None:
+            teardown()
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best * 1e3
+
+
+def main():
+    rows = []
+    for size in SIZES:
+        with scratch_repository(bare=False) as pygit2_repo:
+            workdir = pygit2_repo.workdir
+            populate(workdir, size)
+
+            index = pygit2_repo.index
+            index.add_all()
+            index.write()
+            signature = Signature("gitfs", "gitfs@example.com")
+            tree = pygit2_repo[index.write_tree()]
+            pygit2_repo.create_commit(
+                "HEAD", signature, signature, "bench", tree.id, []
+            )
+
+            repo = Repository(pygit2_repo)
+            big, moved = os.path.join(workdir, "big"), os.path.join(workdir, "moved")
+
+            def rename():
+                os.rename(big, moved)
+
+            def restore():
+                if os.path.isdir(moved):
+                    os.rename(moved, big)
+                index.read_tree(tree)
+
+            def rename_per_file():
+                for dirpath, _, files in os.walk(moved):
+                    relative = os.path.relpath(dirpath, workdir)
+                    for filename in files:
+                        path = "{}/{}".format(relative, filename)
+                        index.remove("big" + path[len("moved") :])
+                        index.add(path)
+                index.write_tree()
+
+            def rename_tree():
+                repo.dirty_paths.move("big", "moved")
+                repo.stage()
+                index.write_tree()
+
+            def remove_per_file():
+                for dirpath, _, files in os.walk(big):
+                    relative = os.path.relpath(dirpath, workdir)
+                    for filename in files:
+                        index.remove("{}/{}".format(relative, filename))
+                index.write_tree()
+
+            def remove_tree():
+                repo.dirty_paths.move("big")
+                repo.stage()
+                index.write_tree()
+
+            rows.append(
+                (
+                    size,
+                    "rename",
+                    "%.1f" % timed(rename_per_file, rename, restore),
+                    "%.1f" % timed(rename_tree, rename, restore),
+                )
+            )
+            rows.append(
+                (
+                    size,
+                    "remove",
+                    "%.1f" % timed(remove_per_file, teardown=restore),
+                    "%.1f" % timed(remove_tree, teardown=restore),
+                )
+            )
+
+    report(("files", "operation", "per file (ms)", "tree (ms)"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Latency of a write operation while the sync worker keeps pushing to a slow
+remote. The remote is a local bare repository and every push is delayed by
+`PUSH_DELAY` seconds, standing in for a slow network. The worker commits
+and syncs again every `SYNC_INTERVAL` seconds. `whole sync` blocks the
+writes for the entire sync, as they used to be, `merge only` blocks them
+only while merging.
+
+    python -m benchmarks.write_latency
+"""
+
+import os
+import threading
+import time
+import timeit
+
+from pygit2 import Signature
+
+from gitfs.events import shutting_down
+from gitfs.repository import Repository
+from gitfs.utils.decorators.write_operation import write_operation
+from gitfs.worker import CommitQueue, SyncWorker
+
+from benchmarks import scratch_repository, report
+
+
+PUSH_DELAY = 0.5
+DURATION = 5
+WRITE_INTERVAL = 0.01
+SYNC_INTERVAL = 0.1
+
+
+class SlowRepository(Repository):
+    def push(self, *args, **kwargs):
+        time.sleep(PUSH_DELAY)
+        return super(SlowRepository, self).push(*args, **kwargs)
+
+
+def prepare(repo, remote):
+    signature = Signature("gitfs", "gitfs@example.com")
+
+    tree = repo.TreeBuilder().write()
+    repo.create_commit("HEAD", signature, signature, "init", tree, [])
+    repo.remotes.create("origin", remote.path)
+    repo.remotes["origin"].push(["refs/heads/master"])
+
+    return SlowRepository(repo), signature
+
+
+def percentile(timings, fraction):
+    return sorted(timings)[int(len(timings) * fraction)] * 1e3
+
+
+def run(local, remote, whole_sync):
+    repo, signature = prepare(local, remote)
+    worker = SyncWorker(
+        "gitfs",
+        "gitfs@example.com",
+        "gitfs",
+        "gitfs@example.com",
+        repository=repo,
+        upstream="origin",
+        branch="master",
+        credentials=None,
+        repo_path=repo.workdir,
+        commit_queue=CommitQueue(),
+    )
+    done = threading.Event()
+
+    def sync():
+        count = 0
+        while not done.is_set():
+            tree = repo.TreeBuilder(repo.head.peel().tree)
+            tree.insert("sync-%d" % count, repo.create_blob(b"sync"), 0o100644)
+            repo.create_commit(
+                "HEAD", signature, signature, "sync", tree.write(), [repo.head.target]
+            )
+            count += 1
+
+            if whole_sync:
+                with worker.merging():
+                    worker.sync()
+            else:
+                worker.sync()
+            time.sleep(SYNC_INTERVAL)
+
+    path = os.path.join(repo.workdir, "file")
+
+    @write_operation
+    def write():
+        with open(path, "ab") as output:
+            output.write(b"x" * 4096)
+
+    syncer = threading.Thread(target=sync)
+    syncer.start()
+
+    timings = []
+    deadline = time.time() + DURATION
+    while time.time() < deadline:
+        start = timeit.default_timer()
+        write()
+        timings.append(timeit.default_timer() - start)
+        time.sleep(WRITE_INTERVAL)
+
+    done.set()
+    syncer.join()
+
+    return timings
+
+
+def main():
+    rows = []
+    for name, whole_sync in (("whole sync", True), ("merge only", False)):
+        with scratch_repository() as remote:
+            with scratch_repository(bare=False) as local:
+                timings = run(local, remote, whole_sync)
+        rows.append(
+            (
+                name,
+                len(timings),
+                "%.2f" % percentile(timings, 0.5),
+                "%.2f" % percentile(timings, 0.99),
+                "%.2f" % (max(timings) * 1e3),
+            )
+        )
+
+    shutting_down.set()
+    report(("mode", "writes", "p50 (ms)", "p99 (ms)", "max (ms)"), rows)
+
+
+if __name__ == "__main__":
+    main()
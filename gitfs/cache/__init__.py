@@ -16,6 +16,7 @@
 from .lru import LRUCache
 from .commits import CommitCache
 from .gitignore import CachedIgnore
+from .blobs import BlobCache, BlobStream
 
 
 lru_cache = LRUCache(0)
@@ -15,6 +15,9 @@
 import collections
 
 
+CacheInfo = collections.namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+
 class Cache(collections.MutableMapping):
     """Mutable mapping to serve as a simple cache or cache base class.
 
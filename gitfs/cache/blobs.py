@@ -0,0 +1,188 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import tempfile
+from threading import Event, Lock
+
+from .lru import LRUCache
+
+
+WINDOW_SIZE = 8 * 1024 * 1024
+
+
+class Pending(object):
+    __slots__ = ["event", "data"]
+
+    def __init__(self):
+        self.event = Event()
+        self.data = None
+
+
+class BlobCache(object):
+    """
+    Keeps the content of recently read blobs as `memoryview` objects, keyed
+    by the blob oid and bounded by their total size in bytes. Slicing a view
+    doesn't copy the underlying data.
+
+    Readers asking for a blob that is already being loaded wait for that
+    load instead of inflating the blob again.
+    """
+
+    def __init__(self, maxsize):
+        self.blobs = LRUCache(maxsize, getsizeof=len)
+        self.pending = {}
+        self.lock = Lock()
+
+    def get(self, oid, load):
+        """
+        Returns a `memoryview` over the content of the blob <oid>.
+
+        :param oid: the oid of the blob
+        :param load: a function which receives the oid and returns an object
+            supporting the buffer protocol (e.g. a `pygit2.Blob`)
+        :rtype: memoryview
+        """
+
+        with self.lock:
+            data = self.blobs.get_if_exists(oid)
+            if data is not None:
+                return data
+
+            pending = self.pending.get(oid)
+            loading = pending is None
+            if loading:
+                pending = self.pending[oid] = Pending()
+
+        if not loading:
+            pending.event.wait()
+            if pending.data is not None:
+                return pending.data
+            return memoryview(load(oid))
+
+        try:
+            data = pending.data = memoryview(load(oid))
+            if len(data) <= self.blobs.maxsize:
+                self.blobs[oid] = data
+        finally:
+            with self.lock:
+                del self.pending[oid]
+            pending.event.set()
+
+        return data
+
+    def cache_info(self):
+        return self.blobs.cache_info()
+
+
+class BlobStream(object):
+    """
+    Serves reads from a large blob without keeping all of it in memory. The
+    blob is inflated sequentially, chunk by chunk. While the reads move
+    forward, only a bounded window of the inflated data is kept around. The
+    first read behind that window marks the access pattern as random: the
+    blob is inflated again, this time into a spill file, and every later
+    read is served from there.
+    """
+
+    def __init__(self, chunks, size, window_size=WINDOW_SIZE, spill_dir=None):
+        """
+        :param chunks: a function returning a new iterator over the content
+            of the blob, as consecutive `bytes` chunks
+        :param size: the size of the blob
+        :param window_size: how many bytes are kept for sequential reads
+        :param spill_dir: the directory of the spill file (the system's
+            temporary directory by default)
+        """
+
+        self.chunks = chunks
+        self.size = size
+        self.window_size = window_size
+        self.spill_dir = spill_dir
+
+        self.lock = Lock()
+        self.spill = None
+
+        self.source = chunks()
+        self.position = 0
+        self.window = bytearray()
+        self.start = 0
+
+    @property
+    def sequential(self):
+        return self.spill is None
+
+    def read(self, size, offset):
+        with self.lock:
+            end = min(offset + size, self.size)
+            if offset >= end:
+                return b""
+
+            if self.spill is None and offset < self.start:
+                self._start_spilling()
+
+            if self.spill is not None:
+                self._spill_until(end)
+                self.spill.seek(offset)
+                return self.spill.read(end - offset)
+
+            self._inflate_until(end, offset)
+            return bytes(self.window[offset - self.start : end - self.start])
+
+    def _next_chunk(self):
+        chunk = next(self.source, None)
+        if chunk is None:
+            # the blob is shorter than announced, don't wait for more data
+            self.size = self.position
+
+        return chunk
+
+    def _inflate_until(self, end, keep_from):
+        while self.position < end:
+            chunk = self._next_chunk()
+            if chunk is None:
+                break
+
+            self.window += chunk
+            self.position += len(chunk)
+
+            # trim in bulk, so the window isn't shifted for every chunk
+            if len(self.window) > 2 * self.window_size:
+                drop = min(len(self.window) - self.window_size, keep_from - self.start)
+                if drop > 0:
+                    del self.window[:drop]
+                    self.start += drop
+
+    def _start_spilling(self):
+        self.spill = tempfile.TemporaryFile(dir=self.spill_dir)
+        self.window = None
+
+        self.source = self.chunks()
+        self.position = 0
+
+    def _spill_until(self, end):
+        if self.position >= end:
+            return
+
+        self.spill.seek(0, os.SEEK_END)
+        while self.position < end:
+            chunk = self._next_chunk()
+            if chunk is None:
+                break
+
+            self.spill.write(chunk)
+            self.position += len(chunk)
+
+        self.spill.flush()
@@ -13,62 +13,318 @@
 # limitations under the License.
 
 
-from datetime import datetime
-from bisect import insort_left
+import os
+import struct
+import time
+from array import array
+from binascii import Error as BinasciiError, hexlify, unhexlify
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
 
-from pygit2 import GIT_SORT_TIME
+from pygit2 import GIT_SORT_TIME, GitError, Oid
+
+from gitfs.log import log
+
+
+INDEX_MAGIC = b"gitfs-history-2\n"
+OID_SIZE = 20
+SHORT_OID_SIZE = 5
+TIMESTAMP_FORMAT = "<{}q"
+TIMESTAMP_SIZE = struct.calcsize(TIMESTAMP_FORMAT.format(1))
+try:
+    TIMESTAMP_TYPE = array("q").typecode
+except ValueError:
+    # there's no "q" before Python 3.3
+    TIMESTAMP_TYPE = "l"
 
 
 class CommitCache(object):
-    def __init__(self, repo):
+    def __init__(self, repo, path=None):
         self.repo = repo
-        self.__commits = {}
+        self.path = path
+        self.head = None
+        self.__index = CommitIndex()
 
     def update(self):
-        new_commits = {}
+        """
+        Brings the cache up to date with HEAD. Only the commits reachable
+        from the new HEAD which weren't reachable from the previous one are
+        added, and, when HEAD didn't move forward, the ones which are no
+        longer reachable are dropped.
+
+        On the first update, the index saved at `path` (if any) is used as
+        the starting point and the result is saved back.
+        """
+
         head = self.repo.lookup_reference("HEAD").resolve().target
+        if head == self.head:
+            return
+
+        first_update = self.head is None
+        if first_update:
+            self.load()
+        saved_head = self.head
+
+        if self.head is None:
+            self.__index = CommitIndex.build(self._walk(head))
+        elif head != self.head:
+            try:
+                added = self._walk(head, self.head)
+                removed = self._walk(self.head, head)
+                self.__index = self.__index.apply(added, removed)
+            except (KeyError, ValueError, GitError):
+                self.__index = CommitIndex.build(self._walk(head))
+
+        self.head = head
+
+        if first_update and head != saved_head:
+            self.save()
+
+    def load(self):
+        """
+        Loads the index saved at `path`, together with the HEAD it was built
+        from. A missing or unreadable index is ignored.
+        """
+
+        if not self.path or not os.path.exists(self.path):
+            return False
+
+        try:
+            with open(self.path, "rb") as index:
+                data = index.read()
+        except (IOError, OSError):
+            log.warning("CommitCache: Can't read the history index %s", self.path)
+            return False
+
+        header = len(INDEX_MAGIC) + OID_SIZE
+        count, extra = divmod(len(data) - header, TIMESTAMP_SIZE + OID_SIZE)
+        if not data.startswith(INDEX_MAGIC) or count < 0 or extra:
+            log.warning("CommitCache: Ignoring invalid history index %s", self.path)
+            return False
 
-        for commit in self.repo.walk(head, GIT_SORT_TIME):
-            commit_time = datetime.fromtimestamp(commit.commit_time)
+        split = header + count * TIMESTAMP_SIZE
+        timestamps = array(
+            TIMESTAMP_TYPE,
+            struct.unpack(TIMESTAMP_FORMAT.format(count), data[header:split]),
+        )
 
-            date = commit_time.date().strftime("%Y-%m-%d")
-            time = commit_time.time().strftime("%H-%M-%S")
+        self.__index = CommitIndex(timestamps, data[split:])
+        self.head = Oid(raw=data[len(INDEX_MAGIC) : header])
 
-            if date not in new_commits:
-                new_commits[date] = []
+        return True
 
-            insort_left(
-                new_commits[date], Commit(commit.commit_time, time, commit.hex[:10])
-            )
+    def save(self):
+        """
+        Saves the index at `path`, keyed by the HEAD it was built from. The
+        file is replaced atomically.
+        """
 
-        self.__commits = new_commits
+        if not self.path or self.head is None:
+            return False
 
-    def __getitem__(self, item):
-        return self.__commits[item]
+        index = self.__index
+        count = len(index.timestamps)
+        timestamps = struct.pack(TIMESTAMP_FORMAT.format(count), *index.timestamps)
 
-    def __setitem__(self, item, value):
-        self.__commits[item] = value
+        partial = "{}.partial".format(self.path)
+        try:
+            with open(partial, "wb") as output:
+                output.write(INDEX_MAGIC)
+                output.write(self.head.raw)
+                output.write(timestamps)
+                output.write(index.oids)
+            os.rename(partial, self.path)
+        except (IOError, OSError):
+            log.warning("CommitCache: Can't save the history index %s", self.path)
+            return False
 
-    def __delitem__(self, item):
-        del self.__commits[item]
+        return True
+
+    def _walk(self, include, exclude=None):
+        walker = self.repo.walk(include, GIT_SORT_TIME)
+        if exclude is not None:
+            walker.hide(exclude)
+
+        return ((commit.commit_time, commit.id.raw) for commit in walker)
+
+    def get_commits(self, date):
+        return self.__index.get_commits(date)
+
+    def get_timestamps(self, date):
+        return self.__index.get_timestamps(date)
+
+    def has_commit(self, date, name):
+        return self.__index.has_commit(date, name)
+
+    def __contains__(self, date):
+        return date in self.__index.dates
+
+    def __len__(self):
+        return len(self.__index.timestamps)
 
     def keys(self):
-        return self.__commits.keys()
+        return list(self.__index.names)
 
     def __iter__(self):
-        return iter(self.__commits)
+        return iter(self.__index.names)
+
+
+class CommitIndex(object):
+    """
+    Immutable, columnar index of the commits, sorted by their commit time.
+
+    The timestamps are kept in an `array` of 64 bit integers and the raw
+    oids are packed back to back in a single bytes object, so a commit costs
+    28 bytes. The commits of each date are a contiguous range, described by
+    the offset of their first commit in `starts` and looked up through
+    `dates`.
+
+    Date names are formatted once per day, when the index is built. Commit
+    names (`HH-MM-SS-<short sha1>`) are only formatted when listed.
+    """
+
+    __slots__ = ["timestamps", "oids", "starts", "names", "dates"]
+
+    def __init__(self, timestamps=None, oids=b"", starts=None, names=None):
+        self.timestamps = array(TIMESTAMP_TYPE) if timestamps is None else timestamps
+        self.oids = oids
+
+        if starts is None:
+            starts, names = array(TIMESTAMP_TYPE), []
+            _split_days(self.timestamps, starts, names, 0)
+
+        self.starts = starts
+        self.names = names
+        self.dates = dict((name, day) for day, name in enumerate(names))
+
+    @classmethod
+    def build(cls, commits):
+        """
+        Builds the index from (timestamp, raw oid) pairs.
+        """
+
+        commits = sorted(commits)
+        timestamps = array(TIMESTAMP_TYPE, (timestamp for timestamp, _ in commits))
+        return cls(timestamps, b"".join(oid for _, oid in commits))
+
+    def apply(self, added, removed):
+        """
+        Returns a new index with the given (timestamp, raw oid) pairs added
+        and removed. The untouched runs of commits are copied as slices and
+        only the days from the first changed position on are split again.
+        """
+
+        events = []
+        for timestamp, oid in removed:
+            position = self._find(timestamp, oid)
+            if position is not None:
+                events.append((position, 0, timestamp, oid))
+        for timestamp, oid in added:
+            events.append((self._position(timestamp, oid), 1, timestamp, oid))
+
+        if not events:
+            return self
+
+        events.sort()
+        timestamps, oids = array(TIMESTAMP_TYPE), []
+        cursor = 0
+
+        for position, insert, timestamp, oid in events:
+            if position > cursor:
+                timestamps.extend(self.timestamps[cursor:position])
+                oids.append(self.oids[cursor * OID_SIZE : position * OID_SIZE])
+                cursor = position
+            if insert:
+                timestamps.append(timestamp)
+                oids.append(oid)
+            else:
+                cursor = position + 1
+
+        timestamps.extend(self.timestamps[cursor:])
+        oids.append(self.oids[cursor * OID_SIZE :])
+
+        # a commit inserted right at the start of a day may belong to the
+        # previous one, so splitting resumes from the day before the change
+        day = max(bisect_left(self.starts, events[0][0]) - 1, 0)
+        starts, names = self.starts[:day], self.names[:day]
+        _split_days(timestamps, starts, names, self.starts[day] if self.starts else 0)
+
+        return CommitIndex(timestamps, b"".join(oids), starts, names)
+
+    def get_commits(self, date):
+        start, end = self._range(date)
+        return [self._name(position) for position in range(start, end)]
+
+    def get_timestamps(self, date):
+        start, end = self._range(date)
+        return self.timestamps[start:end]
+
+    def has_commit(self, date, name):
+        if date not in self.dates:
+            return False
+
+        _, _, short_sha1 = name.rpartition("-")
+        try:
+            prefix = unhexlify(short_sha1)
+        except (BinasciiError, TypeError):
+            return False
+        if len(prefix) != SHORT_OID_SIZE:
+            return False
+
+        start, end = self._range(date)
+        end *= OID_SIZE
+        offset = self.oids.find(prefix, start * OID_SIZE, end)
+        while offset != -1:
+            if not offset % OID_SIZE and self._name(offset // OID_SIZE) == name:
+                return True
+            offset = self.oids.find(prefix, offset + 1, end)
+
+        return False
+
+    def _range(self, date):
+        day = self.dates[date]
+        if day + 1 < len(self.starts):
+            return self.starts[day], self.starts[day + 1]
+        return self.starts[day], len(self.timestamps)
+
+    def _name(self, position):
+        commit_time = datetime.fromtimestamp(self.timestamps[position])
+        offset = position * OID_SIZE
+        short_sha1 = hexlify(self.oids[offset : offset + SHORT_OID_SIZE])
+
+        return "{}-{}".format(
+            commit_time.strftime("%H-%M-%S"), short_sha1.decode("ascii")
+        )
+
+    def _position(self, timestamp, oid):
+        start = bisect_left(self.timestamps, timestamp)
+        end = bisect_right(self.timestamps, timestamp, start)
+        while start < end and self._oid(start) < oid:
+            start += 1
+        return start
+
+    def _find(self, timestamp, oid):
+        start = bisect_left(self.timestamps, timestamp)
+        end = bisect_right(self.timestamps, timestamp, start)
+        for position in range(start, end):
+            if self._oid(position) == oid:
+                return position
+        return None
 
+    def _oid(self, position):
+        return self.oids[position * OID_SIZE : (position + 1) * OID_SIZE]
 
-class Commit(object):
-    __slots__ = ["hex", "time", "timestamp"]
 
-    def __init__(self, timestamp, time, hex):
-        self.hex = hex
-        self.time = time
-        self.timestamp = timestamp
+def _split_days(timestamps, starts, names, position):
+    """
+    Appends the first offset and the name of each date, starting with the
+    date of the commit at `position`, to `starts` and `names`.
+    """
 
-    def __gt__(self, commit):
-        return self.timestamp > commit.timestamp
+    while position < len(timestamps):
+        day = datetime.fromtimestamp(timestamps[position]).date()
+        starts.append(position)
+        names.append(day.strftime("%Y-%m-%d"))
 
-    def __repr__(self):
-        return "{}-{}".format(self.time, self.hex[:10])
+        midnight = time.mktime((day + timedelta(days=1)).timetuple())
+        position = bisect_left(timestamps, midnight, position + 1)
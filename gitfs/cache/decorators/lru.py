@@ -1,5 +1,4 @@
 import functools
-import collections
 
 try:
     from threading import RLock
@@ -7,9 +6,7 @@ except ImportError:
     from dummy_threading import RLock
 
 from gitfs.cache import lru_cache
-
-
-CacheInfo = collections.namedtuple("CacheInfo", "hits misses maxsize currsize")
+from gitfs.cache.base import CacheInfo
 
 
 def _makekey_typed(args, kwargs):
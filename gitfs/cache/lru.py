@@ -19,7 +19,7 @@ except ImportError:
     from dummy_threading import RLock
 
 
-from .base import Cache
+from .base import Cache, CacheInfo
 from .node import Node
 
 
@@ -42,6 +42,7 @@ class LRUCache(Cache):
         self.__root = root
 
         self.__lock = RLock()
+        self.__stats = [0, 0]
 
     def __getitem__(self, key):
         value, link = super(LRUCache, self).__getitem__(key)
@@ -109,6 +110,15 @@ class LRUCache(Cache):
         with self.__lock:
             exists = super(LRUCache, self).__contains__(key)
             if not exists:
+                self.__stats[1] += 1
                 return None
 
+            self.__stats[0] += 1
             return self.__getitem__(key)
+
+    def cache_info(self):
+        """Report the hits and misses of :meth:`get_if_exists`."""
+
+        with self.__lock:
+            hits, misses = self.__stats
+            return CacheInfo(hits, misses, self.maxsize, self.currsize)
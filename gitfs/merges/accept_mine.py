@@ -13,95 +13,102 @@
 # limitations under the License.
 
 
-import pygit2
-import six
+from pygit2 import IndexEntry, Signature
 
 from gitfs.log import log
 from .base import Merger
 
 
 class AcceptMine(Merger):
-    def _create_remote_copy(self, branch_name, upstream, new_branch):
-        reference = "{}/{}".format(upstream, branch_name)
-
-        remote = self.repository.branches.remote.get(reference)
-        remote_commit = self.repository[remote.target.hex]
-
-        # TODO: add tests and checks for failures
-
-        local = self.repository.create_branch(new_branch, remote_commit)
-        ref = self.repository.lookup_reference("refs/heads/%s" % new_branch)
-        self.repository.checkout(ref, strategy=pygit2.GIT_CHECKOUT_FORCE)
-
-        return local
-
-    def _create_local_copy(self, branch_name, new_branch):
-        branch = self.repository.branches.local.get(branch_name)
-        branch_commit = self.repository[branch.target.hex]
-
-        # TODO: add tests and checks for failures
-
-        return self.repository.create_branch(new_branch, branch_commit)
+    """
+    Merges the local commits on top of the remote branch. Each local commit
+    is merged into a head based on the remote branch, so in `merge_commits`
+    the head is `ours` and the local commit is `theirs`, and every conflict
+    is solved with the local commit's version. The merges are done on
+    in-memory indexes and the working tree is updated once, at the end, with
+    only the paths that changed.
+    """
 
     def merge(self, local_branch, remote_branch, upstream):
-        log.debug("AcceptMine: Copy local branch to merging_local")
-        local = self._create_local_copy(local_branch, "merging_local")
+        reference = "{}/{}".format(upstream, remote_branch)
 
-        log.debug("AcceptMine: Copy remote branch to merging_remote")
-        remote = self._create_remote_copy(remote_branch, upstream, "merging_remote")
+        local = self.repository.branches.local.get(local_branch)
+        remote = self.repository.branches.remote.get(reference)
 
-        log.debug("AcceptMine: Find diverge commis")
+        log.debug("AcceptMine: Find diverge commits")
         diverge_commits = self.repository.find_diverge_commits(local, remote)
 
-        reference = "refs/heads/%s" % "merging_remote"
-        log.debug("AcceptMine: Checkout to %s", reference)
-        self.repository.checkout(reference, strategy=pygit2.GIT_CHECKOUT_FORCE)
+        head = self.repository[remote.target]
+        merged = set()
 
         # actual merging
         for commit in diverge_commits.first_commits:
+            if commit.id in merged:
+                log.debug("AcceptMine: %s is already merged", commit.hex)
+                continue
+
             log.debug("AcceptMine: Merging %s", commit.hex)
-            self.repository.merge(commit.hex)
-
-            log.debug("AcceptMine: Solving conflicts")
-            self.solve_conflicts(self.repository.index.conflicts)
-
-            log.debug("AcceptMine: Commiting changes")
-            ref = self.repository.lookup_reference(reference)
-            message = "merging: %s" % commit.message
-            parents = [ref.target, commit.id]
-            new_commit = self.repository.commit(
-                message, self.author, self.commiter, ref=reference, parents=parents
-            )
-            if new_commit is not None:
+            new_head = self.merge_commit(head, commit)
+            if new_head is not head:
                 log.debug("AcceptMine: We have a non-empty commit")
-                self.repository.create_reference(reference, new_commit, force=True)
-
-            log.debug("AcceptMine: Checkout to %s", reference)
-            self.repository.checkout(reference, strategy=pygit2.GIT_CHECKOUT_FORCE)
+                merged.update(self._own_ancestors(commit, diverge_commits))
+                head = new_head
 
-            log.debug("AcceptMine: Clean the state")
-            self.repository.state_cleanup()
+        log.debug("AcceptMine: Update the working tree")
+        self.repository.update_working_tree(
+            self.repository[local.target].tree, head.tree
+        )
 
-        log.debug("AcceptMine: Checkout to %s", local_branch)
-        ref = self.repository.lookup_reference(reference)
+        log.debug("AcceptMine: Move %s to %s", local_branch, head.hex)
         self.repository.create_reference(
-            "refs/heads/%s" % local_branch, ref.target, force=True
+            "refs/heads/%s" % local_branch, head.id, force=True
         )
 
-    def clean_up(self, local_branch):
-        log.debug("AcceptMine: Checkout force to branch %s", local_branch)
-        self.repository.checkout(
-            "refs/heads/%s" % local_branch, strategy=pygit2.GIT_CHECKOUT_FORCE
+    def merge_commit(self, head, commit):
+        """
+        Merges <commit> into <head> and returns the merge commit, or <head>
+        if the merge doesn't change anything.
+        """
+
+        index = self.repository.merge_commits(head, commit)
+
+        log.debug("AcceptMine: Solving conflicts")
+        self.solve_conflicts(index)
+
+        tree = index.write_tree(self.repository._repo)
+        if tree == head.tree_id:
+            return head
+
+        log.debug("AcceptMine: Commiting changes")
+        new_commit = self.repository.create_commit(
+            None,
+            Signature(self.author[0], self.author[1]),
+            Signature(self.commiter[0], self.commiter[1]),
+            "merging: %s" % commit.message,
+            tree,
+            [head.id, commit.id],
         )
+        return self.repository[new_commit]
+
+    def _own_ancestors(self, commit, diverge_commits):
+        """
+        Returns the ids of the local-only commits reachable from <commit>.
+        Only local-only commits can lead to other local-only commits, so
+        the walk never leaves them.
+        """
+
+        commits = dict((item.id, item) for item in diverge_commits.first_commits)
+        ancestors = set()
 
-        refs = [
-            (target, "refs/heads/" + target)
-            for target in ["merging_local", "merging_remote"]
-        ]
+        pending = [commit.id]
+        while pending:
+            commit_id = pending.pop()
+            if commit_id in ancestors or commit_id not in commits:
+                continue
+            ancestors.add(commit_id)
+            pending.extend(commits[commit_id].parent_ids)
 
-        for branch, ref in refs:
-            log.debug("AcceptMine: Delete %s", branch)
-            self.repository.lookup_reference(ref).delete()
+        return ancestors
 
     def __call__(self, local_branch, remote_branch, upstream):
         try:
@@ -109,30 +116,26 @@ class AcceptMine(Merger):
         except:
             log.exception("AcceptMine: Failed to merge")
             raise
-        finally:
-            self.clean_up(local_branch)
-
-    def solve_conflicts(self, conflicts):
-        if conflicts:
-            for _, theirs, ours in conflicts:
-                if not ours and theirs:
-                    log.debug(
-                        "AcceptMine: if we deleted the file and they "
-                        "didn't, remove the file"
-                    )
-                    self.repository.index.remove(theirs.path, 2)
-                    self.repository.index.remove(theirs.path, 1)
-                elif ours and not theirs:
-                    log.debug(
-                        "AcceptMine: if they deleted the file and we "
-                        "didn't, add the file"
-                    )
-                    self.repository.index.add(ours.path)
-                else:
-                    log.debug("AcceptMine: overwrite all file with our " "content")
-                    with open(self.repository._full_path(ours.path), "w") as f:
-                        data = self.repository.get(ours.id).data
-                        f.write(six.text_type(data))
-                    self.repository.index.add(ours.path)
-        else:
+
+    def solve_conflicts(self, index):
+        """
+        Keeps the local commit's side of every conflict in <index>. The
+        conflicts come as (ancestor, head, commit) entries, so the names
+        below are from the local commit's point of view: `theirs` is the
+        remote-based head and `ours` is the local commit.
+        """
+
+        conflicts = index.conflicts
+        if not conflicts:
             log.info("AcceptMine: No conflicts to solve")
+            return
+
+        for _, theirs, ours in list(conflicts):
+            path = (ours or theirs).path
+            del conflicts[path]
+
+            if ours:
+                log.debug("AcceptMine: keep our version of %s", path)
+                index.add(IndexEntry(ours.path, ours.id, ours.mode))
+            else:
+                log.debug("AcceptMine: we deleted %s, so remove it", path)
@@ -25,7 +25,14 @@ from gitfs import __version__
 from gitfs.utils import Args
 from gitfs.routes import prepare_routes
 from gitfs.router import Router
-from gitfs.worker import CommitQueue, SyncWorker, FetchWorker
+from gitfs.trace import Tracer
+from gitfs.worker import (
+    CommitJournal,
+    CommitQueue,
+    CommitPolicy,
+    SyncWorker,
+    FetchWorker,
+)
 
 
 def parse_args(parser):
@@ -53,10 +60,17 @@ def get_credentials(args):
 
 
 def prepare_components(args):
-    commit_queue = CommitQueue()
+    journal = None
+    if args.commit_journal:
+        journal = CommitJournal(args.commit_journal)
+    commit_queue = CommitQueue(journal=journal)
 
     credentials = get_credentials(args)
 
+    tracer = None
+    if args.trace_sample:
+        tracer = Tracer(args.trace_sample, args.trace_size, args.trace_file or None)
+
     try:
         # setting router
         router = Router(
@@ -66,11 +80,15 @@ def prepare_components(args):
             history_path=args.history_path,
             repo_path=args.repo_path,
             branch=args.branch,
+            history_index=args.history_index,
             user=args.user,
             group=args.group,
             max_size=args.max_size * 1024 * 1024,
             max_offset=args.max_size * 1024 * 1024,
+            stream_threshold=args.stream_threshold * 1024 * 1024,
+            hash_threshold=args.hash_threshold * 1024 * 1024,
             commit_queue=commit_queue,
+            tracer=tracer,
             credentials=credentials,
             ignore_file=args.ignore_file,
             hard_ignore=args.hard_ignore,
@@ -82,17 +100,26 @@ def prepare_components(args):
         )
         raise error
 
+    # queue the changes a crash left behind
+    commit_queue.restore(router.repo)
+
     # register all the routes
     routes = prepare_routes(args)
     router.register(routes)
 
     # setup workers
+    policy = CommitPolicy(
+        max_latency=args.commit_max_latency,
+        max_paths=args.commit_max_paths,
+        max_bytes=args.commit_max_size * 1024 * 1024,
+    )
     merge_worker = SyncWorker(
         args.commiter_name,
         args.commiter_email,
         args.commiter_name,
         args.commiter_email,
         commit_queue=commit_queue,
+        policy=policy,
         repository=router.repo,
         upstream="origin",
         branch=args.branch,
@@ -138,6 +165,7 @@ def start_fuse():
         FUSE(
             router,
             args.mount_point,
+            raw_fi=True,
             foreground=args.foreground,
             allow_root=args.allow_root,
             allow_other=args.allow_other,
@@ -148,6 +176,7 @@ def start_fuse():
         FUSE(
             router,
             args.mount_point,
+            raw_fi=True,
             foreground=args.foreground,
             nonempty=True,
             allow_root=args.allow_root,
@@ -14,39 +14,102 @@
 
 
 import os
+import tempfile
+import zlib
 from collections import namedtuple
-from shutil import rmtree
-from stat import S_IFDIR, S_IFREG, S_IFLNK
+from concurrent.futures import ThreadPoolExecutor
+from shutil import copy2, copytree, rmtree
+from threading import Lock
+from stat import S_IFDIR, S_IFREG, S_IFLNK, S_ISLNK, S_ISREG, S_IXUSR
+
+from six import iteritems
 
 from pygit2 import (
     clone_repository,
     Signature,
     GIT_SORT_TOPOLOGICAL,
     GIT_FILEMODE_TREE,
-    GIT_STATUS_CURRENT,
     GIT_FILEMODE_LINK,
     GIT_FILEMODE_BLOB,
     GIT_BRANCH_REMOTE,
     GIT_BRANCH_LOCAL,
     GIT_FILEMODE_BLOB_EXECUTABLE,
+    GIT_CHECKOUT_FORCE,
+    GIT_DELTA_DELETED,
+    GIT_STATUS_INDEX_DELETED,
+    GIT_STATUS_INDEX_MODIFIED,
+    GIT_STATUS_INDEX_NEW,
+    GIT_STATUS_INDEX_TYPECHANGE,
+    GIT_STATUS_WT_DELETED,
+    GIT_STATUS_WT_MODIFIED,
+    GIT_STATUS_WT_TYPECHANGE,
+    GitError,
+    IndexEntry,
+    Oid,
+    hashfile,
 )
-from six import iteritems
 
-from gitfs.cache import CommitCache
+from gitfs.cache import CommitCache, LRUCache, BlobCache, BlobStream
 from gitfs.log import log
 from gitfs.utils.path import split_path_into_components
+from gitfs.utils.cat_file import CatFile
 from gitfs.utils.commits import CommitsList
+from gitfs.utils.dirty import DirtyPaths, REMOVE
+from gitfs.utils.stale import StalePaths
 
 
 DivergeCommits = namedtuple(
     "DivergeCommits", ["common_parent", "first_commits", "second_commits"]
 )
+GitEntry = namedtuple("GitEntry", ["filemode", "oid", "size"])
+
+BLOB_FILEMODES = (GIT_FILEMODE_BLOB, GIT_FILEMODE_BLOB_EXECUTABLE, GIT_FILEMODE_LINK)
+DEFAULT_STATS = {
+    GIT_FILEMODE_LINK: {"st_mode": S_IFLNK | 0o444},
+    GIT_FILEMODE_TREE: {"st_mode": S_IFDIR | 0o555, "st_nlink": 2},
+    GIT_FILEMODE_BLOB: {"st_mode": S_IFREG | 0o444},
+    GIT_FILEMODE_BLOB_EXECUTABLE: {"st_mode": S_IFREG | 0o555},
+}
+
+ENTRIES_CACHE_SIZE = 40000
+STATS_CACHE_SIZE = 40000
+BLOBS_CACHE_SIZE = 128 * 1024 * 1024  # in bytes
+STREAMS_CACHE_SIZE = 16
+STREAM_THRESHOLD = 32 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+TREES_CACHE_SIZE = 200000  # in tree entries
+DIVERGES_CACHE_SIZE = 64
+HASH_WORKERS = 4
+HASH_THRESHOLD = 8 * 1024 * 1024
+WORKDIR_CHANGES = (
+    GIT_STATUS_WT_MODIFIED | GIT_STATUS_WT_DELETED | GIT_STATUS_WT_TYPECHANGE
+)
+INDEX_CHANGES = (
+    GIT_STATUS_INDEX_NEW
+    | GIT_STATUS_INDEX_MODIFIED
+    | GIT_STATUS_INDEX_DELETED
+    | GIT_STATUS_INDEX_TYPECHANGE
+)
 
 
 class Repository(object):
     def __init__(self, repository, commits=None):
         self._repo = repository
         self.commits = commits or CommitCache(self)
+        self.entries = LRUCache(ENTRIES_CACHE_SIZE)
+        self.trees = LRUCache(TREES_CACHE_SIZE, getsizeof=len)
+        self.stats = LRUCache(STATS_CACHE_SIZE)
+        self.blobs = BlobCache(BLOBS_CACHE_SIZE)
+        self.streams = LRUCache(STREAMS_CACHE_SIZE)
+        self.streams_lock = Lock()
+        self.diverges = LRUCache(DIVERGES_CACHE_SIZE)
+        self.dirty_paths = DirtyPaths()
+        self.stale_paths = StalePaths()
+        self.cat_file = CatFile(repository.path)
+        self.hashers = ThreadPoolExecutor(max_workers=HASH_WORKERS)
+        self.stream_threshold = STREAM_THRESHOLD
+        self.hash_threshold = HASH_THRESHOLD
+        self.hashed_paths = set()
 
         self.behind = False
 
@@ -88,45 +151,398 @@ class Repository(object):
         return ahead, behind
 
     def checkout(self, ref, *args, **kwargs):
+        old_tree = self._head_tree()
+        new_tree = self._repo.revparse_single(getattr(ref, "name", ref)).tree
+
+        # the paths go stale before the checkout writes them, so an open in
+        # the meantime drops its cached pages
+        deltas = self._diff_trees(old_tree, new_tree)
+        self.stale_paths.update(
+            path
+            for delta in deltas
+            for path in (delta.old_file.path, delta.new_file.path)
+        )
         result = self._repo.checkout(ref, *args, **kwargs)
 
         # update ignore cache after a checkout
         self.ignore.update()
 
-        status = self._repo.status()
-        for path, status in iteritems(status):
-            # path is in current status, move on
-            if status == GIT_STATUS_CURRENT:
+        self._reconcile(deltas, new_tree)
+
+        return result
+
+    def update_working_tree(self, old_tree, new_tree):
+        """
+        Brings the working tree and the index from <old_tree> to <new_tree>
+        by checking out only the paths which differ between them. HEAD is
+        expected to still point to a commit of <old_tree>, so deleted paths
+        are removed too. The changed paths are marked as stale for the
+        kernel's page cache.
+
+        :returns: the set of changed paths
+        """
+
+        deltas = self._diff_trees(old_tree, new_tree)
+
+        paths = set()
+        for delta in deltas:
+            paths.add(delta.old_file.path)
+            paths.add(delta.new_file.path)
+
+        if paths:
+            self.stale_paths.update(paths)
+            self._checkout_paths(paths, new_tree)
+            self._reconcile(deltas, new_tree)
+
+        return paths
+
+    def stage(self):
+        """
+        Applies the changes recorded in `dirty_paths` to the index, in a
+        single pass. Directory moves are applied first, on the tree written
+        from the index, which is then read back. The added paths are read
+        from disk, so a path which is gone by now is removed instead, unless
+        its blob was already written on release. Those paths are kept in
+        `hashed_paths`.
+
+        :returns: the staged paths
+        """
+
+        trees, pending = self.dirty_paths.drain()
+        index = self._repo.index
+        staged = set(pending)
+        self.hashed_paths = set()
+
+        if trees:
+            oid = index.write_tree()
+            for old, new in trees:
+                oid = self._move_tree(self._repo[oid], old, new)
+                staged.update(path for path in (old, new) if path is not None)
+            index.read_tree(self._repo[oid])
+
+        for path in sorted(pending):
+            change = pending[path]
+            filemode = self._disk_filemode(path)
+            try:
+                if change == REMOVE or filemode is None:
+                    index.remove(path)
+                elif isinstance(change, Oid):
+                    index.add(IndexEntry(path, change, filemode))
+                    self.hashed_paths.add(path)
+                else:
+                    index.add(path)
+            except (OSError, GitError) as error:
+                log.debug("Repository: Can't stage %s: %s", path, error)
+
+        return staged
+
+    def _move_tree(self, tree, old, new=None):
+        """
+        Moves the entry at <old> inside <tree> to <new>, or drops it if <new>
+        is None. Only the trees on the way to <old> and <new> are written.
+
+        :returns: the oid of the new root tree
+        """
+
+        old_components = split_path_into_components(old)
+        entry = self._lookup_entry(tree, old_components)
+        if entry is None:
+            return tree.id
+
+        oid = self._replace_entry(tree, old_components, None)
+        if new is not None:
+            tree = self._repo[oid] if oid is not None else None
+            replacement = (entry.oid, entry.filemode)
+            oid = self._replace_entry(
+                tree, split_path_into_components(new), replacement
+            )
+
+        if oid is None:
+            oid = self._repo.TreeBuilder().write()
+        return oid
+
+    def _replace_entry(self, tree, path_components, entry):
+        """
+        Writes a copy of <tree> (which may be None) with the entry at
+        <path_components> replaced by <entry>, an `(oid, filemode)` pair, or
+        dropped if <entry> is None. Trees left empty are dropped as well.
+
+        :returns: the oid of the new tree, or None if it's empty
+        """
+
+        name = path_components[0]
+        if tree is None:
+            builder = self._repo.TreeBuilder()
+        else:
+            builder = self._repo.TreeBuilder(tree)
+
+        if len(path_components) > 1:
+            subtree = None
+            if tree is not None and name in tree:
+                child = tree[name]
+                if child.filemode == GIT_FILEMODE_TREE:
+                    subtree = self._get_tree(child.id)
+
+            oid = self._replace_entry(subtree, path_components[1:], entry)
+            entry = (oid, GIT_FILEMODE_TREE) if oid is not None else None
+
+        if entry is not None:
+            builder.insert(name, *entry)
+        elif builder.get(name) is not None:
+            builder.remove(name)
+
+        if not len(builder):
+            return None
+        return builder.write()
+
+    def hash_file(self, path):
+        """
+        Hashes the file at <path>. Files of at least `hash_threshold` bytes
+        (a negative threshold turns this off) are written as blobs while
+        they are hashed, so they are read only once. Writing a blob which
+        is already in the repository, like an unchanged file's, adds
+        nothing to it.
+
+        :returns: the oid, or None if the file can't be read, and whether
+            the blob was written for the content which is still on disk
+        """
+
+        full_path = self._full_path(path)
+        try:
+            before = os.lstat(full_path)
+            if not S_ISREG(before.st_mode):
+                return None, False
+
+            if 0 <= self.hash_threshold <= before.st_size:
+                oid = self._repo.create_blob_fromdisk(full_path)
+                after = os.lstat(full_path)
+                unchanged = (before.st_mtime, before.st_size) == (
+                    after.st_mtime,
+                    after.st_size,
+                )
+                return oid, unchanged
+
+            return hashfile(full_path), False
+        except (KeyError, IOError, OSError, GitError):
+            return None, False
+
+    def is_changed(self, path, oid=None):
+        """
+        Tells whether the file at <path> differs from the one in HEAD. The
+        file is only hashed, no blob is written, unless its <oid> is given.
+        Paths with changes still waiting to be staged always count as
+        changed.
+        """
+
+        path = self._sanitize(path)
+        if self.dirty_paths.changed(path):
+            return True
+
+        tree = self._head_tree()
+        entry = self.get_git_entry(tree, "/" + path) if tree is not None else None
+        if entry is None or entry.filemode not in BLOB_FILEMODES:
+            return True
+
+        if oid is None:
+            try:
+                oid = hashfile(self._full_path(path))
+            except (KeyError, IOError, OSError, GitError):
+                return True
+
+        return oid != entry.oid
+
+    def reconcile_paths(self, paths):
+        """
+        Runs after <paths> were committed. A path changed on disk since it
+        was staged keeps its newer content and is marked as dirty again, for
+        the next commit. Only the paths whose index entry still differs from
+        HEAD are checked out. Paths with changes still waiting to be staged
+        and directories are left alone.
+
+        :returns: the list of checked out paths
+        """
+
+        checkout = []
+        for path in paths:
+            path = self._sanitize(path)
+            # the hashed paths were read from disk on release and their index
+            # entries carry no stat data, so checking them means hashing them.
+            # A newer write to them is staged on its own release.
+            if path in self.dirty_paths or path in self.hashed_paths:
                 continue
 
-            # check if file exists or not
-            full_path = self._full_path(path)
-            if path not in self._repo.index:
-                if path not in self.ignore:
-                    try:
-                        os.unlink(full_path)
-                    except OSError:
-                        # path points to a directory containing untracked files
-                        rmtree(
-                            full_path,
-                            onerror=lambda function, fpath, excinfo: log.info(
-                                "Repository: Checkout couldn't delete %s", fpath
-                            ),
-                        )
+            try:
+                status = self._repo.status_file(path)
+            except (KeyError, ValueError, GitError):
                 continue
 
-            # check files stats
-            stats = self.get_git_object_default_stats(ref, path)
-            current_stat = os.lstat(full_path)
+            if status & WORKDIR_CHANGES:
+                log.debug("Repository: %s changed since it was staged", path)
+                self.dirty_paths.add(path)
+            elif status & INDEX_CHANGES:
+                checkout.append(path)
 
-            if stats["st_mode"] != current_stat.st_mode:
-                try:
-                    os.chmod(full_path, current_stat.st_mode)
-                except OSError:
-                    log.info("Repository: Checkout couldn't chmod %s", full_path)
-                self._repo.index.add(self._sanitize(path))
+        self.stale_paths.update(checkout)
+        self._checkout_paths(checkout)
 
-        return result
+        return sorted(checkout)
+
+    def _checkout_paths(self, paths, tree=None):
+        """
+        Forces the checkout of only <paths>, from <tree> or from HEAD.
+        """
+
+        # an empty list of paths would check out everything
+        if not paths:
+            return
+
+        if tree is None:
+            self._repo.checkout_head(strategy=GIT_CHECKOUT_FORCE, paths=sorted(paths))
+        else:
+            self._repo.checkout_tree(
+                tree, strategy=GIT_CHECKOUT_FORCE, paths=sorted(paths)
+            )
+
+    def restore_paths(self, workdir, changes):
+        """
+        Brings the changes left in <workdir> by a crash into the working tree
+        and marks them as dirty. <changes> maps each path to its size, or to
+        None for a removal. The paths whose content is gone are skipped.
+        """
+
+        for path, size in iteritems(changes):
+            target = os.path.abspath(self._full_path(path))
+
+            if size is None:
+                if os.path.isdir(target) and not os.path.islink(target):
+                    rmtree(target)
+                    self.dirty_paths.move(path)
+                    continue
+                if os.path.lexists(target):
+                    os.unlink(target)
+                self.dirty_paths.remove(path)
+                continue
+
+            source = os.path.abspath(os.path.join(workdir or "", path))
+            if not os.path.lexists(source):
+                log.warning("Repository: The content of %s is gone", path)
+                continue
+
+            if source != target:
+                self._copy_path(source, target)
+
+            if os.path.isdir(target) and not os.path.islink(target):
+                for dirpath, _, files in os.walk(target):
+                    relative = os.path.relpath(dirpath, self._repo.workdir)
+                    for filename in files:
+                        self.dirty_paths.add(os.path.join(relative, filename))
+            else:
+                self.dirty_paths.add(path)
+
+    def _copy_path(self, source, target):
+        if os.path.isdir(target) and not os.path.islink(target):
+            rmtree(target)
+        elif os.path.lexists(target):
+            os.unlink(target)
+
+        if os.path.isdir(source) and not os.path.islink(source):
+            copytree(source, target, symlinks=True)
+            return
+
+        parent = os.path.dirname(target)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        if os.path.islink(source):
+            os.symlink(os.readlink(source), target)
+        else:
+            copy2(source, target)
+
+    def _head_tree(self):
+        try:
+            return self._repo.revparse_single("HEAD").tree
+        except (KeyError, GitError):
+            return None
+
+    def _diff_trees(self, old_tree, new_tree):
+        if old_tree is None:
+            return new_tree.diff_to_tree(swap=True).deltas
+        return self._repo.diff(old_tree, new_tree).deltas
+
+    def _reconcile(self, deltas, new_tree):
+        """
+        Fixes up the working tree after a checkout, looking only at the
+        paths from the diff between the old and the new tree: leftovers of
+        deleted paths (and of their removed directories) are deleted and, if
+        a file's mode on disk doesn't match its new filemode, the file is
+        staged as it is on disk.
+        """
+
+        for delta in deltas:
+            if delta.status == GIT_DELTA_DELETED:
+                path = self._removed_root(new_tree, delta.old_file.path)
+                self._remove_leftover(path)
+            elif delta.new_file.mode in BLOB_FILEMODES:
+                self._stage_mode(delta.new_file.path, delta.new_file.mode)
+
+    def _removed_root(self, tree, path):
+        """
+        Returns the topmost directory of <path> which is missing from
+        <tree>, or <path> itself, so that untracked files left inside a
+        removed directory go away with it.
+        """
+
+        components = path.split("/")
+        for depth in range(1, len(components)):
+            directory = "/".join(components[:depth])
+            if self.get_git_entry(tree, "/" + directory) is None:
+                return directory
+
+        return path
+
+    def _remove_leftover(self, path):
+        if path in self._repo.index or path in self.ignore:
+            return
+
+        full_path = self._full_path(path)
+        if not os.path.lexists(full_path):
+            return
+
+        try:
+            os.unlink(full_path)
+        except OSError:
+            # path points to a directory containing untracked files
+            rmtree(
+                full_path,
+                onerror=lambda function, fpath, excinfo: log.info(
+                    "Repository: Checkout couldn't delete %s", fpath
+                ),
+            )
+
+    def _stage_mode(self, path, filemode):
+        current_filemode = self._disk_filemode(path)
+        if current_filemode is None:
+            return
+
+        if current_filemode != filemode:
+            log.info("Repository: Staging the mode of %s from disk", path)
+            self.dirty_paths.add(self._sanitize(path))
+
+    def _disk_filemode(self, path):
+        """
+        Returns the git filemode of <path> from the working tree, or None if
+        it's missing.
+        """
+
+        try:
+            current_stat = os.lstat(self._full_path(path))
+        except OSError:
+            return None
+
+        if S_ISLNK(current_stat.st_mode):
+            return GIT_FILEMODE_LINK
+        elif current_stat.st_mode & S_IXUSR:
+            return GIT_FILEMODE_BLOB_EXECUTABLE
+        return GIT_FILEMODE_BLOB
 
     def _sanitize(self, path):
         if path is not None and path.startswith("/"):
@@ -158,13 +574,9 @@ class Repository(object):
 
     def commit(self, message, author, commiter, parents=None, ref="HEAD"):
         """ Wrapper for create_commit. It creates a commit from a given ref
-        (default is HEAD)
+        (default is HEAD). Nothing is committed if the tree didn't change.
         """
 
-        status = self._repo.status()
-        if status == {}:
-            return None
-
         # sign the author
         author = Signature(author[0], author[1])
         commiter = Signature(commiter[0], commiter[1])
@@ -175,7 +587,10 @@ class Repository(object):
 
         # get parent
         if parents is None:
-            parents = [self._repo.revparse_single(ref).id]
+            parent = self._repo.revparse_single(ref)
+            if parent.tree_id == tree:
+                return None
+            parents = [parent.id]
 
         return self._repo.create_commit(ref, author, commiter, message, tree, parents)
 
@@ -203,63 +618,110 @@ class Repository(object):
         repo.checkout_head()
         return cls(repo)
 
-    def _is_searched_entry(self, entry_name, searched_entry, path_components):
+    def get_git_entry(self, tree, path):
         """
-        Checks if a tree entry is the one that is being searched for. For
-        that, the name has to correspond and it has to be the last element
-        in the path_components list (this means that the path corresponds
-        exactly).
+        Resolves the entry with the relative path <path> inside <tree>. The
+        lookup goes straight down the path components, one tree at a time,
+        and the result is cached by `(tree oid, path)`.
 
-        :param entry_name: the name of the tree entry
-        :param searched_entry: the name of the object that is being searched
-                               for
-        :type searched_entry: str
-        :param path_components: the path of the object being searched for
-        :type path_components: list
+        :param tree: a `pygit2.Tree` instance
+        :param path: the relative path of the object
+        :type path: str
+        :returns: a `GitEntry` with the filemode, oid and size of the object
+            in case of success, or None otherwise.
+        :rtype: GitEntry, None
         """
 
-        return (
-            entry_name == searched_entry
-            and len(path_components) == 1
-            and entry_name == path_components[0]
-        )
+        key = (tree.id, path)
+        entry = self.entries.get_if_exists(key)
+        if entry is not None:
+            return entry
+
+        path_components = split_path_into_components(path)
+        if not path_components:
+            return GitEntry(GIT_FILEMODE_TREE, tree.id, 0)
+
+        entry = self._lookup_entry(tree, path_components)
+        if entry is not None:
+            self.entries[key] = entry
 
-    def _get_git_object(self, tree, obj_name, path_components, modifier):
+        return entry
+
+    def _lookup_entry(self, tree, path_components):
         """
-        It recursively searches for the object in the repository. To declare
-        an object as found, the name and the relative path have to correspond.
-        It also includes the relative path as a condition for success, to avoid
-        finding an object with the correct name but with a wrong location.
+        Walks down <tree> following <path_components>. Each step is a single
+        lookup by name in the current tree, so siblings are never visited.
 
         :param tree: a `pygit2.Tree` instance
-        :param entry_name: the name of the object
-        :type entry_name: str
         :param path_components: the path of the object being searched for as
             a list (e.g: for '/a/b/c/file.txt' => ['a', 'b', 'c', 'file.txt'])
         :type path_components: list
-        :param modifier: a function used to retrieve some specific
-            characteristic of the git object
-        :type modifier: function
-        :returns: an instance corresponding to the object that is being
-            searched for in case of success, or None otherwise.
-        :rtype: one of the following:
-            an instance of `pygit2.Tree`
-            an instance of `pygit2.Blob`
-            None
+        :rtype: GitEntry, None
         """
 
-        git_obj = None
-        for entry in tree:
-            if self._is_searched_entry(entry.name, obj_name, path_components):
-                return modifier(entry)
-            elif entry.filemode == GIT_FILEMODE_TREE:
-                git_obj = self._get_git_object(
-                    self._repo[entry.id], obj_name, path_components[1:], modifier
-                )
-                if git_obj:
-                    return git_obj
+        for name in path_components[:-1]:
+            try:
+                entry = tree[name]
+            except KeyError:
+                return None
+
+            if entry.filemode != GIT_FILEMODE_TREE:
+                return None
+            tree = self._get_tree(entry.id)
+
+        try:
+            entry = tree[path_components[-1]]
+        except KeyError:
+            return None
+
+        size = 0
+        if entry.filemode in BLOB_FILEMODES:
+            size = self._blob_size(entry.id)
+
+        return GitEntry(entry.filemode, entry.id, size)
+
+    def _blob_size(self, oid):
+        """
+        Returns the size of the blob <oid>, read only from the header of the
+        object. The blob is loaded instead if git can't be run.
+        """
+
+        try:
+            return self.cat_file.size(oid)
+        except OSError:
+            log.warning("Repository: Can't run git cat-file, loading %s", oid)
+            return self._repo[oid].size
+
+    def _blob_sizes(self, oids):
+        """
+        Returns the sizes of the blobs <oids>, like `_blob_size`, looked up
+        all at once.
+        """
+
+        try:
+            sizes = self.cat_file.sizes(oids)
+        except OSError:
+            log.warning("Repository: Can't run git cat-file, loading the blobs")
+            sizes = [None] * len(oids)
+
+        return [
+            self._repo[oid].size if size is None else size
+            for oid, size in zip(oids, sizes)
+        ]
+
+    def _get_tree(self, oid):
+        """
+        Returns the tree with the given oid. Parsed trees are kept around, so
+        sibling lookups inside wide directories don't parse them again.
+        """
 
-        return git_obj
+        tree = self.trees.get_if_exists(oid)
+        if tree is None:
+            tree = self._repo[oid]
+            if len(tree) <= self.trees.maxsize:
+                self.trees[oid] = tree
+
+        return tree
 
     def get_git_object_type(self, tree, path):
         """
@@ -279,14 +741,16 @@ class Repository(object):
         :rtype: int, None
         """
 
-        path_components = split_path_into_components(path)
         try:
-            return self._get_git_object(
-                tree, path_components[-1], path_components, lambda entry: entry.filemode
-            )
+            entry = self.get_git_entry(tree, path)
         except:
             return GIT_FILEMODE_TREE
 
+        if entry is None:
+            return None
+
+        return entry.filemode
+
     def get_git_object(self, tree, path):
         """
         Returns the git object with the relative path <path>.
@@ -302,37 +766,106 @@ class Repository(object):
             None
         """
 
-        # It acts as a proxy for the _get_git_object method, which
-        # does the actual searching.
-        path_components = split_path_into_components(path)
-        return self._get_git_object(
-            tree,
-            path_components[-1],
-            path_components,
-            lambda entry: self._repo[entry.id],
-        )
+        entry = self.get_git_entry(tree, path)
+        if entry is None:
+            return None
+
+        return self._repo[entry.oid]
 
     def get_git_object_default_stats(self, ref, path):
-        types = {
-            GIT_FILEMODE_LINK: {"st_mode": S_IFLNK | 0o444},
-            GIT_FILEMODE_TREE: {"st_mode": S_IFDIR | 0o555, "st_nlink": 2},
-            GIT_FILEMODE_BLOB: {"st_mode": S_IFREG | 0o444},
-            GIT_FILEMODE_BLOB_EXECUTABLE: {"st_mode": S_IFREG | 0o555},
-        }
+        """
+        Returns the default stats of the object with the relative path
+        <path>. The filemode and the size come from a single lookup.
+
+        :param ref: a `pygit2.Tree` instance
+        :param path: the relative path of the object
+        :type path: str
+        :returns: a dictionary with `st_mode`, `st_size` for blobs and
+            `st_nlink` for trees, or None if the path doesn't exist.
+        :rtype: dict, None
+        """
 
         if path == "/":
-            return types[GIT_FILEMODE_TREE]
+            return dict(DEFAULT_STATS[GIT_FILEMODE_TREE])
+
+        try:
+            entry = self.get_git_entry(ref, path)
+        except:
+            return dict(DEFAULT_STATS[GIT_FILEMODE_TREE])
 
-        obj_type = self.get_git_object_type(ref, path)
-        if obj_type is None:
-            return obj_type
+        if entry is None:
+            return None
 
-        stats = types[obj_type]
-        if obj_type in [GIT_FILEMODE_BLOB, GIT_FILEMODE_BLOB_EXECUTABLE]:
-            stats["st_size"] = self.get_blob_size(ref, path)
+        stats = dict(DEFAULT_STATS[entry.filemode])
+        if entry.filemode in [GIT_FILEMODE_BLOB, GIT_FILEMODE_BLOB_EXECUTABLE]:
+            stats["st_size"] = entry.size
 
         return stats
 
+    def get_commit_stats(self, commit, path):
+        """
+        Returns the default stats of <path> inside <commit>. Commits are
+        immutable, so the result is kept in the `stats` cache, which is
+        shared by all the commit views.
+
+        :param commit: a `pygit2.Commit` instance
+        :param path: the relative path of the object
+        :type path: str
+        :rtype: dict, None
+        """
+
+        key = (commit.id, path)
+        stats = self.stats.get_if_exists(key)
+        if stats is None:
+            stats = self.get_git_object_default_stats(commit.tree, path)
+            if stats is None:
+                return None
+            self.stats[key] = stats
+
+        return dict(stats)
+
+    def list_commit_stats(self, commit, tree, path):
+        """
+        Returns the name and the default stats of each entry of <tree>, the
+        directory <path> inside <commit>, from a single pass over the tree.
+        The entries and their stats are cached too, so the getattr calls
+        which follow a listing don't resolve the paths again.
+
+        :param commit: a `pygit2.Commit` instance
+        :param tree: a `pygit2.Tree` instance
+        :param path: the relative path of <tree>
+        :type path: str
+        :returns: a list of `(name, stats)` pairs, where stats is None for
+            the entries which aren't files, links or directories
+        :rtype: list
+        """
+
+        prefix = path.rstrip("/") + "/"
+        root = commit.tree.id
+        items = list(tree)
+
+        blobs = [entry.id for entry in items if entry.filemode in BLOB_FILEMODES]
+        sizes = dict(zip(blobs, self._blob_sizes(blobs)))
+
+        entries = []
+        for entry in items:
+            size = sizes.get(entry.id, 0)
+            self.entries[(root, prefix + entry.name)] = GitEntry(
+                entry.filemode, entry.id, size
+            )
+
+            if entry.filemode not in DEFAULT_STATS:
+                entries.append((entry.name, None))
+                continue
+
+            stats = dict(DEFAULT_STATS[entry.filemode])
+            if entry.filemode in [GIT_FILEMODE_BLOB, GIT_FILEMODE_BLOB_EXECUTABLE]:
+                stats["st_size"] = size
+            self.stats[(commit.id, prefix + entry.name)] = stats
+            entries.append((entry.name, dict(stats)))
+
+        return entries
+
     def get_blob_size(self, tree, path):
         """
         Returns the size of a the data contained by a blob object
@@ -344,7 +877,7 @@ class Repository(object):
         :returns: the size of data contained by the blob object.
         :rtype: int
         """
-        return self.get_git_object(tree, path).size
+        return self.get_git_entry(tree, path).size
 
     def get_blob_data(self, tree, path):
         """
@@ -357,7 +890,95 @@ class Repository(object):
         :returns: the data contained by the blob object.
         :rtype: str
         """
-        return self.get_git_object(tree, path).data
+        return self._repo[self.get_git_entry(tree, path).oid].data
+
+    def read_blob(self, tree, path, size, offset):
+        """
+        Returns at most <size> bytes, starting from <offset>, from the blob
+        object with the relative path <path>. Blobs larger than
+        `stream_threshold` are streamed instead of being loaded in memory.
+
+        :param tree: a `pygit2.Tree` instance
+        :param path: the relative path of the object
+        :type path: str
+        :rtype: bytes
+        """
+
+        entry = self.get_git_entry(tree, path)
+        if entry.size <= self.stream_threshold:
+            data = self.blobs.get(entry.oid, self._repo.__getitem__)
+            return data[offset : offset + size].tobytes()
+
+        with self.streams_lock:
+            stream = self.streams.get_if_exists(entry.oid)
+            if stream is None:
+                chunks = lambda: self.iter_blob_chunks(entry.oid)
+                stream = self.streams[entry.oid] = BlobStream(chunks, entry.size)
+
+        return stream.read(size, offset)
+
+    def iter_blob_chunks(self, oid, chunk_size=CHUNK_SIZE):
+        """
+        Yields the content of the blob <oid> in chunks of at most
+        <chunk_size> bytes. Loose objects are inflated incrementally, straight
+        from the object database. Packed objects can't be read partially
+        through libgit2, so they are streamed by `git cat-file`.
+        """
+
+        hex_oid = oid.hex
+        loose = os.path.join(self._repo.path, "objects", hex_oid[:2], hex_oid[2:])
+
+        try:
+            source = open(loose, "rb")
+        except (IOError, OSError):
+            for chunk in self._iter_packed_chunks(oid, chunk_size):
+                yield chunk
+            return
+
+        with source:
+            inflater = zlib.decompressobj()
+            header = b""
+
+            for compressed in iter(lambda: source.read(chunk_size), b""):
+                while compressed:
+                    chunk = inflater.decompress(compressed, chunk_size)
+                    compressed = inflater.unconsumed_tail
+
+                    # skip the "blob <size>\0" header of the loose object
+                    if header is not None:
+                        header += chunk
+                        if b"\0" not in header:
+                            continue
+                        chunk = header[header.index(b"\0") + 1 :]
+                        header = None
+
+                    if chunk:
+                        yield chunk
+
+    def _iter_packed_chunks(self, oid, chunk_size):
+        chunks = self.cat_file.stream(oid, chunk_size)
+        try:
+            first = next(chunks, None)
+        except OSError:
+            # without git, the blob is loaded once and copied to a temporary
+            # file, so it isn't kept in memory while it's read
+            log.warning("Repository: Can't run git cat-file, loading %s", oid)
+            chunks = self._spill_blob(oid, chunk_size)
+            first = next(chunks, None)
+
+        if first is None:
+            return
+
+        yield first
+        for chunk in chunks:
+            yield chunk
+
+    def _spill_blob(self, oid, chunk_size):
+        with tempfile.TemporaryFile() as spill:
+            spill.write(self._repo[oid].data)
+            spill.seek(0)
+            for chunk in iter(lambda: spill.read(chunk_size), b""):
+                yield chunk
 
     def get_commit_dates(self):
         """
@@ -377,7 +998,7 @@ class Repository(object):
             the short sha1 of the commit (first 10 characters).
         :rtype: list
         """
-        return list(map(str, self.commits[date]))
+        return self.commits.get_commits(date)
 
     def walk_branches(self, sort, *branches):
         """
@@ -451,9 +1072,13 @@ class Repository(object):
             /
         1--+              Return:
             \               - common parent: 1
-             6              - first list of commits: (2, 3, 4, 5)
+             6              - first list of commits: (5, 4, 3, 2)
                             - second list of commits: (6)
 
+        The common parent is the merge base of the two branches and each
+        list holds, in topological order, the commits reachable only from
+        its own branch. Results are cached by the pair of targets.
+
         :param first_branch: first branch to look for common parent
         :type first_branch: `pygit2.Branch`
         :param second_branch: second branch to look for common parent
@@ -463,38 +1088,58 @@ class Repository(object):
         :rtype: DivergeCommits (namedtuple)
         """
 
-        common_parent = None
-        first_commits = CommitsList()
-        second_commits = CommitsList()
+        first, second = first_branch.target, second_branch.target
 
-        walker = self.walk_branches(GIT_SORT_TOPOLOGICAL, first_branch, second_branch)
+        key = (first, second)
+        diverge_commits = self.diverges.get_if_exists(key)
+        if diverge_commits is not None:
+            return diverge_commits
 
-        for first_commit, second_commit in walker:
-            if first_commit in second_commits or second_commit in first_commits:
-                break
+        first_commits = self._walk_until(first, second)
 
-            if first_commit not in first_commits:
-                first_commits.append(first_commit)
-            if second_commit not in second_commits:
-                second_commits.append(second_commit)
+        base = self._find_boundary(first, first_commits)
+        if base is not None:
+            # the boundary is the merge base and whatever is reachable from
+            # it is reachable from first too, so second's walk stops there
+            second_commits = self._walk_until(second, base)
+        else:
+            second_commits = self._walk_until(second, first)
+            base = self._repo.merge_base(first, second)
 
-            if second_commit.hex == first_commit.hex:
-                break
+        common_parent = self._repo[base] if base is not None else None
+        diverge_commits = DivergeCommits(common_parent, first_commits, second_commits)
+        self.diverges[key] = diverge_commits
 
-        try:
-            index = second_commits.index(first_commit)
-        except ValueError:
-            pass
-        else:
-            second_commits = second_commits[:index]
-            common_parent = first_commit
+        return diverge_commits
 
-        try:
-            index = first_commits.index(second_commit)
-        except ValueError:
-            pass
-        else:
-            first_commits = first_commits[:index]
-            common_parent = second_commit
+    def _find_boundary(self, first, first_commits):
+        """
+        Returns the only commit outside of first's own commits which one of
+        them points to, or None if there are more (or none). Such a commit
+        is reachable from second, so it is their merge base.
+        """
+
+        if not first_commits:
+            return first
+
+        own = set(commit.id for commit in first_commits)
+        boundary = set(
+            parent
+            for commit in first_commits
+            for parent in commit.parent_ids
+            if parent not in own
+        )
+        if len(boundary) == 1:
+            return boundary.pop()
+
+        return None
+
+    def _walk_until(self, include, exclude):
+        commits = CommitsList()
+
+        walker = self._repo.walk(include, GIT_SORT_TOPOLOGICAL)
+        walker.hide(exclude)
+        for commit in walker:
+            commits.append(commit)
 
-        return DivergeCommits(common_parent, first_commits, second_commits)
+        return commits
@@ -18,6 +18,7 @@ import os
 import time
 import shutil
 import inspect
+from collections import namedtuple
 
 from pwd import getpwnam
 from grp import getgrnam
@@ -32,6 +33,120 @@ from gitfs.events import shutting_down, fetch, idle
 from gitfs.log import log
 
 
+OPEN_OPERATIONS = set(["open", "create"])
+FILE_INFO_ARGUMENTS = {
+    "read": 3,
+    "write": 3,
+    "flush": 1,
+    "release": 1,
+    "fsync": 2,
+    "truncate": 2,
+    "getattr": 1,
+    "lock": 1,
+    "ioctl": 3,
+}
+
+Route = namedtuple(
+    "Route",
+    [
+        "regex",
+        "view",
+        "pattern",
+        "anchored",
+        "prefix",
+        "component",
+        "complete",
+        "positional",
+    ],
+)
+
+REGEX_SPECIAL = set(".^$*+?{}[]()|\\")
+REGEX_OPTIONAL = set("*?{")
+
+
+class Dispatcher(object):
+    """
+    Matches paths against the registered routes, compiled once.
+
+    The literal prefix of every anchored route is known upfront, so the
+    routes are grouped by the first path component they can match. A path
+    is only matched against the routes of its first component, in their
+    registration order, and a single match gives both the cache key and
+    the relative path.
+    """
+
+    def __init__(self, routes):
+        self.routes = [self._compile(route) for route in routes]
+
+        # a route with a complete first component only matches the paths
+        # starting with it, the others may match other components too
+        self.default = [route for route in self.routes if not route.complete]
+        self.components = {}
+        for route in self.routes:
+            if route.complete and route.component not in self.components:
+                self.components[route.component] = [
+                    other
+                    for other in self.routes
+                    if self._may_match(other, route.component)
+                ]
+
+    def match(self, path):
+        """
+        Returns the first route matching <path> and its match object, or
+        (None, None).
+        """
+
+        component = path[1:].split("/", 1)[0]
+        for route in self.components.get(component, self.default):
+            if not path.startswith(route.prefix):
+                continue
+
+            if route.anchored:
+                result = route.pattern.match(path)
+            else:
+                result = route.pattern.search(path)
+            if result is not None:
+                return route, result
+
+        return None, None
+
+    def _may_match(self, route, component):
+        if route.complete:
+            return route.component == component
+        return component.startswith(route.component)
+
+    def _compile(self, route):
+        regex = route["regex"]
+        pattern = re.compile(regex)
+        anchored = regex.startswith("^")
+
+        prefix = ""
+        if anchored:
+            for char in regex[1:]:
+                if char in REGEX_SPECIAL:
+                    # a quantifier makes the last literal character optional
+                    if char in REGEX_OPTIONAL:
+                        prefix = prefix[:-1]
+                    break
+                prefix += char
+
+        component, complete = "", False
+        if prefix.startswith("/"):
+            component, slash, _ = prefix[1:].partition("/")
+            complete = bool(slash)
+
+        return Route(
+            regex,
+            route["view"],
+            pattern,
+            anchored,
+            prefix,
+            component,
+            complete,
+            pattern.groups > len(pattern.groupindex),
+        )
+
+
 class Router(object):
     def __init__(
         self,
@@ -65,6 +180,7 @@ class Router(object):
         self.branch = branch
 
         self.routes = []
+        self.dispatcher = Dispatcher(self.routes)
 
         log.info("Cloning into {}".format(self.repo_path))
 
@@ -92,7 +208,11 @@ class Router(object):
 
         self.max_size = kwargs["max_size"]
         self.max_offset = kwargs["max_offset"]
+        self.repo.stream_threshold = kwargs["stream_threshold"]
+        self.repo.hash_threshold = kwargs["hash_threshold"]
+        self.tracer = kwargs["tracer"]
 
+        self.repo.commits.path = kwargs["history_index"]
         self.repo.commits.update()
 
         self.workers = []
@@ -104,6 +224,10 @@ class Router(object):
         log.debug("Done init")
 
     def destroy(self, path):
+        # the released files still being hashed are staged before the sync
+        # worker commits for the last time
+        self.repo.hashers.shutdown(wait=True)
+
         log.debug("Stopping workers")
         shutting_down.set()
         fetch.set()
@@ -112,6 +236,12 @@ class Router(object):
             worker.join()
         log.debug("Workers stopped")
 
+        self.commit_queue.close()
+
+        self.repo.commits.save()
+        self.repo.cat_file.close()
+        if self.tracer is not None:
+            self.tracer.close()
         shutil.rmtree(self.repo_path)
         log.info("Successfully umounted %s", self.mount_path)
 
@@ -134,25 +264,51 @@ class Router(object):
 
         if operation in ["destroy", "init"]:
             view = self
+            path = "/"
         else:
             path = args[0]
             view, relative_path = self.get_view(path)
             args = (relative_path,) + args[1:]
 
-        log.debug("Call %s %s with %r" % (operation, view.__class__.__name__, args))
-
         if not hasattr(view, operation):
-            log.debug("No attribute %s on %s" % (operation, view.__class__.__name__))
+            log.debug("No attribute %s on %s", operation, view.__class__.__name__)
             raise FuseOSError(ENOSYS)
 
+        # fuse is mounted with raw_fi, so the operations on open files get
+        # their fuse_file_info instead of their handle
+        file_info = None
+        if operation in OPEN_OPERATIONS:
+            file_info = args[-1]
+            args = args[:-1]
+            if operation == "open":
+                args += (file_info.flags,)
+        elif operation in FILE_INFO_ARGUMENTS:
+            index = FILE_INFO_ARGUMENTS[operation]
+            if len(args) > index and args[index]:
+                args = args[:index] + (args[index].fh,) + args[index + 1 :]
+
         idle.clear()
-        return getattr(view, operation)(*args)
+        if self.tracer is None or not self.tracer.sample():
+            result = getattr(view, operation)(*args)
+        else:
+            result = self.tracer.trace(
+                view, operation, path, getattr(view, operation), args
+            )
+
+        if file_info is None:
+            return result
+
+        file_info.fh = result
+        file_info.keep_cache = view.keeps_cache(args[0])
+        return 0
 
     def register(self, routes):
         for regex, view in routes:
             log.debug("Registering %s for %s", view, regex)
             self.routes.append({"regex": regex, "view": view})
 
+        self.dispatcher = Dispatcher(self.routes)
+
     def get_view(self, path):
         """
         Try to map a given path to it's specific view.
@@ -164,51 +320,48 @@ class Router(object):
         :rtype: view object, relative path
         """
 
-        for route in self.routes:
-            result = re.search(route["regex"], path)
-            if result is None:
-                continue
+        route, result = self.dispatcher.match(path)
+        if route is None:
+            raise ValueError("Found no view for '{}'".format(path))
 
-            groups = result.groups()
-            relative_path = re.sub(route["regex"], "", path)
-            relative_path = "/" if not relative_path else relative_path
-
-            cache_key = result.group(0)
-            log.debug("Router: Cache key for %s: %s", path, cache_key)
-
-            view = lru_cache.get_if_exists(cache_key)
-            if view is not None:
-                log.debug("Router: Serving %s from cache", path)
-                return view, relative_path
-
-            kwargs = result.groupdict()
-
-            # TODO: move all this to a nice config variable
-            kwargs["repo"] = self.repo
-            kwargs["ignore"] = self.repo.ignore
-            kwargs["repo_path"] = self.repo_path
-            kwargs["mount_path"] = self.mount_path
-            kwargs["regex"] = route["regex"]
-            kwargs["relative_path"] = relative_path
-            kwargs["current_path"] = self.current_path
-            kwargs["history_path"] = self.history_path
-            kwargs["uid"] = self.uid
-            kwargs["gid"] = self.gid
-            kwargs["branch"] = self.branch
-            kwargs["mount_time"] = self.mount_time
-            kwargs["queue"] = self.commit_queue
-            kwargs["max_size"] = self.max_size
-            kwargs["max_offset"] = self.max_offset
-
-            args = set(groups) - set(kwargs.values())
-            view = route["view"](*args, **kwargs)
-
-            lru_cache[cache_key] = view
-            log.debug("Router: Added %s to cache", path)
+        if route.anchored:
+            relative_path = path[result.end() :] or "/"
+        else:
+            relative_path = route.pattern.sub("", path) or "/"
 
+        cache_key = result.group(0)
+        view = lru_cache.get_if_exists(cache_key)
+        if view is not None:
             return view, relative_path
 
-        raise ValueError("Found no view for '{}'".format(path))
+        kwargs = result.groupdict()
+
+        # TODO: move all this to a nice config variable
+        kwargs["repo"] = self.repo
+        kwargs["ignore"] = self.repo.ignore
+        kwargs["repo_path"] = self.repo_path
+        kwargs["mount_path"] = self.mount_path
+        kwargs["regex"] = route.regex
+        kwargs["relative_path"] = relative_path
+        kwargs["current_path"] = self.current_path
+        kwargs["history_path"] = self.history_path
+        kwargs["uid"] = self.uid
+        kwargs["gid"] = self.gid
+        kwargs["branch"] = self.branch
+        kwargs["mount_time"] = self.mount_time
+        kwargs["queue"] = self.commit_queue
+        kwargs["max_size"] = self.max_size
+        kwargs["max_offset"] = self.max_offset
+
+        args = ()
+        if route.positional:
+            args = set(result.groups()) - set(kwargs.values())
+        view = route.view(*args, **kwargs)
+
+        lru_cache[cache_key] = view
+        log.debug("Router: Added %s to cache", path)
+
+        return view, relative_path
 
     def __getattr__(self, attr_name):
         """
@@ -0,0 +1,92 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import itertools
+import time
+from collections import deque, namedtuple
+from threading import Lock
+
+from fuse import FuseOSError
+
+
+Span = namedtuple(
+    "Span", ["start", "duration", "view", "operation", "path_class", "size", "error"],
+)
+
+
+class Tracer(object):
+    """
+    Records a span for every <sample>th of the operations routed by the
+    router: the view and the operation, the first component of the path,
+    how long it took, how many bytes it read or wrote and the errno it
+    failed with. The last <size> spans are kept in a ring buffer and, if
+    <path> is given, appended to that file too.
+
+    The router only asks the tracer to trace an operation when `sample`
+    says so, and it has no tracer at all when tracing is off.
+    """
+
+    def __init__(self, sample=1.0, size=4096, path=None):
+        self.interval = max(1, int(round(1 / sample)))
+        self.counter = itertools.count()
+        self.spans = deque(maxlen=size)
+
+        self.file = open(path, "a") if path else None
+        self.lock = Lock()
+
+    def sample(self):
+        return next(self.counter) % self.interval == 0
+
+    def trace(self, view, operation, path, func, args):
+        start = time.time()
+        size, error = 0, None
+        try:
+            result = func(*args)
+            if isinstance(result, bytes):
+                size = len(result)
+            elif operation == "write":
+                size = result
+            return result
+        except FuseOSError as fuse_error:
+            error = fuse_error.errno
+            raise
+        except (IOError, OSError) as os_error:
+            error = os_error.errno
+            raise
+        finally:
+            self.record(
+                Span(
+                    start,
+                    time.time() - start,
+                    view.__class__.__name__,
+                    operation,
+                    path[1:].split("/", 1)[0],
+                    size,
+                    error,
+                )
+            )
+
+    def record(self, span):
+        self.spans.append(span)
+
+        if self.file is not None:
+            with self.lock:
+                self.file.write("\t".join(str(field) for field in span) + "\n")
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
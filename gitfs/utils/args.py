@@ -14,6 +14,7 @@
 
 
 import getpass
+import hashlib
 import os
 import socket
 import tempfile
@@ -43,22 +44,32 @@ class Args(object):
                 ("ssh_user", (self.get_ssh_user, "string")),
                 ("foreground", (False, "bool")),
                 ("branch", ("master", "string")),
+                ("history_index", (self.get_history_index, "string")),
+                ("commit_journal", (self.get_commit_journal, "string")),
                 ("allow_other", (False, "bool")),
                 ("allow_root", (True, "bool")),
                 ("commiter_name", (self.get_commiter_user, "string")),
                 ("commiter_email", (self.get_commiter_email, "string")),
                 ("max_size", (10, "float")),
+                ("stream_threshold", (32, "float")),
+                ("hash_threshold", (8, "float")),
                 ("fetch_timeout", (30, "float")),
                 ("idle_fetch_timeout", (30 * 60, "float")),  # 30 min
                 ("merge_timeout", (5, "float")),
                 ("debug", (False, "bool")),
                 ("log", ("syslog", "string")),
                 ("log_level", ("warning", "string")),
+                ("trace_sample", (0, "float")),
+                ("trace_size", (4096, "int")),
+                ("trace_file", ("", "string")),
                 ("cache_size", (800, "int")),
                 ("sentry_dsn", (self.get_sentry_dsn, "string")),
                 ("ignore_file", ("", "string")),
                 ("hard_ignore", ("", "string")),
                 ("min_idle_times", (10, "float")),
+                ("commit_max_latency", (0, "float")),
+                ("commit_max_paths", (0, "int")),
+                ("commit_max_size", (0, "float")),
                 ("max_open_files", (-1, "int")),
                 ("history_path", ("history", "string")),
                 ("current_path", ("current", "string")),
@@ -184,6 +195,21 @@ class Args(object):
     def get_repo_path(self, args):
         return tempfile.mkdtemp(dir="/var/lib/gitfs")
 
+    def get_history_index(self, args):
+        return self._get_state_file(args, "history")
+
+    def get_commit_journal(self, args):
+        return self._get_state_file(args, "journal")
+
+    def _get_state_file(self, args, extension):
+        # keep it next to the clone, which is removed on umount, one per
+        # mount point, as the same branch can be mounted more than once
+        key = "{}#{}@{}".format(
+            args.remote_url, args.branch, os.path.abspath(args.mount_point)
+        ).encode("utf-8")
+        name = ".{}.{}".format(hashlib.sha1(key).hexdigest(), extension)
+        return os.path.join(os.path.dirname(os.path.abspath(args.repo_path)), name)
+
     def get_ssh_key(self, args):
         return os.getenv("HOME", "/root/") + "/.ssh/id_rsa"
 
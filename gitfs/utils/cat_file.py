@@ -0,0 +1,126 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import subprocess
+from threading import Lock
+
+
+# the answers to a chunk of size requests fit in a pipe's buffer, so git
+# never blocks on them while it's sent the next requests
+SIZES_CHUNK = 256
+
+
+class CatFile(object):
+    """
+    Reads objects from a repository through `git cat-file`, for what libgit2
+    can only do by inflating the whole object: the size of an object, read
+    from its header, and the content of a blob, as a stream.
+
+    The sizes are looked up by a single `git cat-file --batch-check`
+    process, started on the first lookup and restarted if it dies. Raises
+    `OSError` when git can't be run.
+    """
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self.lock = Lock()
+        self.batch = None
+
+    def size(self, oid):
+        """
+        Returns the size of the object <oid>. Raises `KeyError` if the
+        object is missing.
+        """
+
+        size = self.sizes([oid])[0]
+        if size is None:
+            raise KeyError(oid)
+        return size
+
+    def sizes(self, oids):
+        """
+        Returns the sizes of the objects <oids>, in order, with None for the
+        missing ones. The requests are sent `SIZES_CHUNK` at a time, so a
+        long list takes a few round trips instead of one per object.
+        """
+
+        sizes = []
+        with self.lock:
+            if self.batch is None or self.batch.poll() is not None:
+                self.batch = self._run("--batch-check")
+
+            for start in range(0, len(oids), SIZES_CHUNK):
+                chunk = oids[start : start + SIZES_CHUNK]
+                request = "".join("{}\n".format(oid) for oid in chunk)
+                try:
+                    self.batch.stdin.write(request.encode("ascii"))
+                    self.batch.stdin.flush()
+                    headers = [self.batch.stdout.readline().split() for _ in chunk]
+                except (IOError, OSError, ValueError):
+                    self._stop()
+                    raise OSError("git cat-file exited")
+
+                # "<oid> <type> <size>" or "<oid> missing"
+                for header in headers:
+                    if not header:
+                        self._stop()
+                        raise OSError("git cat-file exited")
+                    sizes.append(int(header[2]) if len(header) == 3 else None)
+
+        return sizes
+
+    def stream(self, oid, chunk_size):
+        """
+        Yields the content of the blob <oid> in chunks of at most
+        <chunk_size> bytes. Only one chunk is held in memory at a time.
+        Raises `KeyError` once the output is over if the blob is missing.
+        """
+
+        process = self._run("blob", str(oid))
+        try:
+            for chunk in iter(lambda: process.stdout.read(chunk_size), b""):
+                yield chunk
+            if process.wait():
+                raise KeyError(oid)
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+
+    def close(self):
+        with self.lock:
+            self._stop()
+
+    def _stop(self):
+        if self.batch is None:
+            return
+
+        batch, self.batch = self.batch, None
+        if batch.poll() is None:
+            batch.kill()
+        batch.stdin.close()
+        batch.stdout.close()
+        batch.wait()
+
+    def _run(self, *args):
+        with open(os.devnull, "r+b") as devnull:
+            return subprocess.Popen(
+                ["git", "--git-dir", self.git_dir, "cat-file"] + list(args),
+                stdin=subprocess.PIPE if args[0].startswith("--") else devnull,
+                stdout=subprocess.PIPE,
+                stderr=devnull,
+            )
@@ -17,9 +17,10 @@ class CommitsList(object):
     def __init__(self, commits=None, hashes=None):
         self.commits = commits or []
         self.hashes = hashes or []
+        self.hashes_set = set(self.hashes)
 
     def __contains__(self, commit):
-        return commit.hex in self.hashes
+        return commit.hex in self.hashes_set
 
     def index(self, commit):
         return self.hashes.index(commit.hex)
@@ -35,6 +36,7 @@ class CommitsList(object):
     def append(self, commit):
         self.commits.append(commit)
         self.hashes.append(commit.hex)
+        self.hashes_set.add(commit.hex)
 
     def __repr__(self):
         return self.commits.__repr__()
@@ -31,9 +31,13 @@ def write_operation(f):
         global writers
         writers += 1
 
-        if syncing.is_set():
+        # a merge waits for the writers in flight, so don't count as one
+        # while waiting for it
+        while syncing.is_set():
+            writers -= 1
             log.debug("WriteOperation: Wait until syncing is done")
             sync_done.wait()
+            writers += 1
 
         try:
             result = f(*args, **kwargs)
@@ -0,0 +1,117 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from threading import Lock
+
+
+ADD = "add"
+REMOVE = "remove"
+HASH = "hash"
+
+
+class DirtyPaths(object):
+    """
+    Paths changed through the mount since they were last committed, each
+    mapped to the change pending for the index: `ADD` (stage it from disk),
+    `REMOVE`, the oid of a blob already written from it or `HASH` while it
+    is hashed after a release (staged from disk unless the hashing finds it
+    unchanged). The views only record changes here. They are applied to the
+    index all at once, right before a commit, so a write never has to touch
+    the index.
+
+    Moved and removed directories are kept apart, in order, as `(old, new)`
+    pairs (`new` is None for a removal), to be applied on the tree instead
+    of file by file.
+    """
+
+    def __init__(self):
+        self.paths = {}
+        self.trees = []
+        self.lock = Lock()
+
+    def add(self, path, oid=None):
+        with self.lock:
+            self.paths[path] = ADD if oid is None else oid
+
+    def remove(self, path):
+        with self.lock:
+            self.paths[path] = REMOVE
+
+    def expect(self, path):
+        """
+        Records that <path> is being hashed, unless a change to it is
+        already pending.
+        """
+
+        with self.lock:
+            self.paths.setdefault(path, HASH)
+
+    def settle(self, path):
+        """
+        Forgets about <path> if it was only being hashed.
+        """
+
+        with self.lock:
+            if self.paths.get(path) == HASH:
+                del self.paths[path]
+
+    def changed(self, path):
+        """
+        Tells whether a change to <path> is pending, not counting its
+        hashing.
+        """
+
+        return self.paths.get(path, HASH) != HASH
+
+    def update(self, add=(), remove=()):
+        with self.lock:
+            for path in remove:
+                self.paths[path] = REMOVE
+            for path in add:
+                self.paths[path] = ADD
+
+    def move(self, old, new=None):
+        """
+        Records the move of the directory <old> to <new>, or its removal if
+        <new> is None. The pending changes from inside <old> follow it, so
+        they are applied after the move.
+        """
+
+        prefix = old + "/"
+        with self.lock:
+            self.trees.append((old, new))
+
+            moved = [path for path in self.paths if path.startswith(prefix)]
+            for path in moved:
+                change = self.paths.pop(path)
+                if new is not None:
+                    self.paths[new + path[len(old) :]] = change
+
+    def drain(self):
+        """
+        Returns the pending directory moves and path changes and starts over
+        with an empty set.
+        """
+
+        with self.lock:
+            trees, self.trees = self.trees, []
+            paths, self.paths = self.paths, {}
+        return trees, paths
+
+    def __contains__(self, path):
+        return path in self.paths
+
+    def __len__(self):
+        return len(self.paths) + len(self.trees)
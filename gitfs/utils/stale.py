@@ -0,0 +1,76 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from threading import Lock
+
+
+STALE_PATHS_LIMIT = 10000
+
+
+class StalePaths(object):
+    """
+    Paths changed on disk behind the kernel's back, by a merge or a checkout,
+    since they were last opened through the mount. The kernel may keep the
+    page cache of a file between opens, except on the first open after it
+    went stale, which drops the cached pages.
+
+    Past <limit> stale paths, every path counts as stale instead, except
+    for the ones opened since then, which are again at most <limit>.
+    """
+
+    def __init__(self, limit=STALE_PATHS_LIMIT):
+        self.limit = limit
+        self.paths = set()
+        self.fresh = None
+        self.lock = Lock()
+
+    def update(self, paths):
+        with self.lock:
+            if self.fresh is not None:
+                self.fresh.difference_update(paths)
+                return
+
+            self.paths.update(paths)
+            if len(self.paths) > self.limit:
+                self.paths = set()
+                self.fresh = set()
+
+    def pop(self, path):
+        """
+        Tells whether <path> was stale and forgets about it, as the caller
+        is about to drop its cached pages.
+        """
+
+        with self.lock:
+            if self.fresh is not None:
+                if path in self.fresh:
+                    return False
+                if len(self.fresh) >= self.limit:
+                    self.fresh.clear()
+                self.fresh.add(path)
+                return True
+
+            if path not in self.paths:
+                return False
+            self.paths.discard(path)
+            return True
+
+    def __contains__(self, path):
+        if self.fresh is not None:
+            return path not in self.fresh
+        return path in self.paths
+
+    def __len__(self):
+        return len(self.paths)
@@ -37,6 +37,9 @@ VALID_FILE_MODES = [
 
 
 class CommitView(ReadOnlyView):
+    # the content of a commit never changes
+    keep_cache = True
+
     def __init__(self, *args, **kwargs):
         super(CommitView, self).__init__(*args, **kwargs)
 
@@ -74,8 +77,7 @@ class CommitView(ReadOnlyView):
         return is_valid
 
     def read(self, path, size, offset, fh):
-        data = self.repo.get_blob_data(self.commit.tree, path)
-        return data[offset : offset + size]
+        return self.repo.read_blob(self.commit.tree, path, size, offset)
 
     def readlink(self, path):
         obj_name = os.path.split(path)[1]
@@ -96,12 +98,8 @@ class CommitView(ReadOnlyView):
         if not path:
             return
 
-        attrs = super(CommitView, self).getattr(path, fh)
-        attrs.update(
-            {"st_ctime": self.commit.commit_time, "st_mtime": self.commit.commit_time}
-        )
-
-        stats = self.repo.get_git_object_default_stats(self.commit.tree, path)
+        attrs = self._commit_attrs(path, fh)
+        stats = self.repo.get_commit_stats(self.commit, path)
         if stats is None:
             raise FuseOSError(ENOENT)
 
@@ -127,6 +125,22 @@ class CommitView(ReadOnlyView):
         if tree_name:
             dir_tree = self.repo.get_git_object(self.commit.tree, path)
 
-        dir_entries = [".", ".."] + [entry.name for entry in dir_tree]
-        for entry in dir_entries:
-            yield entry
+        yield "."
+        yield ".."
+
+        attrs = self._commit_attrs(path, fh)
+        for name, stats in self.repo.list_commit_stats(self.commit, dir_tree, path):
+            if stats is None:
+                yield name
+                continue
+
+            entry_attrs = dict(attrs)
+            entry_attrs.update(stats)
+            yield name, entry_attrs, 0
+
+    def _commit_attrs(self, path, fh=None):
+        attrs = super(CommitView, self).getattr(path, fh)
+        attrs.update(
+            {"st_ctime": self.commit.commit_time, "st_mtime": self.commit.commit_time}
+        )
+        return attrs
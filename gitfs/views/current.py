@@ -29,6 +29,9 @@ from .passthrough import PassthroughView, STATS
 
 
 class CurrentView(PassthroughView):
+    # merges and checkouts mark the paths they change as stale
+    keep_cache = True
+
     def __init__(self, *args, **kwargs):
         super(CurrentView, self).__init__(*args, **kwargs)
         self.dirty = {}
@@ -42,7 +45,10 @@ class CurrentView(PassthroughView):
         result = super(CurrentView, self).rename(old, new)
 
         message = "Rename {} to {}".format(old, new)
-        self._stage(**{"remove": os.path.split(old)[1], "add": new, "message": message})
+        if os.path.isdir(self.repo._full_path(new)):
+            self._stage_tree(message, remove=old, add=new)
+        else:
+            self._stage(remove=old, add=new, message=message)
 
         log.debug("CurrentView: Renamed %s to %s", old, new)
         return result
@@ -99,7 +105,12 @@ class CurrentView(PassthroughView):
             raise FuseOSError(errno.EFBIG)
 
         result = super(CurrentView, self).write(path, buf, offset, fh)
-        self.dirty[fh] = {"message": "Update {}".format(path), "stage": True}
+        size = self.dirty.get(fh, {}).get("size", 0) + len(buf)
+        self.dirty[fh] = {
+            "message": "Update {}".format(path),
+            "stage": True,
+            "size": size,
+        }
 
         log.debug("CurrentView: Wrote %s to %s", len(buf), path)
         return result
@@ -115,7 +126,7 @@ class CurrentView(PassthroughView):
             global writers
             fh = os.open(full_path, os.O_WRONLY | os.O_CREAT)
             writers += 1
-            log.info("CurrentView: Open %s for write", full_path)
+            log.debug("CurrentView: Open %s for write", full_path)
 
             super(CurrentView, self).chmod(keep_path, 0o644)
 
@@ -193,9 +204,12 @@ class CurrentView(PassthroughView):
 
     def open_for_read(self, path, flags):
         full_path = self.repo._full_path(path)
-        log.info("CurrentView: Open %s for read", path)
+        log.debug("CurrentView: Open %s for read", path)
         return os.open(full_path, flags)
 
+    def keeps_cache(self, path):
+        return not self.repo.stale_paths.pop(self.repo._sanitize(path))
+
     def open(self, path, flags):
         write_mode = flags & (os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_CREAT)
         if write_mode:
@@ -211,13 +225,18 @@ class CurrentView(PassthroughView):
         if fh in self.dirty:
             message = self.dirty[fh]["message"]
             should_stage = self.dirty[fh].get("stage", False)
+            size = self.dirty[fh].get("size", 0)
             del self.dirty[fh]
 
-            global writers
-            writers -= 1
             if should_stage:
-                log.debug("CurrentView: Staged %s for commit", path)
-                self._stage(add=path, message=message)
+                # the writer counts until the path is staged, so nothing is
+                # merged or checked out over it in the meantime
+                self._expect(path, size)
+                log.debug("CurrentView: Hashing %s before staging it", path)
+                self.repo.hashers.submit(self._stage_if_changed, path, message, size)
+            else:
+                global writers
+                writers -= 1
 
         log.debug("CurrentView: Release %s", path)
         return os.close(fh)
@@ -229,15 +248,15 @@ class CurrentView(PassthroughView):
 
         # Unlink all the files
         full_path = self.repo._full_path(path)
-        for root, dirs, files in os.walk(full_path):
+        for root, dirs, files in os.walk(full_path, topdown=False):
             for _file in files:
-                deleting_file = os.path.join(root, _file)
-                if os.path.exists(deleting_file):
-                    result = super(CurrentView, self).unlink(os.path.join(path, _file))
-                    self._stage(remove=os.path.join(path, _file), message=message)
+                os.unlink(os.path.join(root, _file))
+            for _dir in dirs:
+                os.rmdir(os.path.join(root, _dir))
 
         # Delete the actual directory
         result = super(CurrentView, self).rmdir("{}/".format(path))
+        self._stage_tree(message, remove=path)
         log.debug("CurrentView: %s", message)
 
         return result
@@ -253,36 +272,72 @@ class CurrentView(PassthroughView):
         log.debug("CurrentView: Deleted %s", path)
         return result
 
-    def _stage(self, message, add=None, remove=None):
-        non_empty = False
+    def _stage(self, message, add=None, remove=None, blob=None, size=0):
+        added, removed = [], []
 
         if remove is not None:
             remove = self._sanitize(remove)
-            if add is not None:
-                add = self._sanitize(add)
-                paths = self._get_files_from_path(add)
-                if paths:
-                    for path in paths:
-                        path = path.replace("{}/".format(add), "{}/".format(remove))
-                        self.repo.index.remove(path)
-                else:
-                    self.repo.index.remove(remove)
-            else:
-                self.repo.index.remove(remove)
-            non_empty = True
+            removed.append(remove)
 
         if add is not None:
             add = self._sanitize(add)
             paths = self._get_files_from_path(add)
             if paths:
-                for path in paths:
-                    self.repo.index.add(path)
+                added.extend(paths)
+            else:
+                added.append(add)
+
+        if added or removed:
+            self.repo.dirty_paths.update(add=added, remove=removed)
+            if blob is not None:
+                self.repo.dirty_paths.add(add, blob)
+            self.queue.commit(add=add, remove=remove, message=message, size=size)
+
+    def _expect(self, path, size):
+        """
+        Marks <path> as dirty and journals it before it's hashed, so a
+        directory move carries it along and a crash doesn't lose it.
+        """
+
+        path = self._sanitize(path)
+        self.repo.dirty_paths.expect(path)
+        self.queue.expect(path, size)
+
+    def _stage_if_changed(self, path, message, size=0):
+        """
+        Runs on the hashing pool, after a release. Files rewritten with the
+        same content are never staged, so they never reach the commit queue.
+        The writer released with the file is only done afterwards.
+        """
+
+        global writers
+        try:
+            oid, written = self.repo.hash_file(path)
+            if self.repo.is_changed(path, oid):
+                log.debug("CurrentView: Staged %s for commit", path)
+                blob = oid if written else None
+                self._stage(add=path, message=message, blob=blob, size=size)
             else:
-                self.repo.index.add(add)
-            non_empty = True
+                log.debug("CurrentView: %s is unchanged, not staging it", path)
+                self.repo.dirty_paths.settle(self._sanitize(path))
+                self.queue.settle(self._sanitize(path))
+        except Exception:
+            log.exception("CurrentView: Can't stage %s", path)
+            self.queue.settle(self._sanitize(path))
+        finally:
+            writers -= 1
+
+    def _stage_tree(self, message, remove, add=None):
+        """
+        Stages the move of the directory <remove> to <add>, or its removal,
+        as a single tree operation.
+        """
+
+        remove = self._sanitize(remove)
+        add = self._sanitize(add)
 
-        if non_empty:
-            self.queue.commit(add=add, remove=remove, message=message)
+        self.repo.dirty_paths.move(remove, add)
+        self.queue.commit(add=add, remove=remove, message=message)
 
     def _get_files_from_path(self, path):
         paths = []
@@ -20,7 +20,6 @@ from errno import ENOENT
 
 from fuse import FuseOSError
 
-from gitfs.log import log
 from gitfs.cache import lru_cache
 
 from .read_only import ReadOnlyView
@@ -39,7 +38,7 @@ class HistoryView(ReadOnlyView):
         the directory, while Linux counts only the subdirectories.
         """
 
-        if path not in self.repo.get_commit_dates() and path != "/":
+        if path != "/" and path not in self.repo.commits:
             raise FuseOSError(ENOENT)
 
         attrs = super(HistoryView, self).getattr(path, fh)
@@ -56,15 +55,12 @@ class HistoryView(ReadOnlyView):
 
     def access(self, path, mode):
         if getattr(self, "date", None):
-            log.info("PATH: %s", path)
             if path == "/":
-                available_dates = self.repo.get_commit_dates()
-                if self.date not in available_dates:
+                if self.date not in self.repo.commits:
                     raise FuseOSError(ENOENT)
             else:
-                commits = self.repo.get_commits_by_date(self.date)
                 dirname = os.path.split(path)[1]
-                if dirname not in commits:
+                if not self.repo.commits.has_commit(self.date, dirname):
                     raise FuseOSError(ENOENT)
         else:
             if path != "/":
@@ -85,7 +81,7 @@ class HistoryView(ReadOnlyView):
         date = getattr(self, "date", None)
 
         if date and date in self.repo.commits:
-            return self.repo.commits[date][index].timestamp
+            return self.repo.commits.get_timestamps(date)[index]
 
         return int(time.time())
 
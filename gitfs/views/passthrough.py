@@ -15,6 +15,7 @@
 
 import fcntl
 import os
+from stat import S_IFDIR, S_IFLNK, S_IFMT, S_IFREG
 
 from fuse import FuseOSError
 from errno import EACCES
@@ -32,6 +33,8 @@ STATS = (
     "st_uid",
 )
 
+HIDDEN_ITEMS = frozenset([".git", ".keep"])
+
 FS_STATS = (
     "f_bavail",
     "f_bfree",
@@ -46,6 +49,42 @@ FS_STATS = (
 )
 
 
+def _entry_type(entry):
+    if entry.is_symlink():
+        return S_IFLNK
+    if entry.is_dir(follow_symlinks=False):
+        return S_IFDIR
+    return S_IFREG
+
+
+def _list_entries(path):
+    """
+    Yields the name and the file type of each entry of <path>, but the
+    hidden ones, from scandir or, before Python 3.5, from listdir and lstat.
+    """
+
+    if not hasattr(os, "scandir"):
+        for name in os.listdir(path):
+            if name in HIDDEN_ITEMS:
+                continue
+            try:
+                status = os.lstat(os.path.join(path, name))
+            except OSError:
+                continue
+            yield name, S_IFMT(status.st_mode)
+        return
+
+    entries = os.scandir(path)
+    try:
+        for entry in entries:
+            if entry.name not in HIDDEN_ITEMS:
+                yield entry.name, _entry_type(entry)
+    finally:
+        # scandir iterators can be closed only since Python 3.6
+        if hasattr(entries, "close"):
+            entries.close()
+
+
 class PassthroughView(View):
     def __init__(self, *args, **kwargs):
         super(PassthroughView, self).__init__(*args, **kwargs)
@@ -79,18 +118,17 @@ class PassthroughView(View):
     def readdir(self, path, fh):
         full_path = self.repo._full_path(path)
 
-        dirents = [".", ".."]
-        hidden_items = [".git", ".keep"]
+        yield "."
+        yield ".."
+
+        # fuse only passes the file type on to the kernel, which scandir
+        # knows without a stat
         if os.path.isdir(full_path):
-            for entry in os.listdir(full_path):
-                if entry not in hidden_items:
-                    dirents.append(entry)
+            for name, mode in _list_entries(full_path):
+                yield name, {"st_mode": mode}, 0
 
         if self.is_current_path_root:
-            dirents.append(self.history_path)
-
-        for directory in dirents:
-            yield directory
+            yield self.history_path
 
     def readlink(self, path):
         pathname = os.readlink(self.repo._full_path(path))
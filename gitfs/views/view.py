@@ -21,12 +21,18 @@ from fuse import Operations, LoggingMixIn
 class View(LoggingMixIn, Operations):
     __metaclass__ = ABCMeta
 
+    # whether the kernel may keep the page cache of a file between opens
+    keep_cache = False
+
     def __init__(self, *args, **kwargs):
         self.args = args
 
         for attr in kwargs:
             setattr(self, attr, kwargs[attr])
 
+    def keeps_cache(self, path):
+        return self.keep_cache
+
     def getattr(self, path, fh=None):
         return {
             "st_uid": self.uid,
@@ -16,3 +16,5 @@
 from .sync import SyncWorker
 from .commit_queue import CommitQueue
 from .fetch import FetchWorker
+from .batching import CommitPolicy
+from .journal import CommitJournal
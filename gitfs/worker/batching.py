@@ -0,0 +1,99 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import time
+from collections import namedtuple
+
+
+BatchInfo = namedtuple(
+    "BatchInfo", ["batches", "paths", "last_paths", "last_lag", "max_lag"]
+)
+
+
+class CommitPolicy(object):
+    """
+    Decides when the changes pending in a `CommitQueue` are committed: as
+    soon as the oldest one waited `max_latency` seconds, or they touch
+    `max_paths` paths or `max_bytes` written bytes, whichever comes first,
+    and always once the queue is full. A limit of 0 turns it off. Without
+    any limit, the changes are committed only once the queue goes quiet.
+    """
+
+    def __init__(self, max_latency=0, max_paths=0, max_bytes=0):
+        self.max_latency = max_latency
+        self.max_paths = max_paths
+        self.max_bytes = max_bytes
+
+        self.started = None
+
+        self.batches = 0
+        self.total_paths = 0
+        self.last_paths = 0
+        self.last_lag = 0
+        self.max_lag = 0
+
+    def add(self, job):
+        """
+        Records a job taken from the queue into the batch being committed.
+        """
+
+        started = job.get("started") or time.time()
+        if self.started is None or started < self.started:
+            self.started = started
+
+    def due(self, queue):
+        if queue.started is None:
+            return False
+
+        if queue.full:
+            return True
+        if self.max_latency and time.time() - queue.started >= self.max_latency:
+            return True
+        if self.max_paths and queue.pending_paths >= self.max_paths:
+            return True
+        return bool(self.max_bytes) and queue.pending_bytes >= self.max_bytes
+
+    def timeout(self, default, queue):
+        """
+        Returns how long to wait for the next change, so the pending ones
+        don't wait past the latency limit.
+        """
+
+        if queue.started is None or not self.max_latency:
+            return default
+
+        remaining = queue.started + self.max_latency - time.time()
+        return max(min(default, remaining), 0)
+
+    def committed(self, paths):
+        """
+        Records a committed batch of <paths> paths and starts a new one.
+        """
+
+        if self.started is not None:
+            lag = time.time() - self.started
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+
+        self.batches += 1
+        self.total_paths += paths
+        self.last_paths = paths
+
+        self.started = None
+
+    def batch_info(self):
+        return BatchInfo(
+            self.batches, self.total_paths, self.last_paths, self.last_lag, self.max_lag
+        )
@@ -12,11 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from six.moves.queue import Queue
+import os
+import time
+from collections import OrderedDict
+from threading import Condition
+
+from six import iteritems
+from six.moves.queue import Empty, Queue
 
 from gitfs.log import log
 
 
+MAX_PENDING_PATHS = 10000
+
+
 class BaseQueue(object):
     def __init__(self):
         self.queue = Queue()
@@ -29,10 +38,53 @@ class BaseQueue(object):
 
 
 class CommitQueue(BaseQueue):
+    """
+    Coalesces the commit jobs by path, until the sync worker takes them.
+
+    Each pending path is kept as a single record, the size written to it,
+    or None if it was removed, so the last change to a path wins and a file
+    written a thousand times costs one entry. The sync worker only `wait`s
+    for changes and leaves them here until its `CommitPolicy` is due, which
+    it always is past <max_paths> pending paths. `get` then returns all of
+    them as one job.
+
+    With a `CommitJournal`, every change is journaled before `commit`
+    returns and `restore` brings back the changes a crash left behind. The
+    files still being hashed after a release are journaled too, through
+    `expect`, until they are either committed or `settle`d.
+    """
+
+    def __init__(self, journal=None, max_paths=MAX_PENDING_PATHS):
+        self.journal = journal
+        self.max_paths = max_paths
+        self.pending = OrderedDict()
+        self.expected = {}
+        self.pending_bytes = 0
+        self.started = None
+        self.messages = 0
+        self.message = None
+        self.changes = 0
+        self.seen = 0
+        self.condition = Condition()
+
+    @property
+    def pending_paths(self):
+        return len(self.pending)
+
+    @property
+    def full(self):
+        return bool(self.max_paths) and len(self.pending) >= self.max_paths
+
     def add(self, job):
-        self.queue.put(job)
+        params = job["params"]
+        self.commit(
+            add=params.get("add"),
+            remove=params.get("remove"),
+            message=params.get("message"),
+            size=params.get("size", 0),
+        )
 
-    def commit(self, add=None, message=None, remove=None):
+    def commit(self, add=None, message=None, remove=None, size=0):
         if message is None:
             raise ValueError("Message should not be None")
 
@@ -40,18 +92,164 @@ class CommitQueue(BaseQueue):
             message = "You need to add or to remove some files from/to index"
             raise ValueError(message)
 
-        self.queue.put(
-            {
-                "type": "commit",
-                "params": {
-                    "add": self._to_list(add),
-                    "message": message,
-                    "remove": self._to_list(remove),
-                },
-            }
-        )
+        ticket = None
+        with self.condition:
+            for path in self._to_list(remove):
+                ticket = self._record(path, None)
+            for path in self._to_list(add):
+                ticket = self._record(path, size)
+
+            self.messages += 1
+            self.message = message
+            self.changes += 1
+            self.condition.notify()
+
+        if ticket is not None:
+            self.journal.sync(ticket)
         log.debug("Got a new commit job on queue")
 
+    def expect(self, path, size=0):
+        """
+        Journals a change to <path> which isn't queued yet.
+        """
+
+        if self.journal is None:
+            return
+
+        with self.condition:
+            self.expected[path] = size
+            ticket = self.journal.append(path, size)
+
+        self.journal.sync(ticket)
+
+    def settle(self, path):
+        """
+        Drops the change to <path> journaled by `expect`.
+        """
+
+        with self.condition:
+            self.expected.pop(path, None)
+
+    def restore(self, repository):
+        """
+        Replays the changes left in the journal on <repository> and queues
+        them, then starts journaling the changes made in its working tree.
+        """
+
+        if self.journal is None:
+            return
+
+        workdir, records = self.journal.load()
+        if records and (workdir is None or not os.path.isdir(workdir)):
+            # only part of the changes could be replayed, like the removal
+            # without the addition of a move, so none of them are
+            log.warning("Discard %d pending changes, %s is gone", len(records), workdir)
+        elif records:
+            log.info("Restore %d pending changes from the journal", len(records))
+            repository.restore_paths(workdir, records)
+
+            with self.condition:
+                for path, size in iteritems(records):
+                    self._record(path, size, journal=False)
+                self.messages += 1
+                self.message = "Restore {} items".format(len(records))
+                self.changes += 1
+                self.condition.notify()
+
+        with self.condition:
+            self.journal.open(repository._repo.workdir, iteritems(self.pending))
+
+    def compact(self):
+        """
+        Drops the committed changes from the journal. Only the ones still
+        waiting in the queue are kept.
+        """
+
+        if self.journal is None:
+            return
+
+        with self.condition:
+            records = list(iteritems(self.pending))
+            records.extend(
+                (path, size)
+                for path, size in iteritems(self.expected)
+                if path not in self.pending
+            )
+            self.journal.rewrite(records)
+
+    def close(self):
+        """
+        Compacts and closes the journal, on umount.
+        """
+
+        if self.journal is None:
+            return
+
+        self.compact()
+        self.journal.close()
+
+    def wait(self, timeout=None):
+        """
+        Waits up to <timeout> seconds for a change to be queued.
+
+        :returns: whether a change was queued since the last call
+        """
+
+        with self.condition:
+            if self.changes == self.seen:
+                self.condition.wait(timeout)
+
+            changed = self.changes != self.seen
+            self.seen = self.changes
+            return changed
+
+    def get(self, block=True, timeout=None):
+        with self.condition:
+            if block and timeout is None:
+                while not self.pending:
+                    self.condition.wait()
+            elif block:
+                deadline = time.time() + timeout
+                while not self.pending:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+            if not self.pending:
+                raise Empty()
+
+            pending, self.pending = self.pending, OrderedDict()
+            messages, self.messages = self.messages, 0
+            message, self.message = self.message, None
+            size, self.pending_bytes = self.pending_bytes, 0
+            started, self.started = self.started, None
+
+        add, remove = [], []
+        for path, written in iteritems(pending):
+            (remove if written is None else add).append(path)
+
+        if messages > 1:
+            message = describe(len(pending), len(add), len(remove))
+
+        return {
+            "type": "commit",
+            "params": {"add": add, "message": message, "remove": remove, "size": size},
+            "started": started,
+        }
+
+    def _record(self, path, size, journal=True):
+        if not self.pending:
+            self.started = time.time()
+
+        self.expected.pop(path, None)
+        self.pending_bytes -= self.pending.pop(path, None) or 0
+        self.pending[path] = size
+        self.pending_bytes += size or 0
+
+        if journal and self.journal is not None:
+            return self.journal.append(path, size)
+
     def _to_list(self, variable):
         variable = variable or []
 
@@ -59,3 +257,12 @@ class CommitQueue(BaseQueue):
             variable = [variable]
 
         return variable
+
+
+def describe(updates, additions, removals):
+    message = "Update {} items. ".format(updates)
+    if additions:
+        message += "Added {} items. ".format(additions)
+    if removals:
+        message += "Removed {} items. ".format(removals)
+    return message.strip()
@@ -0,0 +1,136 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import os
+from collections import OrderedDict
+from threading import Lock
+
+from gitfs.log import log
+
+
+JOURNAL_MAGIC = "gitfs-journal-1\n"
+
+
+class CommitJournal(object):
+    """
+    Append-only journal of the changes waiting in the commit queue, so they
+    survive a crash. The first record is the working tree the changes were
+    made in, each of the next ones a `[path, size]` pair, with a None size
+    for a removal. A torn record, left by a crash, is ignored.
+
+    Appends are only flushed. `sync` makes them durable and a single fsync
+    covers all the records appended by the threads waiting for it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.workdir = None
+        self.file = None
+
+        self.written = 0
+        self.synced = 0
+        self.lock = Lock()
+        self.sync_lock = Lock()
+
+    def load(self):
+        """
+        Returns the working tree and the pending changes from the journal,
+        last change to a path first, or (None, {}) if there's no valid
+        journal.
+        """
+
+        records = OrderedDict()
+        if not os.path.exists(self.path):
+            return None, records
+
+        try:
+            with open(self.path) as journal:
+                if journal.readline() != JOURNAL_MAGIC:
+                    log.warning("CommitJournal: Ignoring invalid journal %s", self.path)
+                    return None, records
+
+                workdir = json.loads(journal.readline())
+                for line in journal:
+                    try:
+                        path, size = json.loads(line)
+                    except ValueError:
+                        log.warning("CommitJournal: Skip a torn record")
+                        continue
+                    records.pop(path, None)
+                    records[path] = size
+        except (IOError, OSError, ValueError):
+            log.warning("CommitJournal: Can't read the journal %s", self.path)
+            return None, OrderedDict()
+
+        return workdir, records
+
+    def open(self, workdir, records=()):
+        """
+        Starts a journal of the changes made in <workdir> with the pending
+        <records>, replacing the old one atomically.
+        """
+
+        self.workdir = workdir
+        self.rewrite(records)
+
+    def rewrite(self, records):
+        """
+        Compacts the journal down to the given (path, size) records.
+        """
+
+        partial = "{}.partial".format(self.path)
+        with self.sync_lock, self.lock:
+            with open(partial, "w") as journal:
+                journal.write(JOURNAL_MAGIC)
+                journal.write(json.dumps(self.workdir) + "\n")
+                for record in records:
+                    journal.write(json.dumps(list(record)) + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+            os.rename(partial, self.path)
+
+            if self.file is not None:
+                self.file.close()
+            self.file = open(self.path, "a")
+            self.synced = self.written
+
+    def append(self, path, size):
+        """
+        Appends a record and returns the ticket to `sync` it with.
+        """
+
+        with self.lock:
+            self.file.write(json.dumps([path, size]) + "\n")
+            self.file.flush()
+            self.written += 1
+            return self.written
+
+    def sync(self, ticket):
+        with self.sync_lock:
+            if self.synced >= ticket:
+                return
+
+            with self.lock:
+                written = self.written
+                fileno = self.file.fileno()
+            os.fsync(fileno)
+            self.synced = written
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -13,11 +13,13 @@
 # limitations under the License.
 import random
 import time
+from contextlib import contextmanager
 
-import pygit2
 from six.moves.queue import Empty
 
 from gitfs.worker.peasant import Peasant
+from gitfs.worker.batching import CommitPolicy
+from gitfs.worker.commit_queue import describe
 from gitfs.merges import AcceptMine
 
 from gitfs.events import (
@@ -33,6 +35,9 @@ from gitfs.events import (
 from gitfs.log import log
 
 
+WRITERS_POLL = 0.01
+
+
 class SyncWorker(Peasant):
     name = "SyncWorker"
 
@@ -43,6 +48,7 @@ class SyncWorker(Peasant):
         commiter_name,
         commiter_email,
         strategy=None,
+        policy=None,
         *args,
         **kwargs
     ):
@@ -58,24 +64,25 @@ class SyncWorker(Peasant):
             repo_path=self.repo_path,
         )
         self.strategy = strategy
+        self.policy = policy or CommitPolicy()
         self.commits = []
+        self.avoided_checkouts = 0
 
     def work(self):
         idle_times = 0
         while True:
             if shutting_down.is_set():
                 log.info("Stop sync worker")
+                self.flush()
                 break
 
-            try:
-                job = self.commit_queue.get(timeout=self.timeout, block=True)
-                if job["type"] == "commit":
-                    self.commits.append(job)
+            timeout = self.policy.timeout(self.timeout, self.commit_queue)
+            if self.commit_queue.wait(timeout):
                 log.debug("Got a commit job")
 
                 idle_times = 0
                 idle.clear()
-            except Empty:
+            elif not self.policy.due(self.commit_queue):
                 log.debug("Nothing to do right now, going idle")
 
                 if idle_times > self.min_idle_times:
@@ -83,25 +90,25 @@ class SyncWorker(Peasant):
 
                 idle_times += 1
                 self.on_idle()
+                continue
+
+            if self.policy.due(self.commit_queue):
+                self.take_jobs()
+                log.info("Commit a batch of %d jobs", len(self.commits))
+                self.commit(self.commits)
+                self.commits = []
 
     def on_idle(self):
         """
-        On idle, we have 4 cases:
-        1. We have to commit and also need to merge some commits from remote.
-        In this case, we commit and announce ourself for merging
-        2. We are behind from remote, so we announce for merging
-        3. We only need to commit
-        4. We announced for merging and nobody is writing in this momement.
-        In this case we are safe to merge and push.
+        On idle, with no write in flight, the pending commits are committed
+        and we sync with the remote: we merge if we are behind and push if
+        we are ahead. The writes are blocked only while a merge is applied
+        (see `merging`). Only this worker moves the branch, so a push never
+        races with a commit.
         """
 
-        if not syncing.is_set():
-            log.debug("Set syncing event (%d pending writes)", writers.value)
-            syncing.set()
-        else:
-            log.debug("Idling (%d pending writes)", writers.value)
-
         if writers.value == 0:
+            self.take_jobs()
             if self.commits:
                 log.info("Get some commits")
                 self.commit(self.commits)
@@ -121,6 +128,64 @@ class SyncWorker(Peasant):
 
             if count >= 5:
                 log.error("Didn't manage to sync, I need some help")
+        else:
+            log.debug("Idling (%d pending writes)", writers.value)
+
+    @contextmanager
+    def merging(self):
+        """
+        Blocks the writes while a merge is applied to the working tree. The
+        writes in flight are waited for and committed first, so the merge
+        doesn't overwrite them.
+        """
+
+        log.debug("Set syncing event (%d pending writes)", writers.value)
+        sync_done.clear()
+        syncing.set()
+        try:
+            while writers.value > 0:
+                time.sleep(WRITERS_POLL)
+
+            self.take_jobs()
+            if self.commits:
+                log.info("Commit the pending jobs before merging")
+                self.commit(self.commits)
+                self.commits = []
+
+            yield
+        finally:
+            log.debug("Clear syncing")
+            syncing.clear()
+            sync_done.set()
+
+    def flush(self):
+        """
+        Commits and pushes the pending jobs, before the clone is removed on
+        umount.
+        """
+
+        try:
+            self.take_jobs()
+            if self.commits:
+                log.info("Commit the pending jobs before stopping")
+                self.commit(self.commits)
+                self.commits = []
+
+            if not self.sync():
+                log.error("Couldn't push the pending changes before stopping")
+        except Exception:
+            log.exception("Couldn't flush the pending changes")
+
+    def take_jobs(self):
+        while True:
+            try:
+                job = self.commit_queue.get(block=False)
+            except Empty:
+                return
+
+            if job["type"] == "commit":
+                self.commits.append(job)
+                self.policy.add(job)
 
     def merge(self):
         log.debug("Start merging")
@@ -135,7 +200,6 @@ class SyncWorker(Peasant):
     def sync(self):
         log.debug("Check if I'm ahead")
         need_to_push = self.repository.ahead(self.upstream, self.branch)
-        sync_done.clear()
 
         if self.repository.behind:
             log.debug("I'm behind so I start merging")
@@ -143,8 +207,9 @@ class SyncWorker(Peasant):
                 log.debug("Start fetching")
                 self.repository.fetch(self.upstream, self.branch, self.credentials)
                 log.debug("Done fetching")
-                log.debug("Start merging")
-                self.merge()
+                with self.merging():
+                    log.debug("Start merging")
+                    self.merge()
                 log.debug("Merge done with success, ready to push")
                 need_to_push = True
             except:
@@ -158,10 +223,6 @@ class SyncWorker(Peasant):
                     self.repository.push(self.upstream, self.branch, self.credentials)
                     self.repository.behind = False
                     log.info("Push done")
-                log.debug("Clear syncing")
-                syncing.clear()
-                log.debug("Set sync_done")
-                sync_done.set()
                 log.debug("Set push_successful")
                 push_successful.set()
             except Exception as error:
@@ -170,9 +231,7 @@ class SyncWorker(Peasant):
                 log.debug("Push failed because of %s", error)
                 return False
         else:
-            log.debug("Sync done, clearing")
-            sync_done.set()
-            syncing.clear()
+            log.debug("Sync done, nothing to push")
 
         return True
 
@@ -189,15 +248,16 @@ class SyncWorker(Peasant):
                 number_of_removal += len(removal_set)
                 number_of_additions += len(addition_set)
                 updates = updates | removal_set | addition_set
-            message = "Update {} items. ".format(len(updates))
-            if number_of_additions:
-                message += "Added {} items. ".format(number_of_additions)
-            if number_of_removal:
-                message += "Removed {} items. ".format(number_of_removal)
-            message = message.strip()
+            message = describe(len(updates), number_of_additions, number_of_removal)
+
+        paths = self.repository.stage()
+        log.debug("Staged %d paths", len(paths))
+        self.policy.committed(len(paths))
 
         old_head = self.repository.head.target
-        new_commit = self.repository.commit(message, self.author, self.commiter)
+        new_commit = None
+        if paths:
+            new_commit = self.repository.commit(message, self.author, self.commiter)
 
         if new_commit:
             log.debug(
@@ -212,5 +272,14 @@ class SyncWorker(Peasant):
             self.repository.create_reference(
                 "refs/heads/%s" % self.branch, old_head, force=True
             )
-        self.repository.checkout_head(strategy=pygit2.GIT_CHECKOUT_FORCE)
-        log.debug("Checkout to HEAD")
+
+        # the working tree already holds what was staged, and whatever was
+        # written since then is kept for the next commit
+        checked_out = self.repository.reconcile_paths(paths)
+        if checked_out:
+            log.debug("Checkout %d paths from HEAD", len(checked_out))
+        else:
+            self.avoided_checkouts += 1
+            log.debug("Working tree matches HEAD, skipping the checkout")
+
+        self.commit_queue.compact()
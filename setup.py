@@ -11,7 +11,7 @@ setup(
     author="Presslabs",
     author_email="gitfs@presslabs.com",
     url="http://www.presslabs.com/gitfs/",
-    packages=find_packages(exclude=["tests", "tests.*"]),
+    packages=find_packages(exclude=["tests", "tests.*", "benchmarks"]),
     entry_points={"console_scripts": ["gitfs = gitfs:mount"]},
     zip_safe=False,
     include_package_data=True,
@@ -0,0 +1,150 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import threading
+
+from mock import MagicMock
+
+from gitfs.cache.blobs import BlobCache, BlobStream
+
+
+class TestBlobCache(object):
+    def test_get_returns_a_shared_view(self):
+        load = MagicMock(return_value=b"some data")
+        cache = BlobCache(100)
+
+        view = cache.get("oid", load)
+
+        assert isinstance(view, memoryview)
+        assert view[5:].tobytes() == b"data"
+        assert cache.get("oid", load) is view
+        load.assert_called_once_with("oid")
+        assert cache.cache_info() == (1, 1, 100, 9)
+
+    def test_evicts_by_size(self):
+        cache = BlobCache(10)
+
+        cache.get("first", lambda oid: b"12345")
+        cache.get("second", lambda oid: b"12345")
+        cache.get("third", lambda oid: b"12345")
+
+        assert "first" not in cache.blobs
+        assert "second" in cache.blobs
+        assert "third" in cache.blobs
+        assert cache.blobs.currsize == 10
+
+    def test_too_large_blobs_are_not_kept(self):
+        cache = BlobCache(4)
+
+        assert cache.get("oid", lambda oid: b"12345").tobytes() == b"12345"
+        assert "oid" not in cache.blobs
+
+    def test_concurrent_readers_share_one_load(self):
+        loading = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def load(oid):
+            calls.append(oid)
+            loading.set()
+            release.wait()
+            return b"some data"
+
+        cache = BlobCache(100)
+        results = []
+
+        def reader():
+            results.append(cache.get("oid", load))
+
+        first = threading.Thread(target=reader)
+        first.start()
+        loading.wait()
+
+        second = threading.Thread(target=reader)
+        second.start()
+        release.set()
+
+        first.join()
+        second.join()
+
+        assert calls == ["oid"]
+        assert results[0] is results[1]
+        assert cache.pending == {}
+
+    def test_failed_load_is_not_kept(self):
+        cache = BlobCache(100)
+        load = MagicMock(side_effect=[KeyError, b"data"])
+
+        try:
+            cache.get("oid", load)
+        except KeyError:
+            pass
+
+        assert cache.pending == {}
+        assert cache.get("oid", load).tobytes() == b"data"
+
+
+class TestBlobStream(object):
+    def get_stream(self, content, chunk_size=4, window_size=4):
+        self.restarts = 0
+
+        def chunks():
+            self.restarts += 1
+            for start in range(0, len(content), chunk_size):
+                yield content[start : start + chunk_size]
+
+        return BlobStream(chunks, len(content), window_size=window_size)
+
+    def test_sequential_reads_keep_a_bounded_window(self):
+        content = b"".join(b"%03d" % number for number in range(100))
+        stream = self.get_stream(content)
+
+        data = b"".join(stream.read(5, offset) for offset in range(0, 300, 5))
+
+        assert data == content
+        assert stream.sequential
+        assert stream.spill is None
+        assert len(stream.window) <= 2 * stream.window_size + 4
+        assert self.restarts == 1
+
+    def test_read_past_the_end(self):
+        stream = self.get_stream(b"some data")
+
+        assert stream.read(100, 5) == b"data"
+        assert stream.read(100, 9) == b""
+        assert stream.read(100, 50) == b""
+
+    def test_backward_read_switches_to_spill_file(self):
+        content = b"".join(b"%03d" % number for number in range(100))
+        stream = self.get_stream(content)
+
+        assert stream.read(3, 270) == b"090"
+        assert stream.read(3, 0) == b"000"
+
+        assert not stream.sequential
+        assert self.restarts == 2
+        assert stream.position < len(content)
+
+        assert stream.read(6, 150) == b"050051"
+        assert stream.read(3, 3) == b"001"
+        assert stream.read(3, 297) == b"099"
+        assert self.restarts == 2
+
+    def test_shorter_blob_than_announced(self):
+        stream = BlobStream(lambda: iter([b"some"]), 10)
+
+        assert stream.read(10, 0) == b"some"
+        assert stream.read(10, 4) == b""
+        assert stream.size == 4
@@ -13,48 +13,253 @@
 # limitations under the License.
 
 
+import struct
 from datetime import datetime
 
-from mock import MagicMock, call
+from mock import MagicMock, call, patch
 
-from pygit2 import GIT_SORT_TIME
+from pygit2 import GIT_SORT_TIME, Oid
 
-from gitfs.cache.commits import Commit, CommitCache
+from gitfs.cache.commits import INDEX_MAGIC, CommitCache, CommitIndex
 
 
-class TestCommit(object):
-    def test_commit(self):
-        commit = Commit(1, 1, 1)
-        new_commit = Commit(2, 2, "21111111111")
+def get_commit(timestamp, hex):
+    return MagicMock(commit_time=timestamp, id=Oid(hex=hex))
 
-        assert new_commit > commit
-        assert repr(new_commit) == "2-2111111111"
+
+def get_name(timestamp, hex):
+    commit_time = datetime.fromtimestamp(timestamp).strftime("%H-%M-%S")
+    return "{}-{}".format(commit_time, hex[:10])
+
+
+def raw(hex):
+    return Oid(hex=hex).raw
+
+
+class TestCommitIndex(object):
+    def test_build(self):
+        index = CommitIndex.build(
+            [
+                (1411300000, raw("3" * 40)),
+                (1411135060, raw("2" * 40)),
+                (1411135000, raw("1" * 40)),
+            ]
+        )
+
+        assert index.names == ["2014-09-19", "2014-09-21"]
+        assert list(index.timestamps) == [1411135000, 1411135060, 1411300000]
+        assert index.oids == raw("1" * 40) + raw("2" * 40) + raw("3" * 40)
+        assert list(index.get_timestamps("2014-09-19")) == [1411135000, 1411135060]
+        assert index.get_commits("2014-09-21") == [get_name(1411300000, "3" * 40)]
+
+    def test_has_commit(self):
+        index = CommitIndex.build([(1411135000, raw("1" * 40))])
+        name = get_name(1411135000, "1" * 40)
+
+        assert index.has_commit("2014-09-19", name)
+        assert not index.has_commit("2014-09-20", name)
+        assert not index.has_commit("2014-09-19", "00-00-00-1111111111")
+        assert not index.has_commit("2014-09-19", "00-00-00-2222222222")
+        assert not index.has_commit("2014-09-19", "not-a-commit")
+
+    def test_apply(self):
+        index = CommitIndex.build(
+            [(1411135000, raw("1" * 40)), (1411135060, raw("2" * 40))]
+        )
+
+        new_index = index.apply(
+            [(1411300000, raw("3" * 40))], [(1411135060, raw("2" * 40))]
+        )
+
+        assert new_index.names == ["2014-09-19", "2014-09-21"]
+        assert list(new_index.starts) == [0, 1]
+        assert new_index.oids == raw("1" * 40) + raw("3" * 40)
+        assert index.oids == raw("1" * 40) + raw("2" * 40)
+
+    def test_apply_keeps_the_days_before_the_first_change(self):
+        index = CommitIndex.build(
+            [(1411135000, raw("1" * 40)), (1411300000, raw("3" * 40))]
+        )
+
+        with patch("gitfs.cache.commits._split_days") as mocked_split:
+            index.apply([(1411300060, raw("4" * 40))], [])
+
+        starts, names = mocked_split.call_args[0][1:3]
+        assert list(starts) == [0]
+        assert names == ["2014-09-19"]
+        assert mocked_split.call_args[0][3] == 1
+
+    def test_apply_without_changes(self):
+        index = CommitIndex.build([(1411135000, raw("1" * 40))])
+
+        assert index.apply([], [(1411135000, raw("2" * 40))]) is index
 
 
 class TestCommitCache(object):
     def test_cache(self):
         mocked_repo = MagicMock()
-        mocked_commit = MagicMock()
 
         mocked_repo.lookup_reference().resolve().target = "head"
-        mocked_repo.walk.return_value = [mocked_commit]
-        mocked_commit.commit_time = 1411135000
-        mocked_commit.hex = "1111111111"
+        mocked_repo.walk.return_value = [get_commit(1411135000, "1" * 40)]
 
         cache = CommitCache(mocked_repo)
         cache.update()
 
-        cache["2014-09-20"] = Commit(1, 1, "1111111111")
-        assert sorted(cache.keys()) == ["2014-09-19", "2014-09-20"]
-        asserted_time = datetime.fromtimestamp(mocked_commit.commit_time)
-        asserted_time = "{}-{}-{}".format(
-            asserted_time.hour, asserted_time.minute, asserted_time.second
-        )
-        assert repr(cache["2014-09-19"]) == "[%s-1111111111]" % asserted_time
-        del cache["2014-09-20"]
-        for commit_date in cache:
-            assert commit_date == "2014-09-19"
+        assert cache.keys() == ["2014-09-19"]
+        assert list(cache) == ["2014-09-19"]
+        assert "2014-09-19" in cache
+        assert "2014-09-20" not in cache
+        assert len(cache) == 1
+        assert cache.get_commits("2014-09-19") == [get_name(1411135000, "1" * 40)]
 
         mocked_repo.lookup_reference.has_calls([call("HEAD")])
         mocked_repo.walk.assert_called_once_with("head", GIT_SORT_TIME)
         assert mocked_repo.lookup_reference().resolve.call_count == 2
+
+    def test_update_with_same_head(self):
+        mocked_repo = MagicMock()
+        mocked_repo.lookup_reference().resolve().target = "head"
+        mocked_repo.walk.return_value = [get_commit(1411135000, "1" * 40)]
+
+        cache = CommitCache(mocked_repo)
+        cache.update()
+        cache.update()
+
+        assert mocked_repo.walk.call_count == 1
+
+    def test_update_walks_only_new_commits(self):
+        first = get_commit(1411135000, "1" * 40)
+        second = get_commit(1411135060, "2" * 40)
+
+        mocked_repo = MagicMock()
+        mocked_repo.lookup_reference().resolve().target = "first"
+        mocked_repo.walk.return_value = [first]
+
+        cache = CommitCache(mocked_repo)
+        cache.update()
+
+        added = MagicMock(__iter__=lambda self: iter([second]))
+        removed = MagicMock(__iter__=lambda self: iter([]))
+        mocked_repo.walk.side_effect = [added, removed]
+        mocked_repo.lookup_reference().resolve().target = "second"
+        cache.update()
+
+        assert cache.head == "second"
+        assert cache.get_commits("2014-09-19") == [
+            get_name(1411135000, "1" * 40),
+            get_name(1411135060, "2" * 40),
+        ]
+        mocked_repo.walk.assert_any_call("second", GIT_SORT_TIME)
+        added.hide.assert_called_once_with("first")
+        removed.hide.assert_called_once_with("second")
+
+    def test_update_after_a_non_fast_forward_move(self):
+        first = get_commit(1411135000, "1" * 40)
+        second = get_commit(1411135060, "2" * 40)
+        other = get_commit(1411300000, "3" * 40)
+
+        mocked_repo = MagicMock()
+        mocked_repo.lookup_reference().resolve().target = "second"
+        mocked_repo.walk.return_value = [first, second]
+
+        cache = CommitCache(mocked_repo)
+        cache.update()
+
+        added = MagicMock(__iter__=lambda self: iter([other]))
+        removed = MagicMock(__iter__=lambda self: iter([second]))
+        mocked_repo.walk.side_effect = [added, removed]
+        mocked_repo.lookup_reference().resolve().target = "other"
+        cache.update()
+
+        assert cache.keys() == ["2014-09-19", "2014-09-21"]
+        assert cache.get_commits("2014-09-19") == [get_name(1411135000, "1" * 40)]
+        assert cache.get_commits("2014-09-21") == [get_name(1411300000, "3" * 40)]
+        added.hide.assert_called_once_with("second")
+        removed.hide.assert_called_once_with("other")
+
+    def test_update_drops_empty_dates(self):
+        first = get_commit(1411135000, "1" * 40)
+        other = get_commit(1411300000, "3" * 40)
+
+        mocked_repo = MagicMock()
+        mocked_repo.lookup_reference().resolve().target = "first"
+        mocked_repo.walk.return_value = [first]
+
+        cache = CommitCache(mocked_repo)
+        cache.update()
+
+        added = MagicMock(__iter__=lambda self: iter([other]))
+        removed = MagicMock(__iter__=lambda self: iter([first]))
+        mocked_repo.walk.side_effect = [added, removed]
+        mocked_repo.lookup_reference().resolve().target = "other"
+        cache.update()
+
+        assert cache.keys() == ["2014-09-21"]
+
+    def test_save_and_load(self, tmpdir):
+        head = Oid(hex="a" * 40)
+        path = str(tmpdir.join("history"))
+
+        mocked_repo = MagicMock()
+        mocked_repo.lookup_reference().resolve().target = head
+        mocked_repo.walk.return_value = [
+            get_commit(1411135000, "1" * 40),
+            get_commit(1411300000, "3" * 40),
+        ]
+
+        cache = CommitCache(mocked_repo, path)
+        cache.update()
+
+        assert tmpdir.join("history").check()
+        assert not tmpdir.join("history.partial").check()
+
+        data = tmpdir.join("history").read(mode="rb")
+        header = len(INDEX_MAGIC) + 20
+        assert data[header : header + 16] == struct.pack("<2q", 1411135000, 1411300000)
+
+        mocked_repo.walk.reset_mock()
+        loaded = CommitCache(mocked_repo, path)
+        loaded.update()
+
+        assert loaded.head == head
+        assert mocked_repo.walk.call_count == 0
+        assert loaded.keys() == ["2014-09-19", "2014-09-21"]
+        assert loaded.get_commits("2014-09-21") == [get_name(1411300000, "3" * 40)]
+
+    def test_load_walks_from_the_saved_head(self, tmpdir):
+        first = Oid(hex="a" * 40)
+        second = Oid(hex="b" * 40)
+        path = str(tmpdir.join("history"))
+
+        mocked_repo = MagicMock()
+        mocked_repo.lookup_reference().resolve().target = first
+        mocked_repo.walk.return_value = [get_commit(1411135000, "1" * 40)]
+        CommitCache(mocked_repo, path).update()
+
+        new_commit = get_commit(1411135060, "2" * 40)
+        added = MagicMock(__iter__=lambda self: iter([new_commit]))
+        removed = MagicMock(__iter__=lambda self: iter([]))
+        mocked_repo.walk.side_effect = [added, removed]
+        mocked_repo.lookup_reference().resolve().target = second
+
+        cache = CommitCache(mocked_repo, path)
+        cache.update()
+
+        assert len(cache) == 2
+        added.hide.assert_called_once_with(first)
+
+        reloaded = CommitCache(mocked_repo, path)
+        assert reloaded.load() is True
+        assert reloaded.head == second
+        assert len(reloaded) == 2
+
+    def test_load_ignores_an_invalid_index(self, tmpdir):
+        tmpdir.join("history").write_binary(b"garbage")
+
+        cache = CommitCache(MagicMock(), str(tmpdir.join("history")))
+
+        with patch("gitfs.cache.commits.log") as mocked_log:
+            assert cache.load() is False
+
+        assert cache.head is None
+        assert mocked_log.warning.call_count == 1
@@ -58,6 +58,15 @@ class TestLRUCache(object):
         assert lru.get_if_exists(5) == 5
         assert lru.get_if_exists(10) is None
 
+    def test_lru_cache_info(self):
+        lru = LRUCache(2)
+        lru[1] = 1
+
+        assert lru.get_if_exists(1) == 1
+        assert lru.get_if_exists(2) is None
+        assert lru.get_if_exists(1) == 1
+        assert lru.cache_info() == (2, 1, 2, 1)
+
     def test_lru_getsizeof(self):
         lru = LRUCache(3, lambda x: x)
 
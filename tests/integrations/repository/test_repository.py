@@ -136,3 +136,32 @@ class TestRepository(BaseTest):
                 self.get_commits_by_date()[0],
             )
         )
+
+    def test_no_stale_reads_after_a_merge(self, gitfs_log):
+        file_name = "new_file" + str(uuid.uuid4())
+
+        with open(os.path.join(self.remote_repo_path, file_name), "w") as f:
+            f.write("old content")
+
+        self.sh.git.add(file_name)
+        self.sh.git.commit("-m", '"Just a message."')
+        with gitfs_log(["FetchWorker: Fetch done", "SyncWorker: Set push_successful"]):
+            self.sh.git.push("origin", "master")
+
+        # fill the page cache, then change the file to the same size, so only
+        # its content gives a stale read away
+        for _ in range(2):
+            with open(self.current_path + "/" + file_name) as f:
+                assert f.read() == "old content"
+
+        with open(os.path.join(self.remote_repo_path, file_name), "w") as f:
+            f.write("new content")
+
+        self.sh.git.add(file_name)
+        self.sh.git.commit("-m", '"Just a message."')
+        with gitfs_log(["FetchWorker: Fetch done", "SyncWorker: Set push_successful"]):
+            self.sh.git.push("origin", "master")
+
+        for _ in range(2):
+            with open(self.current_path + "/" + file_name) as f:
+                assert f.read() == "new content"
@@ -13,164 +13,214 @@
 # limitations under the License.
 
 
-from collections import namedtuple
-from io import TextIOWrapper
-
-from mock import MagicMock, patch, call
-
-from pygit2 import GIT_BRANCH_LOCAL, GIT_BRANCH_REMOTE, GIT_CHECKOUT_FORCE
+import pytest
+from mock import MagicMock, patch
+from pygit2 import GIT_FILEMODE_BLOB, Signature, init_repository
 
 from gitfs.merges.accept_mine import AcceptMine
+from gitfs.repository import Repository
 
 
-Commit = namedtuple("Commit", ["hex", "message", "id"])
+def get_commit(id, *parent_ids):
+    return MagicMock(id=id, hex=id, message=id, parent_ids=list(parent_ids))
 
 
 class TestAcceptMine(object):
-    def test_create_local_copy(self):
+    def test_merging_strategy(self):
         mocked_repo = MagicMock()
-        mocked_branch = MagicMock()
-        mocked_commit = MagicMock()
+        local = MagicMock(target="local")
+        remote = MagicMock(target="remote")
+        head = MagicMock(tree="remote_tree")
+        merged = MagicMock(tree="merged_tree", id="merged", hex="merged")
+        first, second = get_commit("2", "1"), get_commit("1", "base")
+
+        mocked_repo.branches.local.get.return_value = local
+        mocked_repo.branches.remote.get.return_value = remote
+        mocked_repo.find_diverge_commits().first_commits = [first, second]
+        mocked_repo.__getitem__.side_effect = lambda oid: {
+            "remote": head,
+            "local": MagicMock(tree="local_tree"),
+        }[oid]
 
-        mocked_branch.target.hex = "local_commit"
-        mocked_repo.branches.local.get.return_value = mocked_branch
-        mocked_repo.__getitem__.return_value = mocked_commit
-        mocked_repo.create_branch.return_value = "branch"
+        mine = AcceptMine(mocked_repo, author="author", commiter="commiter")
+        mocked_merge = MagicMock(return_value=merged)
+        mine.merge_commit = mocked_merge
 
-        mine = AcceptMine(mocked_repo)
-        assert mine._create_local_copy("old_branch", "new_branch") == "branch"
+        mine("local_branch", "remote_branch", "upstream")
 
-        mocked_repo.create_branch.assert_called_once_with("new_branch", mocked_commit)
+        mocked_repo.branches.local.get.assert_called_once_with("local_branch")
+        mocked_repo.branches.remote.get.assert_called_once_with(
+            "upstream/remote_branch"
+        )
+        mocked_repo.find_diverge_commits.assert_called_with(local, remote)
+        mocked_merge.assert_called_once_with(head, first)
+        mocked_repo.update_working_tree.assert_called_once_with(
+            "local_tree", "merged_tree"
+        )
+        mocked_repo.create_reference.assert_called_once_with(
+            "refs/heads/local_branch", "merged", force=True
+        )
+        assert mocked_repo.checkout.call_count == 0
 
-    def test_create_remote_copy(self):
+    def test_merging_keeps_going_after_an_empty_merge(self):
         mocked_repo = MagicMock()
-        mocked_branch = MagicMock()
-        mocked_commit = MagicMock()
+        head = MagicMock()
+        first, second = get_commit("2", "1"), get_commit("1", "base")
 
-        mocked_branch.target.hex = "remote_commit"
-        mocked_repo.branches.remote.return_value = mocked_branch
-        mocked_repo.__getitem__.return_value = mocked_commit
-        mocked_repo.create_branch.return_value = "branch"
+        mocked_repo.__getitem__.return_value = head
+        mocked_repo.find_diverge_commits().first_commits = [first, second]
 
         mine = AcceptMine(mocked_repo)
-        assert (
-            mine._create_remote_copy("old_branch", "upstream", "new_branch") == "branch"
-        )
+        mocked_merge = MagicMock(return_value=head)
+        mine.merge_commit = mocked_merge
 
-        reference = "{}/{}".format("upstream", "old_branch")
-        mocked_repo.create_branch.assert_called_once_with("new_branch", mocked_commit)
-        mocked_repo.checkout.has_calls([call("ref", strategy=GIT_CHECKOUT_FORCE)])
+        mine.merge("local_branch", "remote_branch", "upstream")
 
-        asserted_ref = "refs/heads/new_branch"
-        mocked_repo.lookup_reference.assert_called_once_with(asserted_ref)
+        assert mocked_merge.call_count == 2
 
-    def test_solve_conflicts_we_deleted_the_file(self):
+    def test_merge_commit(self):
         mocked_repo = MagicMock()
-        mocked_file = MagicMock()
+        mocked_index = MagicMock()
+        head = MagicMock(id="head", tree_id="head_tree")
+        commit = MagicMock(id="commit", message="message")
 
-        mocked_file.path = "simple_path"
+        mocked_repo.merge_commits.return_value = mocked_index
+        mocked_index.write_tree.return_value = "tree"
+        mocked_repo.create_commit.return_value = "new_commit"
+        mocked_repo.__getitem__.return_value = "merge commit"
 
-        def conflicts():
-            yield None, mocked_file, None
+        mine = AcceptMine(mocked_repo, author=("a", "a@a"), commiter=("c", "c@c"))
+        mine.solve_conflicts = MagicMock()
 
-        mine = AcceptMine(mocked_repo)
-        mine.solve_conflicts(conflicts())
+        with patch("gitfs.merges.accept_mine.Signature") as mocked_signature:
+            mocked_signature.side_effect = lambda name, email: name
+
+            assert mine.merge_commit(head, commit) == "merge commit"
 
-        mocked_repo.index.remove.has_calls(
-            [call("simple_path", 1), call("simple_path", 2)]
+        mocked_repo.merge_commits.assert_called_once_with(head, commit)
+        mine.solve_conflicts.assert_called_once_with(mocked_index)
+        mocked_index.write_tree.assert_called_once_with(mocked_repo._repo)
+        mocked_repo.create_commit.assert_called_once_with(
+            None, "a", "c", "merging: message", "tree", ["head", "commit"]
+        )
+        mocked_repo.__getitem__.assert_called_once_with("new_commit")
+
+    def test_merge_commit_keeps_the_local_version(self, tmpdir):
+        pygit2_repo = init_repository(str(tmpdir), bare=True)
+        signature = Signature("a", "a@a")
+
+        def make_commit(content, *parents):
+            builder = pygit2_repo.TreeBuilder()
+            builder.insert("file", pygit2_repo.create_blob(content), GIT_FILEMODE_BLOB)
+            return pygit2_repo[
+                pygit2_repo.create_commit(
+                    None,
+                    signature,
+                    signature,
+                    content.decode(),
+                    builder.write(),
+                    list(parents),
+                )
+            ]
+
+        base = make_commit(b"base")
+        remote = make_commit(b"remote", base.id)
+        local = make_commit(b"local", base.id)
+
+        mine = AcceptMine(
+            Repository(pygit2_repo), author=("a", "a@a"), commiter=("c", "c@c")
         )
+        merged = mine.merge_commit(remote, local)
 
-    def test_solve_conflicts_they_deleted_the_file(self):
-        mocked_repo = MagicMock()
-        mocked_file = MagicMock()
+        assert merged.parent_ids == [remote.id, local.id]
+        assert pygit2_repo[merged.tree["file"].id].data == b"local"
 
-        mocked_file.path = "simple_path"
+    def test_merge_commit_without_changes(self):
+        mocked_repo = MagicMock()
+        head = MagicMock(tree_id="tree")
 
-        def conflicts():
-            yield None, None, mocked_file
+        mocked_repo.merge_commits().write_tree.return_value = "tree"
 
         mine = AcceptMine(mocked_repo)
-        mine.solve_conflicts(conflicts())
+        mine.solve_conflicts = MagicMock()
 
-        mocked_repo.index.add.assert_called_once_with("simple_path")
+        assert mine.merge_commit(head, MagicMock()) is head
+        assert mocked_repo.create_commit.call_count == 0
 
-    def test_solve_conflicts_both_update_a_file(self):
-        mocked_theirs = MagicMock()
-        mocked_ours = MagicMock(id="id", path="path")
-        mocked_full = MagicMock(return_value="full_path")
-        mocked_repo = MagicMock(_full_path=mocked_full)
+    def test_own_ancestors(self):
+        commits = [
+            get_commit("4", "3", "remote"),
+            get_commit("3", "1"),
+            get_commit("2", "1"),
+            get_commit("1", "base"),
+        ]
+        diverge_commits = MagicMock(first_commits=commits)
 
-        mocked_repo.get().data = "data"
+        mine = AcceptMine(MagicMock())
 
-        def conflicts():
-            yield None, mocked_theirs, mocked_ours
+        assert mine._own_ancestors(commits[1], diverge_commits) == set(["3", "1"])
+        assert mine._own_ancestors(commits[0], diverge_commits) == set(["4", "3", "1"])
 
-        mock_path = "gitfs.merges.accept_mine.open"
-        with patch(mock_path, create=True) as mocked_open:
-            mocked_file = MagicMock(spec=TextIOWrapper)
-            mocked_open.return_value = mocked_file
+    def test_call_with_failing_merge(self):
+        mine = AcceptMine(MagicMock())
+        mine.merge = MagicMock(side_effect=ValueError)
 
-            mine = AcceptMine(mocked_repo)
+        with patch("gitfs.merges.accept_mine.log") as mocked_log:
+            with pytest.raises(ValueError):
+                mine("local_branch", "remote_branch", "upstream")
 
-            mine.solve_conflicts(conflicts())
+        assert mocked_log.exception.call_count == 1
 
-            mocked_full.assert_called_once_with("path")
-            mocked_open.assert_called_once_with("full_path", "w")
-            mocked_repo.get.has_calls([call("id")])
-            mocked_open().__enter__().write.assert_called_once_with("data")
-            mocked_repo.index.add.assert_called_once_with("path")
+    def get_index(self, *conflicts):
+        mocked_index = MagicMock()
+        mocked_index.conflicts.__bool__.return_value = bool(conflicts)
+        mocked_index.conflicts.__iter__.return_value = iter(conflicts)
+        return mocked_index
 
-    def test_merging_strategy(self):
-        mocked_repo = MagicMock()
-        mocked_copy = MagicMock()
-        mocked_remote_copy = MagicMock()
-        mocked_reload = MagicMock()
-        mocked_diverge = MagicMock()
-        mocked_solve = MagicMock()
-        mocked_ref = MagicMock()
-        mocked_find_commits = MagicMock()
-
-        mocked_ref.target = "target"
-        mocked_diverge.first_commits = [Commit(1, "message", 1)]
-        mocked_repo.index.conflicts = "conflicts"
-        mocked_repo.lookup_reference.return_value = mocked_ref
-        mocked_repo.commit.return_value = "new_commit"
-        mocked_repo.find_diverge_commits = mocked_find_commits
-        mocked_reload.return_value = "reload"
-        mocked_find_commits.return_value = mocked_diverge
-        mocked_copy.return_value = "local_copy"
-        mocked_remote_copy.return_value = "remote_copy"
+    def test_solve_conflicts_we_deleted_the_file(self):
+        mocked_file = MagicMock(path="simple_path")
+        mocked_index = self.get_index((None, mocked_file, None))
 
-        mine = AcceptMine(mocked_repo, author="author", commiter="commiter")
+        mine = AcceptMine(MagicMock())
+        mine.solve_conflicts(mocked_index)
 
-        mine._create_local_copy = mocked_copy
-        mine._create_remote_copy = mocked_remote_copy
-        mine.reload_branch = mocked_reload
-        mine.solve_conflicts = mocked_solve
+        mocked_index.conflicts.__delitem__.assert_called_once_with("simple_path")
+        assert mocked_index.add.call_count == 0
 
-        mine.__call__("local_branch", "remote_branch", "upstream")
+    def test_solve_conflicts_they_deleted_the_file(self):
+        mocked_file = MagicMock(path="simple_path", id="id", mode="mode")
+        mocked_index = self.get_index((None, None, mocked_file))
 
-        mocked_copy.assert_called_once_with("local_branch", "merging_local")
-        mocked_remote_copy.assert_called_once_with(
-            "remote_branch", "upstream", "merging_remote"
-        )
-        mocked_find_commits.assert_called_once_with("local_copy", "remote_copy")
-        mocked_repo.checkout.has_calls(
-            [call("refs/heads/local_branch", strategy=GIT_CHECKOUT_FORCE)]
-        )
-        mocked_repo.merge.assert_called_once_with(1)
-        mocked_solve.asssert_called_once_with(mocked_repo.index.conflicts)
+        with patch("gitfs.merges.accept_mine.IndexEntry") as mocked_entry:
+            mocked_entry.return_value = "entry"
 
-        asserted_calls = [
-            call("refs/heads/local_branch"),
-            call("refs/heads/merging_local"),
-        ]
-        mocked_repo.lookup_reference.has_calls(asserted_calls)
-        mocked_repo.commit.asserted_called_once_with(
-            "merging: message", "author", "commiter", mocked_ref, ["target", 1]
-        )
-        mocked_repo.create_reference.called_once_with(
-            mocked_ref, "new_commit", force=True
-        )
-        assert mocked_repo.state_cleanup.call_count == 1
-        assert mocked_ref.delete.call_count == 2
+            mine = AcceptMine(MagicMock())
+            mine.solve_conflicts(mocked_index)
+
+            mocked_entry.assert_called_once_with("simple_path", "id", "mode")
+
+        mocked_index.conflicts.__delitem__.assert_called_once_with("simple_path")
+        mocked_index.add.assert_called_once_with("entry")
+
+    def test_solve_conflicts_both_update_a_file(self):
+        mocked_theirs = MagicMock(path="path", id="their_id", mode="mode")
+        mocked_ours = MagicMock(path="path", id="our_id", mode="mode")
+        mocked_index = self.get_index((None, mocked_theirs, mocked_ours))
+
+        with patch("gitfs.merges.accept_mine.IndexEntry") as mocked_entry:
+            mocked_entry.return_value = "entry"
+
+            mine = AcceptMine(MagicMock())
+            mine.solve_conflicts(mocked_index)
+
+            mocked_entry.assert_called_once_with("path", "our_id", "mode")
+
+        mocked_index.add.assert_called_once_with("entry")
+
+    def test_solve_conflicts_without_conflicts(self):
+        mocked_index = MagicMock(conflicts=None)
+
+        mine = AcceptMine(MagicMock())
+        mine.solve_conflicts(mocked_index)
+
+        assert mocked_index.add.call_count == 0
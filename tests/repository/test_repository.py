@@ -14,23 +14,37 @@
 
 
 import time
-from collections import namedtuple
-from stat import S_IFDIR, S_IFREG
+import zlib
+from collections import OrderedDict
+from stat import S_IFDIR, S_IFREG, S_IFLNK
 
 import pytest
 from mock import MagicMock, patch, call, ANY
 from pygit2 import (
     GIT_BRANCH_REMOTE,
     GIT_SORT_TIME,
+    GIT_SORT_TOPOLOGICAL,
     GIT_FILEMODE_BLOB,
+    GIT_FILEMODE_TREE,
+    GIT_CHECKOUT_FORCE,
+    GIT_DELTA_ADDED,
+    GIT_DELTA_DELETED,
+    GIT_DELTA_MODIFIED,
+    GIT_FILEMODE_LINK,
     GIT_STATUS_CURRENT,
+    GIT_STATUS_INDEX_MODIFIED,
+    GIT_STATUS_WT_MODIFIED,
+    GIT_STATUS_WT_NEW,
+    init_repository,
+    hashfile,
+    Oid,
+    Signature,
 )
 
-from gitfs.repository import Repository
+from gitfs.repository import Repository, GitEntry
+from gitfs.utils.dirty import ADD, REMOVE
 from .base import RepositoryBaseTest
 
-Commit = namedtuple("Commit", "hex")
-
 
 class TestRepository(RepositoryBaseTest):
     def test_push(self):
@@ -48,6 +62,9 @@ class TestRepository(RepositoryBaseTest):
 
     def test_fetch(self):
         class MockedCommit(object):
+            id = "id"
+            parent_ids = []
+
             @property
             def hex(self):
                 time.sleep(0.1)
@@ -59,7 +76,9 @@ class TestRepository(RepositoryBaseTest):
 
         mocked_repo.remotes = [mocked_remote]
         mocked_repo.lookup_branch().get_object.return_value = MockedCommit()
-        mocked_repo.walk.return_value = [MockedCommit()]
+        mocked_repo.walk.return_value = MagicMock(
+            __iter__=lambda self: iter([MockedCommit()])
+        )
 
         repo = Repository(mocked_repo)
         repo.fetch("origin", "master", "credentials")
@@ -71,8 +90,8 @@ class TestRepository(RepositoryBaseTest):
         mocked_parent = MagicMock()
 
         mocked_parent.id = 1
+        mocked_parent.tree_id = "parent_tree"
 
-        mocked_repo.status.return_value = True
         mocked_repo.index.write_tree.return_value = "tree"
         mocked_repo.revparse_single.return_value = mocked_parent
         mocked_repo.create_commit.return_value = "commit"
@@ -87,7 +106,7 @@ class TestRepository(RepositoryBaseTest):
             commit = repo.commit("message", author, commiter)
 
             assert commit == "commit"
-            assert mocked_repo.status.call_count == 1
+            assert mocked_repo.status.call_count == 0
             assert mocked_repo.index.write_tree.call_count == 1
             assert mocked_repo.index.write.call_count == 1
 
@@ -99,7 +118,8 @@ class TestRepository(RepositoryBaseTest):
 
     def test_commit_with_nothing_to_commit(self):
         mocked_repo = MagicMock()
-        mocked_repo.status.return_value = {}
+        mocked_repo.index.write_tree.return_value = "tree"
+        mocked_repo.revparse_single.return_value.tree_id = "tree"
 
         author = ("author_1", "author_2")
         commiter = ("commiter_1", "commiter_2")
@@ -108,6 +128,73 @@ class TestRepository(RepositoryBaseTest):
         commit = repo.commit("message", author, commiter)
 
         assert commit is None
+        assert mocked_repo.status.call_count == 0
+        assert mocked_repo.create_commit.call_count == 0
+
+    def test_stage(self):
+        mocked_repo = MagicMock()
+        mocked_repo.index.remove.side_effect = [None, OSError("not in index")]
+
+        repo = Repository(mocked_repo)
+        repo.dirty_paths.update(add=["added", "gone"], remove=["removed"])
+        repo.dirty_paths.add("hashed", Oid(hex="a" * 40))
+
+        repo._disk_filemode = MagicMock(
+            side_effect=lambda path: None if path == "gone" else GIT_FILEMODE_BLOB
+        )
+        assert repo.stage() == set(["added", "gone", "hashed", "removed"])
+
+        entry = mocked_repo.index.add.call_args_list[1][0][0]
+        assert mocked_repo.index.add.call_args_list[0] == call("added")
+        assert (entry.path, entry.id, entry.mode) == (
+            "hashed",
+            Oid(hex="a" * 40),
+            GIT_FILEMODE_BLOB,
+        )
+        assert mocked_repo.index.remove.call_args_list == [
+            call("gone"),
+            call("removed"),
+        ]
+        assert repo.hashed_paths == set(["hashed"])
+        assert len(repo.dirty_paths) == 0
+
+    def test_hash_file(self, tmpdir):
+        pygit2_repo = init_repository(str(tmpdir))
+        tmpdir.join("small").write(b"content", mode="wb")
+        tmpdir.join("big").write(b"big content", mode="wb")
+        oids = [
+            hashfile(str(tmpdir.join("small"))),
+            hashfile(str(tmpdir.join("big"))),
+        ]
+
+        repo = Repository(pygit2_repo)
+        repo.hash_threshold = 10
+
+        assert repo.hash_file("/small") == (oids[0], False)
+        assert repo.hash_file("/big") == (oids[1], True)
+        assert repo.hash_file("/missing") == (None, False)
+        assert oids[0] not in pygit2_repo
+        assert oids[1] in pygit2_repo
+
+        repo.hash_threshold = -1
+        assert repo.hash_file("/big") == (oids[1], False)
+
+    def test_hash_file_reads_big_files_once(self, tmpdir):
+        mocked_repo = MagicMock()
+        tmpdir.join("big").write(b"big content", mode="wb")
+        mocked_repo.workdir = str(tmpdir)
+        mocked_repo.create_blob_fromdisk.return_value = "oid"
+
+        repo = Repository(mocked_repo)
+        repo.hash_threshold = 10
+
+        with patch("gitfs.repository.hashfile") as mocked_hashfile:
+            assert repo.hash_file("/big") == ("oid", True)
+            assert mocked_hashfile.call_count == 0
+
+        mocked_repo.create_blob_fromdisk.assert_called_once_with(
+            str(tmpdir.join("big"))
+        )
 
     def test_clone(self):
         mocked_repo = MagicMock()
@@ -220,10 +307,12 @@ class TestRepository(RepositoryBaseTest):
 
     def test_get_commits_by_dates(self):
         mocked_repo = MagicMock()
-        commits = {"now": [1, 2, 3]}
+        commits = MagicMock()
+        commits.get_commits.return_value = ["1", "2", "3"]
 
         repo = Repository(mocked_repo, commits)
         assert repo.get_commits_by_date("now") == ["1", "2", "3"]
+        commits.get_commits.assert_called_once_with("now")
 
     def test_get_commit_dates(self):
         mocked_repo = MagicMock()
@@ -232,117 +321,493 @@ class TestRepository(RepositoryBaseTest):
         repo = Repository(mocked_repo, commits)
         assert repo.get_commit_dates() == ["now"]
 
-    def test_is_searched_entry(self):
+    def test_get_git_entry_for_root(self):
+        mocked_tree = MagicMock(id="tree_id")
+        repo = Repository(MagicMock())
+
+        assert repo.get_git_entry(mocked_tree, "/") == GitEntry(
+            GIT_FILEMODE_TREE, "tree_id", 0
+        )
+
+    def test_get_git_entry_goes_straight_down_the_path(self):
+        mocked_file = MagicMock(filemode=GIT_FILEMODE_BLOB, id="file_id")
+        mocked_dir = MagicMock(filemode=GIT_FILEMODE_TREE, id="dir_id")
+        mocked_subtree = {"file": mocked_file}
+        mocked_tree = MagicMock(id="tree_id")
+        mocked_tree.__getitem__.side_effect = {"dir": mocked_dir}.__getitem__
+
         mocked_repo = MagicMock()
+        objects = {"dir_id": mocked_subtree}
+        mocked_repo.__getitem__.side_effect = objects.__getitem__
+
         repo = Repository(mocked_repo)
+        repo.cat_file = MagicMock(**{"size.return_value": 42})
+        entry = repo.get_git_entry(mocked_tree, "/dir/file")
 
-        result = repo._is_searched_entry("entry", "entry", ["entry"])
-        assert result
+        assert entry == GitEntry(GIT_FILEMODE_BLOB, "file_id", 42)
+        repo.cat_file.size.assert_called_once_with("file_id")
+        assert repo.entries[("tree_id", "/dir/file")] == entry
+        mocked_tree.__getitem__.assert_called_once_with("dir")
 
-    def test_get_git_object_type(self):
-        mocked_entry = MagicMock()
-        mocked_entry.name = "entry"
-        mocked_entry.filemode = "git_file"
+        assert repo.get_git_entry(mocked_tree, "/dir/file") == entry
+        assert mocked_tree.__getitem__.call_count == 1
 
+    def test_blob_size_without_git(self):
         mocked_repo = MagicMock()
+        mocked_repo.__getitem__.return_value = MagicMock(size=42)
+
         repo = Repository(mocked_repo)
+        repo.cat_file = MagicMock(**{"size.side_effect": OSError})
 
-        mock_path = "gitfs.repository.split_path_into_components"
-        with patch(mock_path) as mocked_split_path:
-            mocked_split_path.return_value = ["entry"]
+        assert repo._blob_size("oid") == 42
+        mocked_repo.__getitem__.assert_called_once_with("oid")
 
-            result = repo.get_git_object_type([mocked_entry], "path")
+    def test_get_git_entry_with_missing_path(self):
+        mocked_tree = MagicMock(id="tree_id")
+        mocked_tree.__getitem__.side_effect = KeyError
 
-            assert result == "git_file"
-            mocked_split_path.assert_called_once_with("path")
+        repo = Repository(MagicMock())
 
-    def test_get_git_object(self):
-        mocked_entry = MagicMock()
-        mocked_entry.name = "entry"
-        mocked_entry.filemode = "git_file"
+        assert repo.get_git_entry(mocked_tree, "/dir/file") is None
+        assert ("tree_id", "/dir/file") not in repo.entries
+
+    def test_get_git_entry_through_a_blob(self):
+        mocked_file = MagicMock(filemode=GIT_FILEMODE_BLOB, id="file_id")
+        mocked_tree = MagicMock(id="tree_id")
+        mocked_tree.__getitem__.return_value = mocked_file
 
+        repo = Repository(MagicMock())
+
+        assert repo.get_git_entry(mocked_tree, "/file/other") is None
+
+    def test_get_tree_keeps_parsed_trees(self):
         mocked_repo = MagicMock()
-        mocked_repo.__getitem__.return_value = "succed"
+        mocked_repo.__getitem__.return_value = ["entry"]
+
         repo = Repository(mocked_repo)
 
-        mock_path = "gitfs.repository.split_path_into_components"
-        with patch(mock_path) as mocked_split_path:
-            mocked_split_path.return_value = ["entry"]
+        assert repo._get_tree("oid") == ["entry"]
+        assert repo._get_tree("oid") == ["entry"]
+        mocked_repo.__getitem__.assert_called_once_with("oid")
 
-            result = repo.get_git_object([mocked_entry], "path")
+    def test_get_git_object_type(self):
+        mocked_repo = MagicMock()
+        repo = Repository(mocked_repo)
+        repo.get_git_entry = MagicMock(return_value=GitEntry("git_file", 1, 0))
 
-            assert result == "succed"
-            mocked_split_path.assert_called_once_with("path")
+        assert repo.get_git_object_type("tree", "path") == "git_file"
+        repo.get_git_entry.assert_called_once_with("tree", "path")
 
-    def test_get_blob_size(self):
+    def test_get_git_object_type_with_missing_path(self):
+        repo = Repository(MagicMock())
+        repo.get_git_entry = MagicMock(return_value=None)
+
+        assert repo.get_git_object_type("tree", "path") is None
+
+    def test_get_git_object(self):
         mocked_repo = MagicMock()
-        mocked_git_object = MagicMock()
-        mocked_git_object().size = 42
+        mocked_repo.__getitem__.return_value = "succed"
+        repo = Repository(mocked_repo)
+        repo.get_git_entry = MagicMock(return_value=GitEntry("git_file", 1, 0))
 
+        assert repo.get_git_object("tree", "path") == "succed"
+        repo.get_git_entry.assert_called_once_with("tree", "path")
+        mocked_repo.__getitem__.assert_called_once_with(1)
+
+    def test_get_blob_size(self):
+        mocked_repo = MagicMock()
         repo = Repository(mocked_repo)
-        repo.get_git_object = mocked_git_object
+        repo.get_git_entry = MagicMock(return_value=GitEntry("git_file", 1, 42))
 
         assert repo.get_blob_size("tree", "path") == 42
-        mocked_git_object.has_calls([call("tree", "path")])
+        repo.get_git_entry.assert_called_once_with("tree", "path")
 
     def test_get_blob_data(self):
         mocked_repo = MagicMock()
-        mocked_git_object = MagicMock()
-        mocked_git_object().data = "some data"
-
+        mocked_repo.__getitem__().data = "some data"
         repo = Repository(mocked_repo)
-        repo.get_git_object = mocked_git_object
+        repo.get_git_entry = MagicMock(return_value=GitEntry("git_file", 1, 42))
 
         assert repo.get_blob_data("tree", "path") == "some data"
-        mocked_git_object.has_calls([call("tree", "path")])
+        repo.get_git_entry.assert_called_once_with("tree", "path")
 
-    def test_find_diverge_commits_first_from_second(self):
+    def test_read_blob_from_cache(self):
         mocked_repo = MagicMock()
+        mocked_repo.__getitem__.return_value = b"some data"
+        repo = Repository(mocked_repo)
+        repo.get_git_entry = MagicMock(return_value=GitEntry("git_file", 1, 9))
 
-        def walker(obj, sort, *branches):
-            first_branch = [Commit(1), Commit(2), Commit(3), Commit(4)]
-            second_branch = [Commit(5), Commit(6), Commit(2), Commit(3)]
+        assert repo.read_blob("tree", "path", 3, 5) == b"dat"
+        assert repo.read_blob("tree", "path", 10, 5) == b"data"
+        mocked_repo.__getitem__.assert_called_once_with(1)
+        assert repo.streams.currsize == 0
+
+    def test_read_blob_streams_large_blobs(self):
+        mocked_repo = MagicMock()
+        repo = Repository(mocked_repo)
+        repo.stream_threshold = 4
+        repo.get_git_entry = MagicMock(return_value=GitEntry("git_file", 1, 9))
+        repo.iter_blob_chunks = MagicMock(side_effect=lambda oid: iter([b"some data"]))
 
-            for index, commit in enumerate(first_branch):
-                yield (commit, second_branch[index])
+        assert repo.read_blob("tree", "path", 3, 5) == b"dat"
+        assert repo.read_blob("tree", "path", 10, 8) == b"a"
+        repo.iter_blob_chunks.assert_called_once_with(1)
+        assert mocked_repo.__getitem__.call_count == 0
 
+    def test_iter_blob_chunks_inflates_loose_objects(self, tmpdir):
+        content = b"0123456789" * 1000
+        oid = MagicMock(hex="ab" + "c" * 38)
+
+        objects = tmpdir.mkdir("objects").mkdir("ab")
+        loose = b"blob %d\0" % len(content) + content
+        objects.join("c" * 38).write(zlib.compress(loose), mode="wb")
+
+        mocked_repo = MagicMock(path=str(tmpdir))
         repo = Repository(mocked_repo)
-        repo.walk_branches = walker
 
-        result = repo.find_diverge_commits("first_branch", "second_branch")
-        assert result.common_parent == Commit(2)
+        chunks = list(repo.iter_blob_chunks(oid, chunk_size=128))
+
+        assert b"".join(chunks) == content
+        assert max(len(chunk) for chunk in chunks) <= 128
+        assert mocked_repo.__getitem__.call_count == 0
+
+    def test_iter_blob_chunks_for_packed_objects(self, tmpdir):
+        oid = MagicMock(hex="ab" + "c" * 38)
+        mocked_repo = MagicMock(path=str(tmpdir))
+        repo = Repository(mocked_repo)
+        repo.cat_file = MagicMock()
+        repo.cat_file.stream.return_value = iter([b"some", b" dat", b"a"])
 
-    def test_find_diverge_commits_second_from_first(self):
+        chunks = list(repo.iter_blob_chunks(oid, chunk_size=4))
+
+        assert chunks == [b"some", b" dat", b"a"]
+        repo.cat_file.stream.assert_called_once_with(oid, 4)
+        assert mocked_repo.__getitem__.call_count == 0
+
+    def test_iter_blob_chunks_for_packed_objects_without_git(self, tmpdir):
+        def stream(oid, chunk_size):
+            raise OSError("no git")
+            yield
+
+        oid = MagicMock(hex="ab" + "c" * 38)
+        mocked_repo = MagicMock(path=str(tmpdir))
+        mocked_repo.__getitem__.return_value = MagicMock(data=b"some data")
+        repo = Repository(mocked_repo)
+        repo.cat_file = MagicMock(stream=stream)
+
+        chunks = list(repo.iter_blob_chunks(oid, chunk_size=4))
+
+        assert chunks == [b"some", b" dat", b"a"]
+        mocked_repo.__getitem__.assert_called_once_with(oid)
+
+    def get_walker(self, commits):
+        return MagicMock(__iter__=lambda self: iter(commits))
+
+    def get_commit(self, id, *parent_ids):
+        return MagicMock(id=id, hex=id, parent_ids=list(parent_ids))
+
+    def test_find_diverge_commits(self):
         mocked_repo = MagicMock()
+        first_walker = self.get_walker(
+            [self.get_commit(5, 4), self.get_commit(4, 3), self.get_commit(3, 2)]
+        )
+        second_walker = self.get_walker([self.get_commit(6, 2)])
 
-        def walker(obj, sort, *branches):
-            first_branch = [Commit(5), Commit(6), Commit(2), Commit(3)]
-            second_branch = [Commit(1), Commit(2), Commit(3), Commit(4)]
+        mocked_repo.__getitem__.return_value = "common parent"
+        mocked_repo.walk.side_effect = [first_walker, second_walker]
 
-            for index, commit in enumerate(first_branch):
-                yield (commit, second_branch[index])
+        repo = Repository(mocked_repo)
+        result = repo.find_diverge_commits(
+            MagicMock(target="first"), MagicMock(target="second")
+        )
+
+        assert result.common_parent == "common parent"
+        assert result.first_commits.hashes == [5, 4, 3]
+        assert result.second_commits.hashes == [6]
+        mocked_repo.__getitem__.assert_called_once_with(2)
+        mocked_repo.walk.assert_has_calls(
+            [call("first", GIT_SORT_TOPOLOGICAL), call("second", GIT_SORT_TOPOLOGICAL)]
+        )
+        first_walker.hide.assert_called_once_with("second")
+        second_walker.hide.assert_called_once_with(2)
+        assert mocked_repo.merge_base.call_count == 0
+
+    def test_find_diverge_commits_with_first_behind(self):
+        mocked_repo = MagicMock()
+        second_walker = self.get_walker([self.get_commit(2, 1)])
+        mocked_repo.walk.side_effect = [self.get_walker([]), second_walker]
+
+        repo = Repository(mocked_repo)
+        result = repo.find_diverge_commits(
+            MagicMock(target="first"), MagicMock(target="second")
+        )
+
+        assert len(result.first_commits) == 0
+        assert result.second_commits.hashes == [2]
+        second_walker.hide.assert_called_once_with("first")
+        mocked_repo.__getitem__.assert_called_once_with("first")
+
+    def test_find_diverge_commits_after_a_merge(self):
+        mocked_repo = MagicMock()
+        second_walker = self.get_walker([self.get_commit(7, 6)])
+
+        mocked_repo.merge_base.return_value = 6
+        mocked_repo.walk.side_effect = [
+            self.get_walker([self.get_commit(5, 4, 6), self.get_commit(4, 2)]),
+            second_walker,
+        ]
 
         repo = Repository(mocked_repo)
-        repo.walk_branches = walker
+        result = repo.find_diverge_commits(
+            MagicMock(target="first"), MagicMock(target="second")
+        )
 
-        result = repo.find_diverge_commits("first_branch", "second_branch")
-        assert result.common_parent == Commit(2)
+        assert result.first_commits.hashes == [5, 4]
+        assert result.second_commits.hashes == [7]
+        second_walker.hide.assert_called_once_with("first")
+        mocked_repo.merge_base.assert_called_once_with("first", "second")
+        mocked_repo.__getitem__.assert_called_once_with(6)
 
-    def test_find_diverge_commits_common_commit(self):
+    def test_find_diverge_commits_without_common_parent(self):
         mocked_repo = MagicMock()
+        mocked_repo.merge_base.return_value = None
+        mocked_repo.walk.side_effect = [
+            self.get_walker([self.get_commit(1)]),
+            self.get_walker([self.get_commit(2)]),
+        ]
+
+        repo = Repository(mocked_repo)
+        result = repo.find_diverge_commits(
+            MagicMock(target="first"), MagicMock(target="second")
+        )
 
-        def walker(obj, sort, *branches):
-            first_branch = [Commit(5), Commit(6), Commit(2), Commit(3)]
-            second_branch = [Commit(1), Commit(0), Commit(2), Commit(3)]
+        assert result.common_parent is None
+        assert result.first_commits.hashes == [1]
+        assert result.second_commits.hashes == [2]
+        assert mocked_repo.__getitem__.call_count == 0
 
-            for index, commit in enumerate(first_branch):
-                yield (commit, second_branch[index])
+    def test_find_diverge_commits_is_cached_by_targets(self):
+        mocked_repo = MagicMock()
+        mocked_repo.walk.side_effect = lambda *args: self.get_walker([])
 
         repo = Repository(mocked_repo)
-        repo.walk_branches = walker
+        first_branch = MagicMock(target="first")
+        second_branch = MagicMock(target="second")
 
-        result = repo.find_diverge_commits("first_branch", "second_branch")
-        assert result.common_parent == Commit(2)
+        result = repo.find_diverge_commits(first_branch, second_branch)
+        copy = MagicMock(target="first")
+        assert repo.find_diverge_commits(copy, second_branch) is result
+        assert mocked_repo.walk.call_count == 2
+
+        repo.find_diverge_commits(second_branch, first_branch)
+        assert mocked_repo.walk.call_count == 4
+
+    def test_update_working_tree(self):
+        mocked_repo = MagicMock()
+        mocked_repo.diff.return_value.deltas = [
+            MagicMock(**{"old_file.path": "a", "new_file.path": "a"}),
+            MagicMock(**{"old_file.path": "b/c", "new_file.path": "b"}),
+        ]
+
+        repo = Repository(mocked_repo)
+
+        assert repo.update_working_tree("old", "new") == set(["a", "b", "b/c"])
+        mocked_repo.diff.assert_called_once_with("old", "new")
+        mocked_repo.checkout_tree.assert_called_once_with(
+            "new", strategy=GIT_CHECKOUT_FORCE, paths=["a", "b", "b/c"]
+        )
+        assert repo.stale_paths.paths == set(["a", "b", "b/c"])
+
+    def test_update_working_tree_without_changes(self):
+        mocked_repo = MagicMock()
+        mocked_repo.diff.return_value.deltas = []
+
+        repo = Repository(mocked_repo)
+
+        assert repo.update_working_tree("old", "old") == set()
+        assert mocked_repo.checkout_tree.call_count == 0
+
+    def test_stage_moved_trees(self):
+        mocked_repo = MagicMock()
+        mocked_repo.index.write_tree.return_value = "tree"
+        mocked_repo.__getitem__.side_effect = lambda oid: "object-" + oid
+
+        repo = Repository(mocked_repo)
+        repo._move_tree = MagicMock(side_effect=["moved", "removed"])
+        repo.dirty_paths.move("a", "b")
+        repo.dirty_paths.move("c")
+
+        assert repo.stage() == set(["a", "b", "c"])
+        assert repo._move_tree.call_args_list == [
+            call("object-tree", "a", "b"),
+            call("object-moved", "c", None),
+        ]
+        mocked_repo.index.read_tree.assert_called_once_with("object-removed")
+
+    def get_tree(self, pygit2_repo, paths):
+        blob = pygit2_repo.create_blob(b"content")
+
+        def write(paths):
+            builder = pygit2_repo.TreeBuilder()
+            children = {}
+            for path in paths:
+                name, _, rest = path.partition("/")
+                if rest:
+                    children.setdefault(name, []).append(rest)
+                else:
+                    builder.insert(name, blob, GIT_FILEMODE_BLOB)
+            for name, rest in children.items():
+                builder.insert(name, write(rest), GIT_FILEMODE_TREE)
+            return builder.write()
+
+        return pygit2_repo[write(paths)]
+
+    def list_tree(self, pygit2_repo, oid, prefix=""):
+        paths = []
+        for entry in pygit2_repo[oid]:
+            path = prefix + entry.name
+            if entry.filemode == GIT_FILEMODE_TREE:
+                paths.extend(self.list_tree(pygit2_repo, entry.id, path + "/"))
+            else:
+                paths.append(path)
+        return sorted(paths)
+
+    def test_move_tree(self, tmpdir):
+        pygit2_repo = init_repository(str(tmpdir), bare=True)
+        tree = self.get_tree(pygit2_repo, ["a/b/1", "a/b/2", "a/3", "c"])
+        repo = Repository(pygit2_repo)
+
+        oid = repo._move_tree(tree, "a/b", "d/e")
+        assert self.list_tree(pygit2_repo, oid) == ["a/3", "c", "d/e/1", "d/e/2"]
+        assert pygit2_repo[oid]["d/e"].id == tree["a/b"].id
+
+        oid = repo._move_tree(tree, "a")
+        assert self.list_tree(pygit2_repo, oid) == ["c"]
+
+    def test_move_tree_drops_empty_trees(self, tmpdir):
+        pygit2_repo = init_repository(str(tmpdir), bare=True)
+        tree = self.get_tree(pygit2_repo, ["a/b/1", "c"])
+        repo = Repository(pygit2_repo)
+
+        oid = repo._move_tree(tree, "a/b")
+        assert self.list_tree(pygit2_repo, oid) == ["c"]
+
+        oid = repo._move_tree(pygit2_repo[oid], "c")
+        assert len(pygit2_repo[oid]) == 0
+
+    def test_move_missing_tree(self, tmpdir):
+        pygit2_repo = init_repository(str(tmpdir), bare=True)
+        tree = self.get_tree(pygit2_repo, ["c"])
+
+        assert Repository(pygit2_repo)._move_tree(tree, "a", "b") == tree.id
+
+    def test_is_changed(self, tmpdir):
+        pygit2_repo = init_repository(str(tmpdir))
+        tmpdir.join("same").write(b"content", mode="wb")
+        tmpdir.join("other").write(b"other content", mode="wb")
+        tmpdir.join("new").write(b"content", mode="wb")
+
+        tree = self.get_tree(pygit2_repo, ["same", "other", "pending", "gone"])
+        signature = Signature("gitfs", "gitfs@example.com")
+        pygit2_repo.create_commit("HEAD", signature, signature, "m", tree.id, [])
+
+        repo = Repository(pygit2_repo)
+        repo.dirty_paths.remove("pending")
+
+        assert not repo.is_changed("/same")
+        assert repo.is_changed("/other")
+        assert repo.is_changed("/new")
+        assert repo.is_changed("/pending")
+        assert repo.is_changed("/gone")
+        assert repo.is_changed("/same", Oid(hex="a" * 40))
+
+    def test_reconcile_paths(self):
+        statuses = {
+            "clean": GIT_STATUS_CURRENT,
+            "untracked": GIT_STATUS_WT_NEW,
+            "modified": GIT_STATUS_WT_MODIFIED,
+            "unstaged": GIT_STATUS_INDEX_MODIFIED,
+        }
+
+        def status_file(path):
+            if path == "directory":
+                raise ValueError(path)
+            return statuses[path]
+
+        mocked_repo = MagicMock()
+        mocked_repo.status_file.side_effect = status_file
+
+        repo = Repository(mocked_repo)
+        paths = ["/clean", "/untracked", "/modified", "/unstaged", "/directory"]
+
+        assert repo.reconcile_paths(paths) == ["unstaged"]
+        mocked_repo.checkout_head.assert_called_once_with(
+            strategy=GIT_CHECKOUT_FORCE, paths=["unstaged"]
+        )
+        assert repo.stale_paths.paths == set(["unstaged"])
+        assert "modified" in repo.dirty_paths
+
+    def test_reconcile_paths_keeps_the_writes_made_after_staging(self, tmpdir):
+        pygit2_repo = init_repository(str(tmpdir))
+        signature = Signature("gitfs", "gitfs@example.com")
+        empty = pygit2_repo.TreeBuilder().write()
+        pygit2_repo.create_commit("HEAD", signature, signature, "m", empty, [])
+        tmpdir.join("file").write(b"staged", mode="wb")
+
+        repo = Repository(pygit2_repo)
+        repo.dirty_paths.add("file")
+        paths = repo.stage()
+        tmpdir.join("file").write(b"written after staging", mode="wb")
+        author = ("gitfs", "gitfs@example.com")
+        repo.commit("Update file", author, author)
+
+        assert repo.reconcile_paths(paths) == []
+        assert tmpdir.join("file").read_binary() == b"written after staging"
+        assert "file" in repo.dirty_paths
+
+    def test_reconcile_paths_without_changes(self):
+        mocked_repo = MagicMock()
+        mocked_repo.status_file.return_value = GIT_STATUS_CURRENT
+
+        repo = Repository(mocked_repo)
+
+        assert repo.reconcile_paths(["/clean"]) == []
+        assert mocked_repo.checkout_head.call_count == 0
+
+    def test_restore_paths(self, tmpdir):
+        old, new = tmpdir.mkdir("old"), tmpdir.mkdir("new")
+        old.join("file").write("changed")
+        old.mkdir("moved").join("inner").write("inner")
+        new.join("file").write("original")
+        new.join("removed").write("removed")
+        new.mkdir("removed_dir").join("inner").write("inner")
+
+        mocked_repo = MagicMock()
+        mocked_repo.workdir = str(new) + "/"
+
+        repo = Repository(mocked_repo)
+        repo.restore_paths(
+            str(old) + "/",
+            OrderedDict(
+                [
+                    ("file", 7),
+                    ("moved", 5),
+                    ("lost", 1),
+                    ("removed", None),
+                    ("removed_dir", None),
+                ]
+            ),
+        )
+
+        assert new.join("file").read() == "changed"
+        assert new.join("moved", "inner").read() == "inner"
+        assert not new.join("removed").check()
+        assert not new.join("removed_dir").check()
+        assert not new.join("lost").check()
+
+        trees, paths = repo.dirty_paths.drain()
+        assert trees == [("removed_dir", None)]
+        assert paths == {"file": ADD, "moved/inner": ADD, "removed": REMOVE}
 
     def test_proxy_methods(self):
         mocked_repo = MagicMock()
@@ -382,96 +847,162 @@ class TestRepository(RepositoryBaseTest):
         assert repo.diverge("origin", "master") == (False, False)
         mocked_find.assert_called_once_with(mocked_branch_local, mocked_branch_remote)
 
+    def get_delta(self, status, old_path, new_path, mode=GIT_FILEMODE_BLOB):
+        return MagicMock(
+            **{
+                "status": status,
+                "old_file.path": old_path,
+                "new_file.path": new_path,
+                "new_file.mode": mode,
+            }
+        )
+
     def test_checkout(self):
         mocked_checkout = MagicMock(return_value="done")
         mocked_repo = MagicMock()
         mocked_full_path = MagicMock()
         mocked_index = MagicMock()
         mocked_stats = MagicMock()
-        mocked_status = {
-            "/": GIT_STATUS_CURRENT,
-            "/current/some_path": "another_git_status",
-            "/current/another_path": "another_git_status",
-        }
+        mocked_ignore = MagicMock()
 
         mocked_full_path.return_value = "full_path"
         mocked_repo.checkout = mocked_checkout
-        mocked_repo.status.return_value = mocked_status
-        mocked_stats.st_mode = "another_mode"
-
-        def contains(self, path):
-            if path == "/current/another_path":
-                return True
-            return False
-
-        mocked_index.__contains__ = contains
+        mocked_repo.revparse_single.side_effect = [
+            MagicMock(tree="old_tree"),
+            MagicMock(tree="new_tree"),
+        ]
+        mocked_repo.diff.return_value.deltas = [
+            self.get_delta(GIT_DELTA_DELETED, "some_path", "some_path"),
+            self.get_delta(GIT_DELTA_MODIFIED, "another_path", "another_path"),
+            self.get_delta(GIT_DELTA_ADDED, "dir", "dir", GIT_FILEMODE_TREE),
+        ]
+        mocked_stats.st_mode = S_IFREG | 0o755
+        mocked_index.__contains__.return_value = False
+        mocked_ignore.__contains__.return_value = False
         mocked_repo.index = mocked_index
 
         with patch("gitfs.repository.os") as mocked_os:
             mocked_os.lstat.return_value = mocked_stats
+            mocked_os.path.lexists.return_value = True
 
             repo = Repository(mocked_repo)
+            repo.ignore = mocked_ignore
             repo._full_path = mocked_full_path
-            repo.get_git_object_stat = lambda x: {"st_mode": "a_stat"}
 
             assert repo.checkout("ref", "args") == "done"
-            assert mocked_repo.status.call_count == 1
+            assert mocked_repo.status.call_count == 0
             mocked_checkout.assert_called_once_with("ref", "args")
+            mocked_repo.revparse_single.assert_called_with("ref")
+            mocked_repo.diff.assert_called_once_with("old_tree", "new_tree")
             mocked_os.unlink.assert_called_once_with("full_path")
             mocked_os.lstat.assert_called_once_with("full_path")
-            mocked_os.chmod.assert_called_once_with("full_path", "another_mode")
-            mocked_index.add.assert_called_once_with("current/another_path")
+            assert "another_path" in repo.dirty_paths
+            assert "another_path" in repo.stale_paths
+            assert mocked_ignore.update.call_count == 1
 
-    def test_checkout_with_directory_in_status(self):
-        mocked_checkout = MagicMock(return_value="done")
+    def test_checkout_with_matching_modes(self):
         mocked_repo = MagicMock()
-        mocked_full_path = MagicMock()
-        mocked_index = MagicMock()
-        mocked_stats = MagicMock()
-        mocked_status = {
-            "/": GIT_STATUS_CURRENT,
-            "/current/some_path": "another_git_status",
-            "/current/another_path": "another_git_status",
-        }
+        mocked_stats = MagicMock(st_mode=S_IFREG | 0o644)
 
-        mocked_full_path.return_value = "full_path"
-        mocked_repo.checkout = mocked_checkout
-        mocked_repo.status.return_value = mocked_status
-        mocked_stats.st_mode = "16877"
+        mocked_repo.diff.return_value.deltas = [
+            self.get_delta(GIT_DELTA_MODIFIED, "path", "path"),
+            self.get_delta(GIT_DELTA_MODIFIED, "link", "link", mode=GIT_FILEMODE_LINK),
+        ]
 
-        def contains(self, path):
-            if path == "/current/another_path":
-                return True
-            return False
+        with patch("gitfs.repository.os") as mocked_os:
+            mocked_os.lstat.side_effect = [
+                mocked_stats,
+                MagicMock(st_mode=S_IFLNK | 0o777),
+            ]
 
-        mocked_index.__contains__ = contains
-        mocked_repo.index = mocked_index
+            repo = Repository(mocked_repo)
+            repo.ignore = MagicMock()
+            repo.checkout("ref")
+
+        assert mocked_repo.index.add.call_count == 0
+
+    def test_checkout_with_directory_left_behind(self):
+        mocked_repo = MagicMock()
+        mocked_ignore = MagicMock()
+        mocked_full_path = MagicMock(return_value="full_path")
+
+        mocked_repo.diff.return_value.deltas = [
+            self.get_delta(GIT_DELTA_DELETED, "some_path", "some_path"),
+            self.get_delta(GIT_DELTA_DELETED, "ignored", "ignored"),
+            self.get_delta(GIT_DELTA_DELETED, "tracked", "tracked"),
+        ]
+        mocked_repo.index.__contains__ = lambda self, path: path == "tracked"
+        mocked_ignore.__contains__ = lambda self, path: path == "ignored"
 
         mocked_os = MagicMock()
         mocked_rmtree = MagicMock()
         with patch.multiple("gitfs.repository", os=mocked_os, rmtree=mocked_rmtree):
             mocked_os.unlink.side_effect = OSError
-            mocked_os.lstat.return_value = mocked_stats
+            mocked_os.path.lexists.return_value = True
 
             repo = Repository(mocked_repo)
+            repo.ignore = mocked_ignore
             repo._full_path = mocked_full_path
-            repo.get_git_object_stat = lambda x: {"st_mode": "a_stat"}
+            repo.checkout("ref")
 
-            assert repo.checkout("ref", "args") == "done"
-            assert mocked_repo.status.call_count == 1
-            mocked_checkout.assert_called_once_with("ref", "args")
+            mocked_os.unlink.assert_called_once_with("full_path")
             mocked_rmtree.assert_called_once_with("full_path", onerror=ANY)
-            mocked_os.lstat.assert_called_once_with("full_path")
-            mocked_os.chmod.assert_called_once_with("full_path", "16877")
-            mocked_index.add.assert_called_once_with("current/another_path")
+            mocked_full_path.assert_called_once_with("some_path")
+
+    def test_checkout_removes_the_deleted_directories(self):
+        mocked_repo = MagicMock()
+        mocked_get_entry = MagicMock()
+        mocked_full_path = MagicMock(return_value="full_path")
+
+        mocked_repo.revparse_single.return_value.tree = "tree"
+        mocked_repo.diff.return_value.deltas = [
+            self.get_delta(GIT_DELTA_DELETED, "a/b/c", "a/b/c")
+        ]
+        mocked_repo.index.__contains__.return_value = False
+        mocked_get_entry.side_effect = lambda tree, path: (
+            "entry" if path == "/a" else None
+        )
+
+        mocked_os = MagicMock()
+        mocked_rmtree = MagicMock()
+        with patch.multiple("gitfs.repository", os=mocked_os, rmtree=mocked_rmtree):
+            mocked_os.unlink.side_effect = OSError
+            mocked_os.path.lexists.return_value = True
+
+            repo = Repository(mocked_repo)
+            repo.ignore = MagicMock()
+            repo.ignore.__contains__.return_value = False
+            repo.get_git_entry = mocked_get_entry
+            repo._full_path = mocked_full_path
+            repo.checkout("ref")
+
+        mocked_full_path.assert_called_once_with("a/b")
+        mocked_rmtree.assert_called_once_with("full_path", onerror=ANY)
+
+    def test_checkout_from_an_unborn_head(self):
+        mocked_repo = MagicMock()
+        mocked_tree = MagicMock()
+
+        mocked_repo.revparse_single.side_effect = [
+            KeyError,
+            MagicMock(tree=mocked_tree),
+        ]
+        mocked_tree.diff_to_tree.return_value.deltas = []
+
+        repo = Repository(mocked_repo)
+        repo.ignore = MagicMock()
+        repo.checkout("ref")
+
+        mocked_tree.diff_to_tree.assert_called_once_with(swap=True)
+        assert mocked_repo.diff.call_count == 0
 
     def test_git_obj_default_stats_with_invalid_obj(self):
         mocked_repo = MagicMock()
-        mocked_git_obj = MagicMock()
-        mocked_git_obj.return_value = None
+        mocked_git_entry = MagicMock()
+        mocked_git_entry.return_value = None
 
         repo = Repository(mocked_repo)
-        repo.get_git_object_type = mocked_git_obj
+        repo.get_git_entry = mocked_git_entry
 
         assert repo.get_git_object_default_stats("ref", "/") == {
             "st_mode": S_IFDIR | 0o555,
@@ -481,22 +1012,77 @@ class TestRepository(RepositoryBaseTest):
 
     def test_git_obj_default_stats_with_valid_obj(self):
         mocked_repo = MagicMock()
-        mocked_git_obj = MagicMock()
-        mocked_size = MagicMock()
-
-        mocked_git_obj.return_value = GIT_FILEMODE_BLOB
-        mocked_size.return_value = 10
+        mocked_git_entry = MagicMock()
+        mocked_git_entry.return_value = GitEntry(GIT_FILEMODE_BLOB, 1, 10)
 
         repo = Repository(mocked_repo)
-        repo.get_git_object_type = mocked_git_obj
-        repo.get_blob_size = mocked_size
+        repo.get_git_entry = mocked_git_entry
 
         assert repo.get_git_object_default_stats("ref", "/ups") == {
             "st_mode": S_IFREG | 0o444,
             "st_size": 10,
         }
-        mocked_size.assert_called_once_with("ref", "/ups")
-        mocked_git_obj.assert_called_once_with("ref", "/ups")
+        mocked_git_entry.assert_called_once_with("ref", "/ups")
+
+    def test_get_commit_stats_is_memoized(self):
+        mocked_commit = MagicMock(id="commit_id", tree="tree")
+        mocked_stats = MagicMock(return_value={"st_mode": S_IFREG | 0o444})
+
+        repo = Repository(MagicMock())
+        repo.get_git_object_default_stats = mocked_stats
+
+        first = repo.get_commit_stats(mocked_commit, "/ups")
+        first["st_size"] = 10
+        second = repo.get_commit_stats(mocked_commit, "/ups")
+
+        assert second == {"st_mode": S_IFREG | 0o444}
+        mocked_stats.assert_called_once_with("tree", "/ups")
+        assert repo.stats.cache_info()[:2] == (1, 1)
+
+    def test_get_commit_stats_with_invalid_obj(self):
+        mocked_commit = MagicMock(id="commit_id", tree="tree")
+
+        repo = Repository(MagicMock())
+        repo.get_git_object_default_stats = MagicMock(return_value=None)
+
+        assert repo.get_commit_stats(mocked_commit, "/ups") is None
+        assert ("commit_id", "/ups") not in repo.stats
+
+    def test_list_commit_stats(self, tmpdir):
+        pygit2_repo = init_repository(str(tmpdir), bare=True)
+        tree = self.get_tree(pygit2_repo, ["a/b", "c"])
+        signature = Signature("gitfs", "gitfs@example.com")
+        oid = pygit2_repo.create_commit("HEAD", signature, signature, "m", tree.id, [])
+        commit = pygit2_repo[oid]
+
+        repo = Repository(pygit2_repo)
+        repo.get_git_object_default_stats = MagicMock()
+        repo.cat_file = MagicMock(wraps=repo.cat_file)
+
+        assert repo.list_commit_stats(commit, commit.tree, "/") == [
+            ("a", {"st_mode": S_IFDIR | 0o555, "st_nlink": 2}),
+            ("c", {"st_mode": S_IFREG | 0o444, "st_size": 7}),
+        ]
+        assert repo.list_commit_stats(commit, pygit2_repo[tree["a"].id], "/a") == [
+            ("b", {"st_mode": S_IFREG | 0o444, "st_size": 7})
+        ]
+
+        assert repo.get_commit_stats(commit, "/a/b")["st_size"] == 7
+        assert repo.get_git_entry(commit.tree, "/c").size == 7
+        assert repo.get_git_object_default_stats.call_count == 0
+        assert repo.cat_file.sizes.call_count == 2
+        assert repo.cat_file.size.call_count == 0
+
+    def test_blob_sizes_without_git(self):
+        mocked_repo = MagicMock()
+        mocked_repo.__getitem__.side_effect = lambda oid: MagicMock(size=len(oid))
+
+        repo = Repository(mocked_repo)
+        repo.cat_file = MagicMock(**{"sizes.side_effect": OSError})
+        assert repo._blob_sizes(["a", "bb"]) == [1, 2]
+
+        repo.cat_file = MagicMock(**{"sizes.return_value": [5, None]})
+        assert repo._blob_sizes(["a", "bb"]) == [5, 2]
 
     def test_full_path(self):
         mocked_repo = MagicMock()
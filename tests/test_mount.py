@@ -39,6 +39,8 @@ class TestMount(object):
         mocked_fuse = MagicMock()
         mocked_merge_worker = MagicMock()
         mocked_fetch_worker = MagicMock()
+        mocked_policy = MagicMock()
+        mocked_journal = MagicMock()
 
         args = EmptyObject(
             **{
@@ -55,10 +57,20 @@ class TestMount(object):
                 "allow_others": True,
                 "repo_path": "repo_path",
                 "branch": "branch",
+                "history_index": "history_index",
+                "commit_journal": "commit_journal",
                 "user": "user",
                 "group": "group",
                 "max_size": "max_size",
                 "max_offset": "max_offset",
+                "stream_threshold": 32,
+                "hash_threshold": 8,
+                "trace_sample": 0,
+                "trace_size": 4096,
+                "trace_file": "",
+                "commit_max_latency": 5,
+                "commit_max_paths": 100,
+                "commit_max_size": 2,
                 "upstream": "origin",
                 "fetch_timeout": 10,
                 "merge_timeout": 10,
@@ -83,6 +95,8 @@ class TestMount(object):
         with patch.multiple(
             "gitfs.mounter",
             CommitQueue=MagicMock(return_value=mocked_queue),
+            CommitJournal=mocked_journal,
+            CommitPolicy=mocked_policy,
             Router=MagicMock(return_value=mocked_router),
             prepare_routes=mocked_routes,
             SyncWorker=mocked_merger,
@@ -94,6 +108,8 @@ class TestMount(object):
             assert_result = (mocked_merge_worker, mocked_fetch_worker, mocked_router)
 
             assert prepare_components(args) == assert_result
+            mocked_journal.assert_called_once_with("commit_journal")
+            mocked_queue.restore.assert_called_once_with(mocked_router.repo)
             mocked_fetcher.assert_called_once_with(
                 upstream="origin",
                 branch="branch",
@@ -102,6 +118,9 @@ class TestMount(object):
                 idle_timeout=10,
                 credentials="cred",
             )
+            mocked_policy.assert_called_once_with(
+                max_latency=5, max_paths=100, max_bytes=2 * 1024 * 1024
+            )
 
             asserted_call = {
                 "repository": "repo",
@@ -110,6 +129,7 @@ class TestMount(object):
                 "timeout": 10,
                 "repo_path": "repo_path",
                 "commit_queue": mocked_queue,
+                "policy": mocked_policy.return_value,
                 "credentials": "cred",
                 "min_idle_times": 1,
             }
@@ -172,6 +192,7 @@ class TestMount(object):
             mocked_prepare.assert_called_once_with(mocked_args)
 
             excepted_call = {
+                "raw_fi": True,
                 "foreground": mocked_args.foreground,
                 "allow_root": mocked_args.allow_root,
                 "allow_other": mocked_args.allow_other,
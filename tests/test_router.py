@@ -18,7 +18,7 @@ from mock import MagicMock, patch
 from fuse import FuseOSError
 
 from gitfs.views import CurrentView
-from gitfs.router import Router
+from gitfs.router import Dispatcher, Router
 
 
 class TestRouter(object):
@@ -67,11 +67,15 @@ class TestRouter(object):
             "mount_path": "mount_path",
             "credentials": mocked_credentials,
             "branch": mocked_branch,
+            "history_index": "history_index",
             "user": "user",
             "group": "root",
             "commit_queue": mocked_queue,
             "max_size": 10,
             "max_offset": 10,
+            "stream_threshold": 20,
+            "hash_threshold": 30,
+            "tracer": None,
             "ignore_file": "",
             "module_file": "",
             "hard_ignore": None,
@@ -116,11 +120,14 @@ class TestRouter(object):
         mocks["getpwnam"].assert_called_once_with(mocks["user"])
         mocks["getgrnam"].assert_called_once_with(mocks["group"])
 
+        assert mocks["repo"].commits.path == "history_index"
         assert mocks["repo"].commits.update.call_count == 1
         assert mocks["time"].time.call_count == 1
         assert router.commit_queue == mocks["queue"]
         assert router.max_size == 10
         assert router.max_offset == 10
+        assert router.repo.stream_threshold == 20
+        assert router.repo.hash_threshold == 30
 
     def test_init(self):
         mocked_fetch = MagicMock()
@@ -153,6 +160,11 @@ class TestRouter(object):
         assert mocked_sync.join.call_count == 1
         assert mocks["fetch"].set.call_count == 1
         assert mocks["shutting"].set.call_count == 1
+        router.repo.hashers.shutdown.assert_called_once_with(wait=True)
+        assert router.repo.commits.save.call_count == 1
+        assert router.repo.cat_file.close.call_count == 1
+        assert mocks["queue"].close.call_count == 1
+        assert router.tracer is None
         mocks["shutil"].rmtree.assert_called_once_with(mocks["repo_path"])
 
     def test_call_with_invalid_operation(self):
@@ -181,6 +193,53 @@ class TestRouter(object):
             assert result == mocked_view.random_operation("/")
             assert mocked_idle_event.clear.call_count == 1
 
+    def test_call_with_a_tracer(self):
+        mocked_view = MagicMock()
+        mocked_tracer = MagicMock()
+
+        router, mocks = self.get_new_router()
+        router.tracer = mocked_tracer
+        router.register([("/", MagicMock(return_value=mocked_view))])
+
+        with patch("gitfs.router.lru_cache") as mocked_cache:
+            mocked_cache.get_if_exists.return_value = None
+
+            mocked_tracer.sample.return_value = False
+            assert router("read", "/file") == mocked_view.read.return_value
+            assert mocked_tracer.trace.call_count == 0
+
+            mocked_tracer.sample.return_value = True
+            assert router("read", "/file") == mocked_tracer.trace.return_value
+            mocked_tracer.trace.assert_called_once_with(
+                mocked_view, "read", "/file", mocked_view.read, ("file",)
+            )
+
+    def test_call_with_open_files(self):
+        mocked_view = MagicMock()
+        mocked_file_info = MagicMock(flags=32768)
+
+        router, mocks = self.get_new_router()
+        router.register([("/", MagicMock(return_value=mocked_view))])
+
+        with patch("gitfs.router.lru_cache") as mocked_cache:
+            mocked_cache.get_if_exists.return_value = None
+
+            assert router("open", "/file", mocked_file_info) == 0
+            mocked_view.open.assert_called_once_with("file", 32768)
+            assert mocked_file_info.fh == mocked_view.open.return_value
+            assert mocked_file_info.keep_cache == mocked_view.keeps_cache.return_value
+            mocked_view.keeps_cache.assert_called_once_with("file")
+
+            assert router("create", "/file", 0o644, mocked_file_info) == 0
+            mocked_view.create.assert_called_once_with("file", 0o644)
+            assert mocked_file_info.fh == mocked_view.create.return_value
+
+            router("read", "/file", 10, 0, MagicMock(fh=3))
+            mocked_view.read.assert_called_once_with("file", 10, 0, 3)
+
+            router("getattr", "/file", None)
+            mocked_view.getattr.assert_called_once_with("file", None)
+
     def test_call_with_init(self):
         mocked_init = MagicMock()
 
@@ -251,3 +310,60 @@ class TestRouter(object):
         router, mocks = self.get_new_router()
         assert router.bmap is False
         assert router.read is not False
+
+
+class TestDispatcher(object):
+    def get_dispatcher(self):
+        return Dispatcher(
+            [
+                {"regex": r"^/history/(?P<date>\d{4}-\d{2}-\d{2})", "view": "date"},
+                {"regex": r"^/history", "view": "history"},
+                {"regex": r"^/current", "view": "current"},
+                {"regex": r"^/", "view": "index"},
+            ]
+        )
+
+    def test_compile(self):
+        dispatcher = self.get_dispatcher()
+
+        prefixes = [route.prefix for route in dispatcher.routes]
+        assert prefixes == ["/history/", "/history", "/current", "/"]
+        assert sorted(dispatcher.components) == ["history"]
+        assert [route.view for route in dispatcher.components["history"]] == [
+            "date",
+            "history",
+            "index",
+        ]
+        assert [route.view for route in dispatcher.default] == [
+            "history",
+            "current",
+            "index",
+        ]
+
+    def test_match(self):
+        dispatcher = self.get_dispatcher()
+
+        route, result = dispatcher.match("/history/2014-09-19/file")
+        assert route.view == "date"
+        assert result.group(0) == "/history/2014-09-19"
+        assert result.groupdict() == {"date": "2014-09-19"}
+
+        assert dispatcher.match("/history/other")[0].view == "history"
+        assert dispatcher.match("/current/file")[0].view == "current"
+        assert dispatcher.match("/currentfile")[0].view == "current"
+        assert dispatcher.match("/file")[0].view == "index"
+
+    def test_match_with_quantifiers(self):
+        dispatcher = Dispatcher(
+            [
+                {"regex": r"^/files?/", "view": "files"},
+                {"regex": r"x(\d)", "view": "unanchored"},
+            ]
+        )
+
+        assert dispatcher.routes[0].prefix == "/file"
+        assert not dispatcher.routes[1].anchored
+        assert dispatcher.routes[1].positional
+        assert dispatcher.match("/file/a")[0].view == "files"
+        assert dispatcher.match("/a/x1")[0].view == "unanchored"
+        assert dispatcher.match("/a") == (None, None)
@@ -0,0 +1,89 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from errno import ENOENT
+
+import pytest
+from mock import MagicMock, patch
+
+from fuse import FuseOSError
+
+from gitfs.trace import Span, Tracer
+
+
+class View(object):
+    pass
+
+
+class TestTracer(object):
+    def test_sample(self):
+        tracer = Tracer(sample=0.25)
+
+        assert [tracer.sample() for _ in range(8)] == [
+            True,
+            False,
+            False,
+            False,
+            True,
+            False,
+            False,
+            False,
+        ]
+
+    def test_trace(self):
+        tracer = Tracer(size=2)
+        read = MagicMock(return_value=b"data")
+
+        with patch("gitfs.trace.time") as mocked_time:
+            mocked_time.time.side_effect = [10, 12]
+            result = tracer.trace(View(), "read", "/current/a/b", read, ("/a/b", 4))
+
+        assert result == b"data"
+        read.assert_called_once_with("/a/b", 4)
+        assert list(tracer.spans) == [Span(10, 2, "View", "read", "current", 4, None)]
+
+    def test_trace_write(self):
+        tracer = Tracer()
+        tracer.trace(View(), "write", "/current/a", MagicMock(return_value=3), ())
+
+        assert tracer.spans[0].size == 3
+
+    def test_trace_an_error(self):
+        tracer = Tracer()
+        getattr = MagicMock(side_effect=FuseOSError(ENOENT))
+
+        with pytest.raises(FuseOSError):
+            tracer.trace(View(), "getattr", "/history", getattr, ("/",))
+
+        assert tracer.spans[0].error == ENOENT
+        assert tracer.spans[0].path_class == "history"
+
+    def test_ring_buffer(self):
+        tracer = Tracer(size=2)
+        for operation in ["open", "read", "release"]:
+            tracer.trace(View(), operation, "/", MagicMock(return_value=0), ())
+
+        assert [span.operation for span in tracer.spans] == ["read", "release"]
+
+    def test_trace_to_a_file(self, tmpdir):
+        path = tmpdir.join("trace")
+        tracer = Tracer(path=str(path))
+
+        with patch("gitfs.trace.time") as mocked_time:
+            mocked_time.time.side_effect = [10, 12]
+            tracer.trace(View(), "open", "/current/a", MagicMock(return_value=5), ())
+        tracer.close()
+
+        assert path.read() == "10\t2\tView\topen\tcurrent\t0\tNone\n"
@@ -83,3 +83,21 @@ class TestArgs(object):
             mocked_log.setLevel.assert_called_once_with("DEBUG")
             mocked_urlparse.assert_has_calls([call(url), call("ssh://" + url)])
             mocked_grp.getgrgid.has_calls([call(1)])
+
+    def test_state_files_are_kept_per_mount_point(self):
+        args = Args.__new__(Args)
+        first = MagicMock(
+            remote_url="url", branch="master", mount_point="/a", repo_path="/s/1"
+        )
+        second = MagicMock(
+            remote_url="url", branch="master", mount_point="/b", repo_path="/s/2"
+        )
+        remount = MagicMock(
+            remote_url="url", branch="master", mount_point="/a", repo_path="/s/3"
+        )
+
+        journal = args.get_commit_journal(first)
+        assert journal.startswith("/s/.")
+        assert journal.endswith(".journal")
+        assert journal != args.get_commit_journal(second)
+        assert journal == args.get_commit_journal(remount)
@@ -0,0 +1,71 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+from pygit2 import init_repository
+
+from gitfs.utils.cat_file import CatFile
+
+
+class TestCatFile(object):
+    def test_size(self, tmpdir):
+        repo = init_repository(str(tmpdir), bare=True)
+        oid = repo.create_blob(b"content")
+
+        cat_file = CatFile(repo.path)
+        try:
+            assert cat_file.size(oid) == 7
+            assert cat_file.size(oid) == 7
+            with pytest.raises(KeyError):
+                cat_file.size("a" * 40)
+        finally:
+            cat_file.close()
+
+        assert cat_file.batch is None
+
+    def test_sizes(self, tmpdir):
+        repo = init_repository(str(tmpdir), bare=True)
+        oids = [repo.create_blob(b"x" * size) for size in range(600)]
+        oids.insert(300, "a" * 40)
+
+        cat_file = CatFile(repo.path)
+        try:
+            sizes = cat_file.sizes(oids)
+        finally:
+            cat_file.close()
+
+        assert sizes == list(range(300)) + [None] + list(range(300, 600))
+
+    def test_size_after_git_exited(self, tmpdir):
+        repo = init_repository(str(tmpdir), bare=True)
+        oid = repo.create_blob(b"content")
+
+        cat_file = CatFile(repo.path)
+        cat_file.size(oid)
+        cat_file.batch.kill()
+        cat_file.batch.wait()
+
+        assert cat_file.size(oid) == 7
+        cat_file.close()
+
+    def test_stream(self, tmpdir):
+        repo = init_repository(str(tmpdir), bare=True)
+        oid = repo.create_blob(b"0123456789")
+
+        cat_file = CatFile(repo.path)
+        assert list(cat_file.stream(oid, 4)) == [b"0123", b"4567", b"89"]
+
+        with pytest.raises(KeyError):
+            list(cat_file.stream("a" * 40, 4))
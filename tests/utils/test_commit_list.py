@@ -26,6 +26,10 @@ class TestCommitList(object):
         commit_list = CommitsList()
         assert mocked_commit not in commit_list
 
+        commit_list.append(mocked_commit)
+        assert mocked_commit in commit_list
+        assert mocked_commit in commit_list[:1]
+
     def test_index(self):
         mocked_commit = MagicMock()
         mocked_commit.hex = "hexish"
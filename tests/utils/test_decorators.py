@@ -22,6 +22,8 @@ from six import iteritems
 
 from gitfs.utils.decorators.retry import retry
 from gitfs.utils.decorators.while_not import while_not
+from gitfs.utils.decorators.write_operation import write_operation
+from gitfs.events import writers
 
 
 class MockedWraps(object):
@@ -85,3 +87,37 @@ class TestWhileNotDecorator(object):
             not_now(mocked_method)("arg", kwarg="kwarg")
 
             mocked_time.sleep.assert_called_once_with(0.2)
+
+
+class TestWriteOperationDecorator(object):
+    def test_write_operation(self):
+        @write_operation
+        def write():
+            return writers.value
+
+        assert write() == 1
+        assert writers.value == 0
+
+    def test_write_operation_waits_for_syncing(self):
+        mocked_syncing = MagicMock()
+        mocked_sync_done = MagicMock()
+        mocked_syncing.is_set.side_effect = [True, False]
+
+        def wait():
+            assert writers.value == 0
+
+        mocked_sync_done.wait.side_effect = wait
+
+        @write_operation
+        def write():
+            return writers.value
+
+        with patch.multiple(
+            "gitfs.utils.decorators.write_operation",
+            syncing=mocked_syncing,
+            sync_done=mocked_sync_done,
+        ):
+            assert write() == 1
+
+        assert mocked_sync_done.wait.call_count == 1
+        assert writers.value == 0
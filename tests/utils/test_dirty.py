@@ -0,0 +1,67 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from gitfs.utils.dirty import DirtyPaths, ADD, HASH, REMOVE
+
+
+class TestDirtyPaths(object):
+    def test_the_last_change_wins(self):
+        dirty = DirtyPaths()
+        dirty.add("a")
+        dirty.add("d", "oid")
+        dirty.remove("a")
+        dirty.update(add=["b"], remove=["b", "c"])
+
+        assert "a" in dirty
+        assert len(dirty) == 4
+        assert dirty.drain() == ([], {"a": REMOVE, "b": ADD, "c": REMOVE, "d": "oid"},)
+
+    def test_drain(self):
+        dirty = DirtyPaths()
+        dirty.add("a")
+
+        pending = dirty.drain()
+        dirty.add("b")
+
+        assert pending == ([], {"a": ADD})
+        assert "a" not in dirty
+        assert dirty.drain() == ([], {"b": ADD})
+
+    def test_expect(self):
+        dirty = DirtyPaths()
+        dirty.add("a")
+        dirty.expect("a")
+        dirty.expect("b")
+        dirty.expect("c")
+
+        assert "b" in dirty
+        assert dirty.changed("a")
+        assert not dirty.changed("b")
+        assert not dirty.changed("d")
+
+        dirty.settle("a")
+        dirty.settle("b")
+
+        assert dirty.drain() == ([], {"a": ADD, "c": HASH})
+
+    def test_move(self):
+        dirty = DirtyPaths()
+        dirty.update(add=["a/b", "a/c/d", "ab"], remove=["a/e"])
+        dirty.move("a", "f")
+        dirty.move("ab")
+
+        trees, paths = dirty.drain()
+        assert trees == [("a", "f"), ("ab", None)]
+        assert paths == {"f/b": ADD, "f/c/d": ADD, "f/e": REMOVE, "ab": ADD}
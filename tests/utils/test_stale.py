@@ -0,0 +1,46 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from gitfs.utils.stale import StalePaths
+
+
+class TestStalePaths(object):
+    def test_pop(self):
+        stale = StalePaths()
+        stale.update(["a", "b"])
+
+        assert len(stale) == 2
+        assert stale.pop("a") is True
+        assert stale.pop("a") is False
+        assert stale.pop("c") is False
+        assert "a" not in stale
+        assert "b" in stale
+
+    def test_limit(self):
+        stale = StalePaths(limit=2)
+        stale.update(["a", "b"])
+        stale.update(["c"])
+
+        assert len(stale) == 0
+        assert "d" in stale
+        assert stale.pop("a") is True
+        assert stale.pop("a") is False
+        assert stale.pop("b") is True
+
+        stale.update(["a"])
+        assert stale.pop("a") is True
+        assert stale.pop("b") is False
+        assert stale.pop("c") is True
+        assert stale.pop("b") is True
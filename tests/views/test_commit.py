@@ -32,16 +32,34 @@ class TestCommitView(object):
 
         mocked_entry.name = "entry"
         mocked_commit.tree = [mocked_entry]
+        mocked_commit.commit_time = 10
         mocked_repo.revparse_single.return_value = mocked_commit
+        mocked_repo.list_commit_stats.return_value = [
+            ("entry", {"st_mode": 0o100644, "st_size": 3}),
+            ("submodule", None),
+        ]
 
-        view = CommitView(repo=mocked_repo, commit_sha1="sha1")
+        view = CommitView(
+            repo=mocked_repo, commit_sha1="sha1", uid=1, gid=1, mount_time=0
+        )
         with patch("gitfs.views.commit.os") as mocked_os:
             mocked_os.path.split.return_value = [None, None]
 
             dirs = [entry for entry in view.readdir("/path", 0)]
-            assert dirs == [".", "..", "entry"]
+            attrs = {
+                "st_uid": 1,
+                "st_gid": 1,
+                "st_ctime": 10,
+                "st_mtime": 10,
+                "st_mode": 0o100644,
+                "st_size": 3,
+            }
+            assert dirs == [".", "..", ("entry", attrs, 0), "submodule"]
 
             mocked_os.path.split.assert_called_once_with("/path")
+            mocked_repo.list_commit_stats.assert_called_once_with(
+                mocked_commit, mocked_commit.tree, "/path"
+            )
 
     def test_readdir_with_tree_name(self):
         mocked_repo = MagicMock()
@@ -52,16 +70,22 @@ class TestCommitView(object):
         mocked_commit.tree = "tree"
         mocked_repo.revparse_single.return_value = mocked_commit
         mocked_repo.get_git_object.return_value = [mocked_entry]
+        mocked_repo.list_commit_stats.return_value = []
 
-        view = CommitView(repo=mocked_repo, commit_sha1="sha1")
+        view = CommitView(
+            repo=mocked_repo, commit_sha1="sha1", uid=1, gid=1, mount_time=0
+        )
         with patch("gitfs.views.commit.os") as mocked_os:
             mocked_os.path.split.return_value = [None, True]
 
             dirs = [entry for entry in view.readdir("/path", 0)]
-            assert dirs == [".", "..", "entry"]
+            assert dirs == [".", ".."]
 
             mocked_os.path.split.assert_called_once_with("/path")
             mocked_repo.get_git_object.assert_called_once_with("tree", "/path")
+            mocked_repo.list_commit_stats.assert_called_once_with(
+                mocked_commit, [mocked_entry], "/path"
+            )
 
     def test_access_with_missing_relative_path(self):
         mocked_repo = MagicMock()
@@ -124,7 +148,7 @@ class TestCommitView(object):
         mocked_commit.tree = "tree"
         mocked_commit.commit_time = "now+1"
         mocked_repo.revparse_single.return_value = mocked_commit
-        mocked_repo.get_git_object_default_stats.return_value = stats
+        mocked_repo.get_commit_stats.return_value = stats
 
         view = CommitView(
             repo=mocked_repo, commit_sha1="sha1", mount_time="now", uid=1, gid=1
@@ -147,7 +171,7 @@ class TestCommitView(object):
         mocked_commit.tree = "tree"
         mocked_commit.commit_time = "now+1"
         mocked_repo.revparse_single.return_value = mocked_commit
-        mocked_repo.get_git_object_default_stats.return_value = None
+        mocked_repo.get_commit_stats.return_value = None
 
         view = CommitView(
             repo=mocked_repo, commit_sha1="sha1", mount_time="now", uid=1, gid=1
@@ -156,8 +180,8 @@ class TestCommitView(object):
         with pytest.raises(FuseOSError):
             view.getattr("/path", 1)
 
-        args = ("tree", "/path")
-        mocked_repo.get_git_object_default_stats.assert_called_once_with(*args)
+        args = (mocked_commit, "/path")
+        mocked_repo.get_commit_stats.assert_called_once_with(*args)
 
     def test_getattr_for_a_valid_file(self):
         mocked_repo = MagicMock()
@@ -166,7 +190,7 @@ class TestCommitView(object):
         mocked_commit.tree = "tree"
         mocked_commit.commit_time = "now+1"
         mocked_repo.revparse_single.return_value = mocked_commit
-        mocked_repo.get_git_object_default_stats.return_value = {
+        mocked_repo.get_commit_stats.return_value = {
             "st_mode": S_IFREG | 0o444,
             "st_size": 10,
         }
@@ -186,8 +210,8 @@ class TestCommitView(object):
             "st_size": 10,
         }
         assert result == asserted_result
-        args = ("tree", "/path")
-        mocked_repo.get_git_object_default_stats.assert_called_once_with(*args)
+        args = (mocked_commit, "/path")
+        mocked_repo.get_commit_stats.assert_called_once_with(*args)
 
     def test_readlink(self):
         mocked_repo = MagicMock()
@@ -213,13 +237,13 @@ class TestCommitView(object):
 
         mocked_commit.tree = "tree"
         mocked_repo.revparse_single.return_value = mocked_commit
-        mocked_repo.get_blob_data.return_value = [1, 1, 1]
+        mocked_repo.read_blob.return_value = b"b"
 
         view = CommitView(
             repo=mocked_repo, commit_sha1="sha1", mount_time="now", uid=1, gid=1
         )
-        assert view.read("/path", 1, 1, 0) == [1]
-        mocked_repo.get_blob_data.assert_called_once_with("tree", "/path")
+        assert view.read("/path", 1, 1, 0) == b"b"
+        mocked_repo.read_blob.assert_called_once_with("tree", "/path", 1, 1)
 
     def test_validate_commit_path_with_no_entries(self):
         mocked_repo = MagicMock()
@@ -17,11 +17,12 @@ import os
 from threading import Event
 
 import pytest
-from mock import patch, MagicMock, call
+from mock import patch, MagicMock, DEFAULT, call
 
 from fuse import FuseOSError
 from gitfs.views.current import CurrentView
 from gitfs.cache.gitignore import CachedIgnore
+from gitfs.utils.stale import StalePaths
 
 
 class TestCurrentView(object):
@@ -29,11 +30,9 @@ class TestCurrentView(object):
         mocked_re = MagicMock()
         mocked_index = MagicMock()
         mocked_os = MagicMock()
-        mocked_result = MagicMock()
 
-        mocked_result.rename.return_value = True
         mocked_re.sub.return_value = "new"
-        mocked_os.path.split.return_value = [1, 1]
+        mocked_os.path.isdir.return_value = False
 
         with patch.multiple("gitfs.views.current", re=mocked_re, os=mocked_os):
             from gitfs.views import current as current_view
@@ -42,16 +41,46 @@ class TestCurrentView(object):
             current_view.PassthroughView.rename = lambda self, old, new: True
 
             current = CurrentView(
-                regex="regex", repo="repo", repo_path="repo_path", ignore=CachedIgnore()
+                regex="regex",
+                repo=MagicMock(),
+                repo_path="repo_path",
+                ignore=CachedIgnore(),
             )
             current._stage = mocked_index
 
             result = current.rename("old", "new")
             assert result is True
             mocked_index.assert_called_once_with(
-                **{"remove": 1, "add": "new", "message": "Rename old to new"}
+                **{"remove": "old", "add": "new", "message": "Rename old to new"}
+            )
+            current_view.PassthroughView.rename = old_rename
+
+    def test_rename_directory(self):
+        mocked_re = MagicMock()
+        mocked_stage_tree = MagicMock()
+        mocked_os = MagicMock()
+
+        mocked_re.sub.return_value = "/new"
+        mocked_os.path.isdir.return_value = True
+
+        with patch.multiple("gitfs.views.current", re=mocked_re, os=mocked_os):
+            from gitfs.views import current as current_view
+
+            old_rename = current_view.PassthroughView.rename
+            current_view.PassthroughView.rename = lambda self, old, new: True
+
+            current = CurrentView(
+                regex="regex",
+                repo=MagicMock(),
+                repo_path="repo_path",
+                ignore=CachedIgnore(),
+            )
+            current._stage_tree = mocked_stage_tree
+
+            assert current.rename("/old", "/new") is True
+            mocked_stage_tree.assert_called_once_with(
+                "Rename /old to /new", remove="/old", add="/new"
             )
-            mocked_os.path.split.assert_called_once_with("old")
             current_view.PassthroughView.rename = old_rename
 
     def test_rename_in_git_dir(self):
@@ -185,7 +214,9 @@ class TestCurrentView(object):
         current.dirty = {1: {}}
 
         assert current.write("/path", "buf", 3, 1) == "done"
-        assert current.dirty == {1: {"message": "Update /path", "stage": True}}
+        assert current.dirty == {
+            1: {"message": "Update /path", "stage": True, "size": 3}
+        }
         current_view.PassthroughView.write = old_write
 
     def test_mkdir(self):
@@ -397,14 +428,84 @@ class TestCurrentView(object):
         current._stage("message", ["add"], ["remove"])
 
         mocked_queue.commit.assert_called_once_with(
-            add=["to-stage"], remove=["to-stage"], message="message"
+            add=["to-stage"], remove=["to-stage"], message="message", size=0
+        )
+        mocked_repo.dirty_paths.update.assert_called_once_with(
+            add=[["to-stage"]], remove=[["to-stage"]]
         )
-        mocked_repo.index.add.assert_called_once_with(["to-stage"])
-        mocked_repo.index.remove.assert_called_once_with(["to-stage"])
+        assert mocked_repo.index.add.call_count == 0
 
         mocked_files.has_calls([call(["add"])])
         mocked_sanitize.has_calls([call(["add"]), call(["remove"])])
 
+    def test_rmdir(self):
+        mocked_repo = MagicMock()
+        mocked_os = MagicMock()
+        mocked_stage_tree = MagicMock()
+
+        mocked_repo._full_path.return_value = "full/dir"
+        mocked_os.walk.return_value = [
+            ("full/dir/sub", [], ["file"]),
+            ("full/dir", ["sub"], [".keep"]),
+        ]
+        mocked_os.path.join = os.path.join
+        mocked_os.rmdir.return_value = "done"
+
+        with patch("gitfs.views.current.os", mocked_os):
+            with patch("gitfs.views.passthrough.os", mocked_os):
+                current = CurrentView(
+                    repo=mocked_repo, repo_path="repo_path", ignore=CachedIgnore()
+                )
+                current._stage_tree = mocked_stage_tree
+
+                assert current.rmdir("/dir") == "done"
+
+        mocked_os.walk.assert_called_once_with("full/dir", topdown=False)
+        assert mocked_os.unlink.call_args_list == [
+            call("full/dir/sub/file"),
+            call("full/dir/.keep"),
+        ]
+        assert mocked_os.rmdir.call_args_list == [
+            call("full/dir/sub"),
+            call("full/dir"),
+        ]
+        mocked_stage_tree.assert_called_once_with(
+            "Delete the /dir directory", remove="/dir"
+        )
+
+    def test_stage_with_blob(self):
+        mocked_repo = MagicMock()
+
+        current = CurrentView(
+            repo=mocked_repo,
+            repo_path="repo_path",
+            queue=MagicMock(),
+            ignore=CachedIgnore(),
+        )
+        current._get_files_from_path = MagicMock(return_value=[])
+        current._stage("message", add="/big", blob="oid")
+
+        mocked_repo.dirty_paths.update.assert_called_once_with(add=["big"], remove=[])
+        mocked_repo.dirty_paths.add.assert_called_once_with("big", "oid")
+
+    def test_stage_tree(self):
+        mocked_repo = MagicMock()
+        mocked_queue = MagicMock()
+
+        current = CurrentView(
+            repo=mocked_repo,
+            repo_path="repo_path",
+            queue=mocked_queue,
+            ignore=CachedIgnore(),
+        )
+        current._stage_tree("message", remove="/old", add="/new")
+
+        mocked_repo.dirty_paths.move.assert_called_once_with("old", "new")
+        mocked_queue.commit.assert_called_once_with(
+            add="new", remove="old", message="message"
+        )
+        assert mocked_repo.index.remove.call_count == 0
+
     def test_sanitize(self):
         current = CurrentView(repo="repo", repo_path="repo_path")
         assert current._sanitize("/path") == "path"
@@ -427,6 +528,17 @@ class TestCurrentView(object):
             assert current.open("path/", os.O_WRONLY) == 1
             mocked_os.open.assert_called_once_with("full_path", os.O_WRONLY)
 
+    def test_keeps_cache(self):
+        repo = MagicMock(_sanitize=lambda path: path.lstrip("/"))
+        repo.stale_paths = StalePaths()
+        repo.stale_paths.update(["merged"])
+
+        current = CurrentView(repo=repo, repo_path="repo_path")
+
+        assert current.keeps_cache("/file")
+        assert not current.keeps_cache("/merged")
+        assert current.keeps_cache("/merged")
+
     def test_release_with_stage(self):
         message = "I need to stage this"
         mocked_os = MagicMock()
@@ -434,17 +546,76 @@ class TestCurrentView(object):
 
         mocked_os.close.return_value = 0
 
-        with patch.multiple("gitfs.views.current", os=mocked_os):
+        mocked_repo = MagicMock()
+        mocked_queue = MagicMock()
+        mocked_writers = MagicMock()
+
+        with patch.multiple(
+            "gitfs.views.current", os=mocked_os, writers=mocked_writers
+        ):
             current = CurrentView(
-                repo="repo", repo_path="repo_path", ignore=CachedIgnore()
+                repo=mocked_repo,
+                repo_path="repo_path",
+                ignore=CachedIgnore(),
+                queue=mocked_queue,
             )
             current._stage = mocked_stage
-            current.dirty = {4: {"message": message, "stage": True}}
+            current.dirty = {4: {"message": message, "stage": True, "size": 3}}
 
             assert current.release("/path", 4) == 0
 
             mocked_os.close.assert_called_once_with(4)
-            mocked_stage.assert_called_once_with(add="/path", message=message)
+            mocked_repo.dirty_paths.expect.assert_called_once_with("path")
+            mocked_queue.expect.assert_called_once_with("path", 3)
+            mocked_repo.hashers.submit.assert_called_once_with(
+                current._stage_if_changed, "/path", message, 3
+            )
+            assert mocked_stage.call_count == 0
+            assert mocked_writers.__isub__.call_count == 0
+
+    def test_stage_if_changed(self):
+        mocked_repo = MagicMock()
+        mocked_stage = MagicMock()
+        mocked_repo.hash_file.side_effect = [
+            ("small", False),
+            ("big", True),
+            ("unchanged", False),
+            OSError,
+        ]
+        mocked_repo.is_changed.side_effect = [True, True, False]
+
+        mocked_queue = MagicMock()
+        mocked_writers = MagicMock()
+        mocked_writers.__isub__.return_value = mocked_writers
+
+        current = CurrentView(
+            repo=mocked_repo,
+            repo_path="repo_path",
+            ignore=CachedIgnore(),
+            queue=mocked_queue,
+        )
+        current._stage = mocked_stage
+
+        with patch.multiple(
+            "gitfs.views.current", log=DEFAULT, writers=mocked_writers
+        ) as mocked:
+            current._stage_if_changed("/small", "message", 3)
+            current._stage_if_changed("/big", "message", 30)
+            current._stage_if_changed("/unchanged", "message")
+            current._stage_if_changed("/missing", "message")
+
+        assert mocked_stage.call_args_list == [
+            call(add="/small", message="message", blob=None, size=3),
+            call(add="/big", message="message", blob="big", size=30),
+        ]
+        mocked_repo.is_changed.assert_called_with("/unchanged", "unchanged")
+        mocked_repo.dirty_paths.settle.assert_called_once_with("unchanged")
+        assert mocked_queue.settle.call_args_list == [
+            call("unchanged"),
+            call("missing"),
+        ]
+        assert mocked["log"].exception.call_count == 1
+        assert mocked_writers.__isub__.call_count == 4
 
     def test_release_without_stage(self):
         message = "No need to stage this"
@@ -453,7 +624,11 @@ class TestCurrentView(object):
 
         mocked_os.close.return_value = 0
 
-        with patch.multiple("gitfs.views.current", os=mocked_os):
+        mocked_writers = MagicMock()
+
+        with patch.multiple(
+            "gitfs.views.current", os=mocked_os, writers=mocked_writers
+        ):
             current = CurrentView(
                 repo="repo", repo_path="repo_path", ignore=CachedIgnore()
             )
@@ -464,3 +639,4 @@ class TestCurrentView(object):
 
             mocked_os.close.assert_called_once_with(4)
             assert mocked_stage.call_count == 0
+            assert mocked_writers.__isub__.call_count == 1
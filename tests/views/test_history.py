@@ -31,7 +31,6 @@ class TestHistory(object):
 
         mocked_first.return_value = "tomorrow"
         mocked_last.return_value = "tomorrow"
-        mocked_repo.get_commit_dates.return_value = ["/"]
         with patch("gitfs.views.history.lru_cache") as mocked_cache:
             mocked_cache.__call__ = lambda f: f
 
@@ -53,7 +52,7 @@ class TestHistory(object):
     def test_getattr_with_incorrect_path(self):
         mocked_repo = MagicMock()
 
-        mocked_repo.get_commit_dates.return_value = ["/path"]
+        mocked_repo.commits = ["/path"]
 
         with patch("gitfs.views.history.lru_cache") as mocked_cache:
             mocked_cache.__call__ = lambda f: f
@@ -75,7 +74,7 @@ class TestHistory(object):
 
     def test_access_with_date_and_valid_path(self):
         mocked_repo = MagicMock()
-        mocked_repo.get_commit_dates.return_value = ["tomorrow"]
+        mocked_repo.commits = ["tomorrow"]
 
         history = HistoryView(repo=mocked_repo)
         history.date = "now"
@@ -85,7 +84,7 @@ class TestHistory(object):
 
     def test_access_with_date_and_invalid_path(self):
         mocked_repo = MagicMock()
-        mocked_repo.get_commits_by_date.return_value = ["tomorrow"]
+        mocked_repo.commits.has_commit.return_value = False
 
         history = HistoryView(repo=mocked_repo)
         history.date = "now"
@@ -93,7 +92,7 @@ class TestHistory(object):
         with pytest.raises(FuseOSError):
             history.access("/non", "mode")
 
-        mocked_repo.get_commits_by_date.assert_called_once_with("now")
+        mocked_repo.commits.has_commit.assert_called_once_with("now", "non")
 
     def test_readdir_without_date(self):
         mocked_repo = MagicMock()
@@ -129,10 +128,9 @@ class TestHistory(object):
 
     def test_get_commit_time_with_valid_date(self):
         mocked_repo = MagicMock()
-        mocked_commit = MagicMock()
 
-        mocked_commit.timestamp = 0
-        mocked_repo.commits = {"now": [mocked_commit]}
+        mocked_repo.commits.__contains__.return_value = True
+        mocked_repo.commits.get_timestamps.return_value = [0]
 
         with patch("gitfs.views.history.time") as mocked_time:
             mocked_time.time.return_value = "1"
@@ -144,10 +142,8 @@ class TestHistory(object):
 
     def test_get_commit_time_with_invalid_date(self):
         mocked_repo = MagicMock()
-        mocked_commit = MagicMock()
 
-        mocked_commit.timestamp = 1
-        mocked_repo.commits = {"now": [mocked_commit]}
+        mocked_repo.commits.__contains__.return_value = False
 
         with patch("gitfs.views.history.time") as mocked_time:
             mocked_time.time.return_value = "1"
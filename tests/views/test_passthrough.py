@@ -16,6 +16,7 @@
 from io import TextIOWrapper
 from mock import MagicMock, patch, call
 import os
+from stat import S_IFDIR, S_IFLNK, S_IFREG
 
 from fuse import FuseOSError
 from six.moves import builtins
@@ -139,20 +140,65 @@ class TestPassthrough(object):
             assert result == dict((key, getattr(mock_result, key)) for key in stats)
 
     def test_readdir(self):
+        one_dir = MagicMock(**{"is_symlink.return_value": False})
+        one_dir.name = "one_dir"
+        one_file = MagicMock(
+            **{"is_symlink.return_value": False, "is_dir.return_value": False}
+        )
+        one_file.name = "one_file"
+        one_link = MagicMock(**{"is_symlink.return_value": True})
+        one_link.name = "one_link"
+        git = MagicMock()
+        git.name = ".git"
+
         mocked_os = MagicMock()
         mocked_os.path.join = os.path.join
         mocked_os.path.is_dir.return_value = True
-        mocked_os.listdir.return_value = ["one_dir", "one_file", ".git"]
+        mocked_os.scandir.return_value.__iter__.return_value = iter(
+            [one_dir, one_file, one_link, git]
+        )
 
         with patch.multiple("gitfs.views.passthrough", os=mocked_os):
             view = PassthroughView(repo=self.repo, repo_path=self.repo_path)
             result = view.readdir("/magic/path", 0)
             dirents = [directory for directory in result]
 
-            assert dirents == [".", "..", "one_dir", "one_file"]
+            assert dirents == [
+                ".",
+                "..",
+                ("one_dir", {"st_mode": S_IFDIR}, 0),
+                ("one_file", {"st_mode": S_IFREG}, 0),
+                ("one_link", {"st_mode": S_IFLNK}, 0),
+            ]
             path = "/the/root/path/magic/path"
             mocked_os.path.isdir.assert_called_once_with(path)
-            mocked_os.listdir.assert_called_once_with(path)
+            mocked_os.scandir.assert_called_once_with(path)
+            one_dir.is_dir.assert_called_once_with(follow_symlinks=False)
+            assert one_dir.stat.call_count == 0
+            assert mocked_os.scandir.return_value.close.call_count == 1
+
+    def test_readdir_without_scandir(self):
+        mocked_os = MagicMock()
+        mocked_os.path.join = os.path.join
+        mocked_os.listdir.return_value = ["one_dir", ".git", "gone", "one_link"]
+        mocked_os.lstat.side_effect = [
+            MagicMock(st_mode=S_IFDIR | 0o755),
+            OSError,
+            MagicMock(st_mode=S_IFLNK | 0o777),
+        ]
+        del mocked_os.scandir
+
+        with patch.multiple("gitfs.views.passthrough", os=mocked_os):
+            view = PassthroughView(repo=self.repo, repo_path=self.repo_path)
+            dirents = list(view.readdir("/magic/path", 0))
+
+        assert dirents == [
+            ".",
+            "..",
+            ("one_dir", {"st_mode": S_IFDIR}, 0),
+            ("one_link", {"st_mode": S_IFLNK}, 0),
+        ]
+        assert mocked_os.lstat.call_count == 3
 
     def test_readlink_with_slash(self):
         mocked_os = MagicMock()
@@ -31,3 +31,6 @@ class TestView(object):
             "st_mtime": "now",
         }
         assert simple_view.getattr("/fake/test/path") == asserted_getattr
+
+    def test_keeps_cache(self):
+        assert SimpleView().keeps_cache("/path") is False
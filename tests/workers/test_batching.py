@@ -0,0 +1,101 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from mock import patch
+
+from gitfs.worker.batching import CommitPolicy
+from gitfs.worker.commit_queue import CommitQueue
+
+
+def get_job(started=None):
+    return {"params": {"add": ["a"], "remove": [], "size": 0}, "started": started}
+
+
+class TestCommitPolicy(object):
+    def test_no_limits(self):
+        queue = CommitQueue()
+        queue.commit(message="message", add="a", size=1024)
+
+        policy = CommitPolicy()
+        assert not policy.due(queue)
+        assert policy.timeout(5, queue) == 5
+
+    def test_nothing_pending(self):
+        policy = CommitPolicy(max_latency=5, max_paths=1)
+        assert not policy.due(CommitQueue())
+        assert policy.timeout(10, CommitQueue()) == 10
+
+    def test_max_latency(self):
+        queue = CommitQueue()
+        policy = CommitPolicy(max_latency=5)
+
+        with patch("gitfs.worker.batching.time") as mocked_time:
+            mocked_time.time.return_value = 102
+            queue.started = 100
+
+            assert not policy.due(queue)
+            assert policy.timeout(10, queue) == 3
+            assert policy.timeout(1, queue) == 1
+
+            mocked_time.time.return_value = 105
+            assert policy.due(queue)
+            assert policy.timeout(10, queue) == 0
+
+    def test_max_paths(self):
+        queue = CommitQueue()
+        policy = CommitPolicy(max_paths=2)
+
+        queue.commit(message="message", add="a")
+        queue.commit(message="message", add="a", remove="a")
+        assert not policy.due(queue)
+
+        queue.commit(message="message", remove="b")
+        assert policy.due(queue)
+
+    def test_max_bytes(self):
+        queue = CommitQueue()
+        policy = CommitPolicy(max_bytes=10)
+
+        queue.commit(message="message", add="a", size=6)
+        queue.commit(message="message", add="a", size=8)
+        assert not policy.due(queue)
+
+        queue.commit(message="message", add="b", size=2)
+        assert policy.due(queue)
+
+    def test_a_full_queue_is_always_due(self):
+        queue = CommitQueue(max_paths=2)
+        policy = CommitPolicy()
+
+        queue.commit(message="message", add="a")
+        assert not policy.due(queue)
+
+        queue.commit(message="message", add="b")
+        assert policy.due(queue)
+
+    def test_committed(self):
+        policy = CommitPolicy(max_paths=1)
+
+        with patch("gitfs.worker.batching.time") as mocked_time:
+            policy.add(get_job(100))
+            policy.add(get_job(101))
+            mocked_time.time.return_value = 104
+            policy.committed(3)
+
+            policy.add(get_job())
+            mocked_time.time.return_value = 105
+            policy.committed(1)
+
+        assert policy.batch_info() == (2, 4, 1, 1, 4)
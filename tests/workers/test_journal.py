@@ -0,0 +1,90 @@
+# Copyright 2014-2016 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from mock import patch
+
+from gitfs.worker.journal import CommitJournal
+
+
+class TestCommitJournal(object):
+    def test_append_and_load(self, tmpdir):
+        path = str(tmpdir.join("journal"))
+
+        journal = CommitJournal(path)
+        journal.open("/workdir")
+        journal.sync(journal.append("a", 3))
+        journal.sync(journal.append("b", None))
+        journal.sync(journal.append("a", 5))
+        journal.close()
+
+        workdir, records = CommitJournal(path).load()
+
+        assert workdir == "/workdir"
+        assert list(records.items()) == [("b", None), ("a", 5)]
+
+    def test_load_a_missing_journal(self, tmpdir):
+        journal = CommitJournal(str(tmpdir.join("journal")))
+
+        assert journal.load() == (None, {})
+
+    def test_load_ignores_an_invalid_journal(self, tmpdir):
+        tmpdir.join("journal").write("garbage\n")
+        journal = CommitJournal(str(tmpdir.join("journal")))
+
+        with patch("gitfs.worker.journal.log") as mocked_log:
+            assert journal.load() == (None, {})
+
+        assert mocked_log.warning.call_count == 1
+
+    def test_load_skips_a_torn_record(self, tmpdir):
+        path = str(tmpdir.join("journal"))
+
+        journal = CommitJournal(path)
+        journal.open("/workdir", [("a", 1)])
+        journal.file.write('["b", 2')
+        journal.close()
+
+        _, records = CommitJournal(path).load()
+
+        assert list(records.items()) == [("a", 1)]
+
+    def test_rewrite(self, tmpdir):
+        path = str(tmpdir.join("journal"))
+
+        journal = CommitJournal(path)
+        journal.open("/workdir", [("a", 1)])
+        journal.append("b", 2)
+        journal.rewrite([("c", None)])
+        journal.sync(journal.append("d", 4))
+        journal.close()
+
+        _, records = CommitJournal(path).load()
+
+        assert list(records.items()) == [("c", None), ("d", 4)]
+        assert not tmpdir.join("journal.partial").check()
+
+    def test_sync_is_shared_by_the_pending_appends(self, tmpdir):
+        journal = CommitJournal(str(tmpdir.join("journal")))
+        journal.open("/workdir")
+
+        first = journal.append("a", 1)
+        second = journal.append("b", 2)
+
+        with patch("gitfs.worker.journal.os.fsync") as mocked_fsync:
+            journal.sync(second)
+            journal.sync(first)
+
+        assert mocked_fsync.call_count == 1
+        journal.close()
@@ -13,10 +13,13 @@
 # limitations under the License.
 
 
+from collections import OrderedDict
+
 import pytest
-from mock import patch, MagicMock
+from mock import ANY, MagicMock, call, patch
+from six.moves.queue import Empty
 
-from gitfs.worker.commit_queue import BaseQueue, CommitQueue
+from gitfs.worker.commit_queue import BaseQueue, CommitQueue, describe
 
 
 class TestBaseQueue(object):
@@ -40,14 +43,14 @@ class TestBaseQueue(object):
 
 class TestCommitQueue(object):
     def test_add(self):
-        mocked_queue = MagicMock()
-
         queue = CommitQueue()
-        queue.queue = mocked_queue
-
-        queue.add("job")
+        queue.add({"params": {"add": ["a"], "message": "message", "size": 3}})
 
-        mocked_queue.put.assert_called_once_with("job")
+        assert queue.get(block=False) == {
+            "type": "commit",
+            "params": {"add": ["a"], "message": "message", "remove": [], "size": 3},
+            "started": ANY,
+        }
 
     def test_to_list(self):
         queue = CommitQueue()
@@ -66,16 +69,178 @@ class TestCommitQueue(object):
             queue.commit(message="message")
 
     def test_commit(self):
-        mocked_queue = MagicMock()
+        queue = CommitQueue()
+        queue.commit(message="message", add="add", remove="remove", size=3)
+
+        assert queue.pending_paths == 2
+        assert queue.pending_bytes == 3
+        assert queue.get(block=True, timeout=1) == {
+            "type": "commit",
+            "params": {
+                "add": ["add"],
+                "message": "message",
+                "remove": ["remove"],
+                "size": 3,
+            },
+            "started": ANY,
+        }
+        assert queue.pending_paths == 0
+        assert queue.pending_bytes == 0
+        assert queue.started is None
+
+    def test_commit_coalesces_paths(self):
+        queue = CommitQueue()
+        for _ in range(1000):
+            queue.commit(message="Update /a", add="/a", size=10)
+        queue.commit(message="Update /b", add="/b", size=5)
+        queue.commit(message="Delete /b", remove="/b")
+        queue.commit(message="Delete /c", remove="/c")
+        queue.commit(message="Create /c", add="/c", size=1)
+
+        assert queue.pending_paths == 3
+        assert queue.pending_bytes == 11
+
+        job = queue.get(block=False)
+        assert sorted(job["params"]["add"]) == ["/a", "/c"]
+        assert job["params"]["remove"] == ["/b"]
+        assert job["params"]["size"] == 11
+        assert job["params"]["message"] == describe(3, 2, 1)
+
+    def test_started(self):
+        queue = CommitQueue()
+        assert queue.started is None
+
+        with patch("gitfs.worker.commit_queue.time") as mocked_time:
+            mocked_time.time.return_value = 1
+            queue.commit(message="message", add="a")
+            mocked_time.time.return_value = 2
+            queue.commit(message="message", add="b")
+
+        assert queue.started == 1
+        assert queue.get(block=False)["started"] == 1
+        assert queue.started is None
+
+    def test_full(self):
+        queue = CommitQueue(max_paths=2)
+        queue.commit(message="message", add="a")
+        queue.commit(message="message", add="a")
+        assert not queue.full
 
+        queue.commit(message="message", remove="b")
+        assert queue.full
+        assert not CommitQueue(max_paths=0).full
+
+    def test_wait(self):
         queue = CommitQueue()
-        queue.queue = mocked_queue
+        assert queue.wait(0.01) is False
+
+        queue.commit(message="message", add="a")
+        queue.commit(message="message", add="a")
+        assert queue.wait(0.01) is True
+        assert queue.wait(0.01) is False
+        assert queue.pending_paths == 1
 
-        queue.commit(message="message", add="add", remove="remove")
+    def test_get_from_an_empty_queue(self):
+        queue = CommitQueue()
 
-        mocked_queue.put.assert_called_once_with(
-            {
-                "type": "commit",
-                "params": {"add": ["add"], "message": "message", "remove": ["remove"]},
-            }
-        )
+        with pytest.raises(Empty):
+            queue.get(block=False)
+        with pytest.raises(Empty):
+            queue.get(block=True, timeout=0.01)
+
+    def test_describe(self):
+        assert describe(3, 2, 1) == "Update 3 items. Added 2 items. Removed 1 items."
+        assert describe(1, 0, 1) == "Update 1 items. Removed 1 items."
+
+    def test_commit_with_a_journal(self):
+        mocked_journal = MagicMock()
+        mocked_journal.append.side_effect = [1, 2]
+
+        queue = CommitQueue(journal=mocked_journal)
+        queue.commit(message="message", add="add", remove="remove", size=3)
+
+        assert mocked_journal.append.call_args_list == [
+            call("remove", None),
+            call("add", 3),
+        ]
+        mocked_journal.sync.assert_called_once_with(2)
+
+    def test_restore(self, tmpdir):
+        mocked_journal = MagicMock()
+        mocked_repo = MagicMock()
+        records = OrderedDict([("a", 3), ("b", None)])
+
+        mocked_journal.load.return_value = (str(tmpdir), records)
+        mocked_repo._repo.workdir = "/new"
+
+        queue = CommitQueue(journal=mocked_journal)
+        queue.restore(mocked_repo)
+
+        mocked_repo.restore_paths.assert_called_once_with(str(tmpdir), records)
+        mocked_journal.open.assert_called_once_with("/new", ANY)
+        assert list(mocked_journal.open.call_args[0][1]) == [("a", 3), ("b", None)]
+        assert mocked_journal.append.call_count == 0
+        assert queue.get(block=False)["params"] == {
+            "add": ["a"],
+            "message": "Restore 2 items",
+            "remove": ["b"],
+            "size": 3,
+        }
+
+    def test_restore_without_the_old_working_tree(self, tmpdir):
+        mocked_journal = MagicMock()
+        mocked_repo = MagicMock()
+        records = OrderedDict([("a", None), ("b", 8)])
+
+        mocked_journal.load.return_value = (str(tmpdir.join("gone")), records)
+        mocked_repo._repo.workdir = "/new"
+
+        queue = CommitQueue(journal=mocked_journal)
+        queue.restore(mocked_repo)
+
+        assert mocked_repo.restore_paths.call_count == 0
+        assert list(mocked_journal.open.call_args[0][1]) == []
+        with pytest.raises(Empty):
+            queue.get(block=False)
+
+    def test_close(self):
+        mocked_journal = MagicMock()
+
+        queue = CommitQueue(journal=mocked_journal)
+        queue.commit(message="message", add="a", size=1)
+        queue.close()
+
+        assert list(mocked_journal.rewrite.call_args[0][0]) == [("a", 1)]
+        assert mocked_journal.close.call_count == 1
+
+    def test_compact(self):
+        mocked_journal = MagicMock()
+
+        queue = CommitQueue(journal=mocked_journal)
+        queue.commit(message="message", add="a", size=1)
+        queue.get(block=False)
+        queue.commit(message="message", add="b", size=2)
+        queue.compact()
+
+        assert list(mocked_journal.rewrite.call_args[0][0]) == [("b", 2)]
+
+    def test_expect(self):
+        mocked_journal = MagicMock()
+        mocked_journal.append.side_effect = [1, 2, 3, 4]
+
+        queue = CommitQueue(journal=mocked_journal)
+        queue.expect("a", 1)
+        queue.expect("b", 2)
+        queue.expect("c", 3)
+        queue.commit(message="message", add="a", size=4)
+        queue.settle("b")
+        queue.compact()
+
+        assert mocked_journal.sync.call_args_list == [
+            call(1),
+            call(2),
+            call(3),
+            call(4),
+        ]
+        assert list(mocked_journal.rewrite.call_args[0][0]) == [("a", 4), ("c", 3)]
+        assert queue.get(block=False)["params"]["add"] == ["a"]
@@ -15,18 +15,19 @@ from _pygit2 import GitError
 
 from mock import MagicMock, patch, call
 from six.moves.queue import Empty
-import pygit2
 import pytest
 
+from gitfs.worker.batching import CommitPolicy
+from gitfs.worker.commit_queue import CommitQueue
 from gitfs.worker.sync import SyncWorker
 
 
 class TestSyncWorker(object):
     def test_work(self):
-        mocked_queue = MagicMock()
+        mocked_queue = MagicMock(started=None)
         mocked_idle = MagicMock(side_effect=ValueError)
 
-        mocked_queue.get.side_effect = Empty()
+        mocked_queue.wait.return_value = False
 
         worker = SyncWorker(
             "name",
@@ -43,9 +44,138 @@ class TestSyncWorker(object):
         with pytest.raises(ValueError):
             worker.work()
 
-        mocked_queue.get.assert_called_once_with(timeout=1, block=True)
+        mocked_queue.wait.assert_called_once_with(1)
+        assert mocked_queue.get.call_count == 0
         assert mocked_idle.call_count == 1
 
+    def test_work_leaves_the_changes_queued_until_due(self):
+        queue = CommitQueue()
+        mocked_commit = MagicMock()
+        mocked_idle = MagicMock(side_effect=ValueError)
+
+        for _ in range(1000):
+            queue.commit(message="Update /a", add="/a", size=1)
+
+        worker = SyncWorker(
+            "name",
+            "email",
+            "name",
+            "email",
+            strategy="strategy",
+            policy=CommitPolicy(max_paths=2),
+            commit_queue=queue,
+        )
+        worker.commit = mocked_commit
+        worker.on_idle = mocked_idle
+        worker.timeout = 0.01
+        worker.min_idle_times = 1
+
+        with pytest.raises(ValueError):
+            worker.work()
+
+        assert mocked_commit.call_count == 0
+        assert worker.commits == []
+        assert queue.pending_paths == 1
+
+    def test_work_flushes_when_shutting_down(self):
+        mocked_flush = MagicMock()
+
+        worker = SyncWorker(
+            "name", "email", "name", "email", strategy="strategy", commit_queue=None
+        )
+        worker.flush = mocked_flush
+
+        with patch("gitfs.worker.sync.shutting_down") as mocked_shutting_down:
+            mocked_shutting_down.is_set.return_value = True
+            worker.work()
+
+        assert mocked_flush.call_count == 1
+
+    def test_flush(self):
+        mocked_queue = MagicMock()
+        mocked_commit = MagicMock()
+        mocked_sync = MagicMock(return_value=True)
+        job = {"type": "commit", "params": {"add": ["a"], "remove": []}}
+
+        mocked_queue.get.side_effect = [job, Empty()]
+
+        worker = SyncWorker(
+            "name",
+            "email",
+            "name",
+            "email",
+            strategy="strategy",
+            commit_queue=mocked_queue,
+        )
+        worker.commit = mocked_commit
+        worker.sync = mocked_sync
+        worker.flush()
+
+        mocked_commit.assert_called_once_with([job])
+        assert mocked_sync.call_count == 1
+        assert worker.commits == []
+
+    def test_work_commits_a_due_batch(self):
+        mocked_queue = MagicMock()
+        mocked_policy = MagicMock()
+        mocked_commit = MagicMock(side_effect=ValueError)
+        job = {"type": "commit", "params": {"add": ["a"], "remove": []}}
+
+        mocked_queue.wait.return_value = True
+        mocked_queue.get.side_effect = [job, Empty()]
+        mocked_policy.timeout.return_value = 0.5
+        mocked_policy.due.return_value = True
+
+        worker = SyncWorker(
+            "name",
+            "email",
+            "name",
+            "email",
+            strategy="strategy",
+            policy=mocked_policy,
+            commit_queue=mocked_queue,
+        )
+        worker.commit = mocked_commit
+        worker.timeout = 1
+
+        with pytest.raises(ValueError):
+            worker.work()
+
+        mocked_queue.wait.assert_called_once_with(0.5)
+        mocked_policy.timeout.assert_called_once_with(1, mocked_queue)
+        mocked_policy.due.assert_called_with(mocked_queue)
+        mocked_policy.add.assert_called_once_with(job)
+        mocked_commit.assert_called_once_with([job])
+
+    def test_work_commits_a_batch_when_its_latency_expires(self):
+        mocked_queue = MagicMock()
+        mocked_policy = MagicMock()
+        mocked_idle = MagicMock()
+        mocked_commit = MagicMock(side_effect=ValueError)
+
+        mocked_queue.wait.return_value = False
+        mocked_queue.get.side_effect = [{"type": "commit"}, Empty()]
+        mocked_policy.due.return_value = True
+
+        worker = SyncWorker(
+            "name",
+            "email",
+            "name",
+            "email",
+            strategy="strategy",
+            policy=mocked_policy,
+            commit_queue=mocked_queue,
+        )
+        worker.commit = mocked_commit
+        worker.on_idle = mocked_idle
+        worker.timeout = 1
+
+        with pytest.raises(ValueError):
+            worker.work()
+
+        mocked_commit.assert_called_once_with([{"type": "commit"}])
+        assert mocked_idle.call_count == 0
+
     def test_on_idle_with_commits_and_merges(self):
         mocked_sync = MagicMock()
         mocked_syncing = MagicMock()
@@ -56,15 +186,22 @@ class TestSyncWorker(object):
         with patch.multiple(
             "gitfs.worker.sync", syncing=mocked_syncing, writers=MagicMock(value=0)
         ):
-            worker = SyncWorker("name", "email", "name", "email", strategy="strategy")
-            worker.commits = "commits"
+            worker = SyncWorker(
+                "name",
+                "email",
+                "name",
+                "email",
+                strategy="strategy",
+                commit_queue=MagicMock(get=MagicMock(side_effect=Empty)),
+            )
+            worker.commits = ["commit"]
             worker.commit = mocked_commit
             worker.sync = mocked_sync
 
             commits = worker.on_idle()
 
-            mocked_commit.assert_called_once_with("commits")
-            assert mocked_syncing.set.call_count == 1
+            mocked_commit.assert_called_once_with(["commit"])
+            assert mocked_syncing.set.call_count == 0
             assert mocked_sync.call_count == 1
             assert commits is None
 
@@ -110,6 +247,7 @@ class TestSyncWorker(object):
             syncing=mocked_syncing,
             push_successful=mocked_push_successful,
             fetch=mocked_fetch,
+            writers=MagicMock(value=0),
         ):
             worker = SyncWorker(
                 "name",
@@ -121,11 +259,13 @@ class TestSyncWorker(object):
                 credentials=credentials,
                 upstream=upstream,
                 branch=branch,
+                commit_queue=MagicMock(get=MagicMock(side_effect=Empty)),
             )
             worker.merge = mocked_merge
 
             worker.sync()
 
+            assert mocked_syncing.set.call_count == 1
             assert mocked_syncing.clear.call_count == 1
             assert mocked_push_successful.clear.call_count == 1
             assert mocked_sync_done.clear.call_count == 1
@@ -157,6 +297,7 @@ class TestSyncWorker(object):
             syncing=mocked_syncing,
             push_successful=mocked_push_successful,
             fetch=mocked_fetch,
+            writers=MagicMock(value=0),
         ):
             worker = SyncWorker(
                 "name",
@@ -168,16 +309,17 @@ class TestSyncWorker(object):
                 credentials=credentials,
                 upstream=upstream,
                 branch=branch,
+                commit_queue=MagicMock(get=MagicMock(side_effect=Empty)),
             )
             worker.merge = mocked_merge
 
             while not worker.sync():
                 pass
 
-            assert mocked_syncing.clear.call_count == 1
+            assert mocked_syncing.clear.call_count == 2
             assert mocked_push_successful.clear.call_count == 1
             assert mocked_sync_done.clear.call_count == 2
-            assert mocked_sync_done.set.call_count == 1
+            assert mocked_sync_done.set.call_count == 2
             assert mocked_fetch.set.call_count == 1
             assert mocked_push_successful.set.call_count == 1
             assert mocked_repo.behind is False
@@ -192,6 +334,7 @@ class TestSyncWorker(object):
 
     def test_commit_with_just_one_job(self):
         mocked_repo = MagicMock()
+        mocked_queue = MagicMock()
 
         message = "just a simple message"
         jobs = [{"params": {"message": message}}]
@@ -204,14 +347,38 @@ class TestSyncWorker(object):
             author[1],
             strategy="strategy",
             repository=mocked_repo,
+            commit_queue=mocked_queue,
         )
+        mocked_repo.stage.return_value = set(["path"])
+        mocked_repo.reconcile_paths.return_value = []
         worker.commit(jobs)
 
         mocked_repo.commit.assert_called_once_with(message, author, author)
         assert mocked_repo.commits.update.call_count == 1
+        assert worker.policy.batch_info().last_paths == 1
+
+        mocked_repo.reconcile_paths.assert_called_once_with(set(["path"]))
+        assert mocked_repo.checkout_head.call_count == 0
+        assert worker.avoided_checkouts == 1
+        assert mocked_queue.compact.call_count == 1
+
+    def test_commit_with_nothing_staged(self):
+        mocked_repo = MagicMock()
+        mocked_repo.stage.return_value = set()
+        mocked_repo.head.target = "old_head"
+        mocked_repo.reconcile_paths.return_value = []
+
+        worker = SyncWorker(
+            "name", "email", "name", "email", strategy="strategy", branch="master"
+        )
+        worker.repository = mocked_repo
+        worker.commit_queue = MagicMock()
+        worker.commit([{"params": {"message": "message"}}])
 
-        strategy = pygit2.GIT_CHECKOUT_FORCE
-        mocked_repo.checkout_head.assert_called_once_with(strategy=strategy)
+        assert mocked_repo.commit.call_count == 0
+        mocked_repo.create_reference.assert_called_once_with(
+            "refs/heads/master", "old_head", force=True
+        )
 
     def test_commit_with_more_than_one_job(self):
         mocked_repo = MagicMock()
@@ -230,22 +397,25 @@ class TestSyncWorker(object):
             author[1],
             strategy="strategy",
             repository=mocked_repo,
+            commit_queue=MagicMock(),
         )
+        mocked_repo.stage.return_value = set(["path1"])
+        mocked_repo.reconcile_paths.return_value = ["path1"]
         worker.commit(jobs)
 
         asserted_message = "Update 2 items. Added 2 items. Removed 1 items."
         mocked_repo.commit.assert_called_once_with(asserted_message, author, author)
         assert mocked_repo.commits.update.call_count == 1
 
-        strategy = pygit2.GIT_CHECKOUT_FORCE
-        mocked_repo.checkout_head.assert_called_once_with(strategy=strategy)
+        mocked_repo.reconcile_paths.assert_called_once_with(set(["path1"]))
+        assert worker.avoided_checkouts == 0
 
     def test_switch_to_idle_mode(self):
-        mocked_queue = MagicMock()
+        mocked_queue = MagicMock(started=None)
         mocked_idle = MagicMock(side_effect=ValueError)
         mocked_idle_event = MagicMock()
 
-        mocked_queue.get.side_effect = Empty()
+        mocked_queue.wait.return_value = False
 
         with patch.multiple("gitfs.worker.sync", idle=mocked_idle_event):
             worker = SyncWorker(
@@ -263,6 +433,6 @@ class TestSyncWorker(object):
             with pytest.raises(ValueError):
                 worker.work()
 
-            mocked_queue.get.assert_called_once_with(timeout=1, block=True)
+            mocked_queue.wait.assert_called_once_with(1)
             assert mocked_idle_event.set.call_count == 1
             assert mocked_idle.call_count == 1